@@ -0,0 +1,75 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+This script benchmarks decoding JSON responses holding alerts, comparing:
+* plain `json.loads`, not decoding timestamps (the lower bound)
+* trying to decode each value as timestamp (how the SDK worked before values
+  were filtered first)
+* the current `GraphQLJSONDecoder`, only trying values which look like
+  timestamps
+* the current `GraphQLJSONDecoder`, limited to the timestamp fields of alerts
+
+Responses are generated in-process, holding a connection of alerts with the
+given numbers of nodes; no API endpoint is needed.
+
+Usage:
+
+    $ PYTHONPATH="lib" python3 benchmarks/json_decoding.py [nodes ...]
+"""
+
+import json
+import sys
+import time
+
+from dcso.portal.util.graphql import GraphQLJSONDecoder
+from dcso.portal.util.standin import generate_connection
+from dcso.portal.util.temporal import decode_utc_iso8601
+
+REPEAT = 3
+
+
+class LegacyJSONDecoder(json.JSONDecoder):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs, object_hook=self.object_hook)
+
+    @staticmethod
+    def object_hook(o: dict) -> dict:
+        for k, v in o.items():
+            try:
+                o[k] = decode_utc_iso8601(v)
+            except ValueError:
+                pass
+        return o
+
+
+def run(body: str, **kwargs) -> float:
+    """Returns the fastest of `REPEAT` runs decoding `body`, in seconds."""
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        json.loads(body, **kwargs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+
+    for count in sizes:
+        body = json.dumps(generate_connection('tdh.alerts', count))
+        print(f"{count} nodes ({len(body) / 1024 / 1024:.1f} MiB JSON)")
+        results = {}
+        for label, kwargs in (("plain json.loads", {}),
+                              ("decode every value", {'cls': LegacyJSONDecoder}),
+                              ("filter values", {'cls': GraphQLJSONDecoder}),
+                              ("datetime_fields", {'cls': GraphQLJSONDecoder,
+                                                   'datetime_fields': {'occurredOn', 'updatedOn'}})):
+            results[label] = seconds = run(body, **kwargs)
+            print(f"  {label:20} {seconds:8.3f} s")
+        speedup = results["decode every value"] / results["filter values"]
+        print(f"  {'speedup':20} {speedup:8.1f} x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+This script benchmarks converting decoded GraphQL responses to namedtuples,
+comparing:
+* creating a new namedtuple class for each object (how the SDK worked before
+  namedtuple classes were cached)
+* the current conversion, reusing cached classes and converting without
+  recursion
+
+Responses are generated in-process, holding a connection of alerts with the
+given numbers of nodes; no API endpoint is needed.
+
+Usage:
+
+    $ PYTHONPATH="lib" python3 benchmarks/namedtuple_conversion.py [nodes ...]
+"""
+
+import gc
+import json
+import sys
+import time
+from collections import namedtuple
+
+from dcso.portal.util.graphql import GraphQLJSONDecoder, graphql_data_to_namedtuple
+from dcso.portal.util.standin import generate_connection
+
+
+def legacy_data_to_namedtuple(mapping: dict, name: str = 'data') -> namedtuple:
+    if isinstance(mapping, dict):
+        for key, value in mapping.items():
+            if isinstance(value, (list, tuple)):
+                for idx, p in enumerate(value):
+                    value[idx] = legacy_data_to_namedtuple(p, key)
+            else:
+                mapping[key] = legacy_data_to_namedtuple(value, key)
+        return namedtuple(name, field_names=mapping.keys())(*mapping.values())
+    return mapping
+
+
+def run(body: bytes, convert) -> dict:
+    # conversion changes the decoded data, so each run decodes it again
+    data = json.loads(body, cls=GraphQLJSONDecoder)['data']
+    # classes left by a previous run are garbage with reference cycles
+    gc.collect()
+
+    start = time.perf_counter()
+    result = convert(data)
+    elapsed = time.perf_counter() - start
+
+    classes = set()
+    for edge in result.tdh.alerts.edges:
+        classes.add(type(edge))
+        classes.add(type(edge.node))
+    return {
+        'seconds': elapsed,
+        'classes': len(classes),
+    }
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+
+    for count in sizes:
+        body = json.dumps(generate_connection('tdh.alerts', count)).encode('utf-8')
+        print(f"{count} nodes ({len(body) / 1024 / 1024:.1f} MiB JSON)")
+        results = {}
+        for label, convert in (("class per object", legacy_data_to_namedtuple),
+                               ("cached classes", graphql_data_to_namedtuple)):
+            results[label] = result = run(body, convert)
+            print(f"  {label:20} {result['seconds']:8.3f} s  ({result['classes']} classes for edges and nodes)")
+        speedup = results["class per object"]['seconds'] / results["cached classes"]['seconds']
+        print(f"  {'speedup':20} {speedup:8.1f} x")
+
+
+if __name__ == '__main__':
+    main()
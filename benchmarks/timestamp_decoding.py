@@ -0,0 +1,63 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+This script benchmarks decoding UTC timestamps, comparing:
+* `datetime.fromisoformat`, the least any decoder does for these timestamps
+  (the lower bound without memoization)
+* the current `decode_utc_iso8601`, memoizing decoded values
+
+Both are run over distinct timestamps, and over timestamps repeating as they
+do in responses holding many nodes of the same time frame. Timestamps are
+generated in-process; no API endpoint is needed.
+
+Usage:
+
+    $ PYTHONPATH="lib" python3 benchmarks/timestamp_decoding.py [count ...]
+"""
+
+import sys
+import time
+from datetime import datetime
+
+from dcso.portal.util import temporal
+
+REPEAT = 5
+DISTINCT_REPEATED = 50
+
+
+def reference(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def run(decode, values) -> float:
+    """Returns the fastest of `REPEAT` runs decoding `values`, in seconds,
+    starting each run without memoized timestamps."""
+    best = None
+    for _ in range(REPEAT):
+        temporal._decoded.clear()
+        start = time.perf_counter()
+        for value in values:
+            decode(value)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [2000, 100000]
+
+    for count in counts:
+        distinct = ['2021-02-08T{:02d}:{:02d}:{:02d}.{:06d}Z'.format(i // 3600 % 24, i // 60 % 60, i % 60, i % 1000000)
+                    for i in range(count)]
+        repeated = [distinct[i % DISTINCT_REPEATED] for i in range(count)]
+
+        print(f"{count} timestamps")
+        for label, values in (("distinct", distinct), ("repeated", repeated)):
+            fromisoformat = run(reference, values)
+            decoded = run(temporal.decode_utc_iso8601, values)
+            print(f"  {label:10} fromisoformat {fromisoformat:8.4f} s  decode_utc_iso8601 {decoded:8.4f} s"
+                  f"  ({fromisoformat / decoded:.1f} x)")
+
+
+if __name__ == '__main__':
+    main()
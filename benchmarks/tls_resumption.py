@@ -0,0 +1,74 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+This script benchmarks reconnect-heavy workloads against a DCSO Portal API
+endpoint (HTTPS), comparing:
+* a new SSL context and full TLS handshake for each connection (how the SDK
+  worked before connection pooling)
+* one shared SSL context resuming the TLS session of the previous connection
+
+Keep-alive is disabled for both cases (pool size 0) so that each request
+needs a new connection.
+
+Usage:
+
+    $ PYTHONPATH="lib" python3 benchmarks/tls_resumption.py https://api.example.com/graphql [requests]
+"""
+
+import sys
+import time
+
+from dcso.portal import PortalException
+from dcso.portal.util.connection import ConnectionPool
+from dcso.portal.util.graphql import GraphQLRequest
+
+_QUERY = '{__schema { queryType { name }}}'
+
+
+def run(url: str, count: int, shared: bool) -> dict:
+    pool = ConnectionPool(maxsize=0)
+    handshakes = 0
+    resumed = 0
+
+    start = time.perf_counter()
+    for _ in range(count):
+        if not shared:
+            pool = ConnectionPool(maxsize=0)
+        GraphQLRequest(query=_QUERY, api_url=url, transport=pool).execute_dict()
+        if not shared:
+            handshakes += pool.stats.tls_handshakes
+            resumed += pool.stats.tls_sessions_resumed
+    elapsed = time.perf_counter() - start
+
+    if shared:
+        handshakes = pool.stats.tls_handshakes
+        resumed = pool.stats.tls_sessions_resumed
+
+    return {
+        'mean_ms': elapsed / count * 1000,
+        'handshakes': handshakes,
+        'resumed': resumed,
+    }
+
+
+def main():
+    try:
+        url = sys.argv[1]
+    except IndexError:
+        print("first command line argument must be DCSO Portal API endpoint (HTTPS)")
+        sys.exit(1)
+
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    for label, shared in (("new context per connection", False), ("shared context, resumption", True)):
+        try:
+            result = run(url, count, shared)
+        except PortalException as exc:
+            print(str(exc))
+            sys.exit(1)
+        print(f"{label:30} {result['mean_ms']:8.2f} ms/request "
+              f"({result['handshakes']} handshakes, {result['resumed']} resumed)")
+
+
+if __name__ == '__main__':
+    main()
@@ -10,7 +10,6 @@ This script demonstrates:
 
 import os
 import sys
-import time
 
 from dcso.portal import APIClient, ENV_PORTAL_TOKEN, PortalConfiguration, PortalException
 
@@ -39,8 +38,8 @@ def main():
         sys.exit(1)
 
     q = """
-query ($cursor: Cursor) { 
-    alerts(first: 2 after: $cursor) {
+query ($first: Int, $cursor: Cursor) {
+    alerts(first: $first after: $cursor) {
         edges {
             node { id occurredOn }
         }
@@ -52,36 +51,18 @@ query ($cursor: Cursor) {
 }
 """
 
-    variables = {
-        'cursor': ''
-    }
-
-    have_more = True
-
-    while have_more:
-        try:
-            response = client.execute_graphql(query=q, variables=variables)
-        except PortalException as exc:
-            print(str(exc))
-            sys.exit(1)
-
-        try:
-            have_more = response.alerts.pageInfo.hasNextPage
-            variables['cursor'] = response.alerts.pageInfo.endCursor
-        except AttributeError as exc:
-            print(exc)
-            pass
-
-        if len(response.alerts) > 0:
-            for edge in response.alerts.edges:
-                print(f"{edge.node.id} {edge.node.occurredOn}")
-            if have_more:
-                print(f".. more available with cursor {variables['cursor']}")
-            time.sleep(2)
+    # next pages are fetched in the background while alerts are printed
+    count = 0
+    try:
+        for alert in client.paginate(query=q, connection_path='alerts', page_size=2):
+            print(f"{alert.id} {alert.occurredOn}")
+            count += 1
+    except PortalException as exc:
+        print(str(exc))
+        sys.exit(1)
 
-        if not have_more:
-            print("No alerts available. Stopping.")
-            break
+    if count == 0:
+        print("No alerts available.")
 
 
 if __name__ == '__main__':
@@ -46,3 +46,10 @@ __pdoc__ = {
 
 from .api import APIClient, ENV_PORTAL_TOKEN
 from .exceptions import *
+from .util.cache import ResponseCache
+from .util.checkpoint import Checkpoint
+from .util.loader import QueryLoader
+from .util.ratelimit import RateLimiter
+from .util.retry import RetryPolicy
+from .util.schema import SchemaCache
+from .util.timeout import Deadline, Timeout
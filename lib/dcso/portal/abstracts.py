@@ -8,6 +8,8 @@ from abc import ABCMeta, abstractmethod
 from collections import namedtuple
 from typing import List, Optional
 
+from .util.transport import Transport
+
 
 class APIAbstract(metaclass=ABCMeta):
     @property
@@ -30,6 +32,12 @@ class APIAbstract(metaclass=ABCMeta):
     def token(self, token: str) -> None:
         raise NotImplemented
 
+    @property
+    def transport(self) -> Optional[Transport]:
+        """Transport used for requests, or None when requests are sent using
+        `urllib`."""
+        return None
+
     @abstractmethod
     def execute_graphql(self, query: str,
                         variables: Optional[dict] = None,
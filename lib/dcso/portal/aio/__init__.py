@@ -0,0 +1,26 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+Asyncio support for interacting with the DCSO Portal API.
+
+`AsyncAPIClient` mirrors `dcso.portal.APIClient`, but communicates with the
+API using non-blocking connections. Methods doing requests are coroutines:
+
+    from dcso.portal.aio import AsyncAPIClient
+
+    async def main():
+        async with AsyncAPIClient(api_endpoint) as apic:
+            await apic.auth.authenticate(username='alice', password='tea.pots')
+            result = await apic.execute_graphql('{ tdh_allIssues { id reference } }')
+
+Many queries can be kept in flight concurrently, for example, using
+`asyncio.gather`. The number of requests sent at the same time is
+limited by the `max_in_flight` argument of the client.
+"""
+
+__pdoc__ = {
+    'test_api': False,
+}
+
+from .api import AsyncAPIClient
+from .auth import AsyncAuth
@@ -0,0 +1,184 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+Definition of the AsyncAPIClient class which is used to interact with
+the DCSO Portal API from asyncio applications.
+"""
+
+import os
+import ssl
+import urllib.parse
+from collections import namedtuple
+from typing import List, Optional, Union
+
+from ..api import ENV_PORTAL_TOKEN
+from ..exceptions import PortalAPIRequest, PortalException
+from ..util.connection import DEFAULT_POOL_IDLE_TIMEOUT, DEFAULT_POOL_MAXSIZE, create_ssl_context
+from ..util.networking import validate_api_url
+from ..util.ratelimit import RateLimiter
+from ..util.retry import RetryPolicy
+from ..util.timeout import Deadline, Timeout
+from ..util.transport import TransportStats
+from .auth import AsyncAuth
+from .connection import AsyncConnectionPool, DEFAULT_MAX_IN_FLIGHT
+from .graphql import AsyncGraphQLRequest
+
+
+class AsyncAPIClient:
+    """AsyncAPIClient mirrors `dcso.portal.APIClient`, but all methods
+    communicating with the API are coroutines:
+
+        async with AsyncAPIClient(api_endpoint) as apic:
+            result = await apic.execute_graphql('{ tdh_allIssues { id reference } }')
+
+    Requests are sent using non-blocking, kept-alive connections. At most
+    `max_in_flight` requests are in flight at the same time.
+    """
+
+    def __init__(self, api_url: str,
+                 pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+                 pool_idle_timeout: float = DEFAULT_POOL_IDLE_TIMEOUT,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                 ssl_context: Optional[ssl.SSLContext] = None,
+                 cafile: Optional[str] = None,
+                 decompress: bool = True,
+                 compress_min_size: Optional[int] = None,
+                 retry: Optional[RetryPolicy] = None,
+                 rate_limit: Optional[RateLimiter] = None,
+                 timeout: Union[Timeout, float, None] = None):
+        """
+        The `api_url` parameter is the DCSO Portal API endpoint and must be provided;
+        there is no default.
+
+        See `dcso.portal.APIClient` for the other arguments. The `max_in_flight` of
+        a `rate_limit` is ignored; use the `max_in_flight` argument instead.
+        """
+        self._api_url: str = ""
+        self.api_url = api_url
+        self._token: str = os.environ.get(ENV_PORTAL_TOKEN, "")
+
+        if ssl_context is None and cafile:
+            ssl_context = create_ssl_context(cafile=cafile)
+        self._transport: AsyncConnectionPool = AsyncConnectionPool(maxsize=pool_maxsize,
+                                                                   idle_timeout=pool_idle_timeout,
+                                                                   max_in_flight=max_in_flight,
+                                                                   ssl_context=ssl_context,
+                                                                   decompress=decompress,
+                                                                   compress_min_size=compress_min_size,
+                                                                   retry=retry or RetryPolicy(),
+                                                                   rate_limit=rate_limit,
+                                                                   timeout=Timeout.from_value(timeout))
+
+        # default services
+        self.auth = AsyncAuth(api=self)
+
+    async def __aenter__(self) -> 'AsyncAPIClient':
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Closes all connections kept alive by this client."""
+        await self._transport.close()
+
+    @property
+    def transport(self) -> AsyncConnectionPool:
+        """Connection pool used for all requests done through this client."""
+        return self._transport
+
+    @property
+    def stats(self) -> TransportStats:
+        """Counters about requests, connections, and bytes transferred by this client."""
+        return self._transport.stats
+
+    @property
+    def api_url(self) -> str:
+        return self._api_url
+
+    @api_url.setter
+    def api_url(self, url: str) -> None:
+        """Sets the API endpoint using the provided url. Raises `DCSOPortalConfiguration`
+        when url is not valid.
+        """
+        self._api_url = validate_api_url(url)
+
+    def api_url_parsed(self) -> urllib.parse.ParseResult:
+        return urllib.parse.urlparse(self._api_url)
+
+    @property
+    def token(self) -> str:
+        return self._token
+
+    @token.setter
+    def token(self, token: str):
+        """Sets the token for each API request. This can be either a User Token (JWT)
+        or a Machine Token (also known as API Token).
+        """
+        self._token = token
+
+    async def execute_graphql(self, query: str,
+                              variables: Optional[dict] = None,
+                              fragments: Optional[List[str]] = None,
+                              idempotent: Optional[bool] = None,
+                              timeout: Union[Timeout, float, None] = None,
+                              deadline: Optional[Deadline] = None) -> namedtuple:
+        """Executes the GraphQL query and returns response as namedtuple. This
+        namedtuple starts from the 'data'-object.
+
+        See `dcso.portal.APIClient.execute_graphql` about `idempotent`, `timeout`,
+        and `deadline`.
+
+        Raises `PortalAPIError` When the GraphQL API endpoint returned an error.
+        When there was an issue with the request itself, or decoding JSON failed,
+        the `PortalAPIRequest` exception is raised.
+        """
+        request = AsyncGraphQLRequest(api_url=self.api_url,
+                                      query=query, variables=variables, fragments=fragments,
+                                      token=self.token, transport=self.transport,
+                                      idempotent=idempotent, timeout=Timeout.from_value(timeout),
+                                      deadline=deadline)
+
+        try:
+            return await request.execute()
+        except PortalException:
+            raise
+
+    async def execute_graphql_dict(self, query: str,
+                                   variables: Optional[dict] = None,
+                                   fragments: Optional[List[str]] = None,
+                                   idempotent: Optional[bool] = None,
+                                   timeout: Union[Timeout, float, None] = None,
+                                   deadline: Optional[Deadline] = None) -> dict:
+        """Executes the GraphQL request and return response a dictionary.
+
+        Raises `PortalAPIError` When the GraphQL API endpoint returned an error.
+        When there was an issue with the request itself, or decoding JSON failed,
+        the `PortalAPIRequest` exception is raised.
+        """
+        request = AsyncGraphQLRequest(api_url=self.api_url,
+                                      query=query, variables=variables, fragments=fragments,
+                                      token=self.token, transport=self.transport,
+                                      idempotent=idempotent, timeout=Timeout.from_value(timeout),
+                                      deadline=deadline)
+
+        try:
+            return (await request.execute_dict())['data']
+        except KeyError as exc:
+            raise PortalAPIRequest(f"API request contained unusable error definition {exc}")
+        except PortalException:
+            raise
+
+    async def is_alive(self) -> bool:
+        """Returns whether it is possible to communicate with API endpoint."""
+        request = AsyncGraphQLRequest(
+            api_url=self.api_url,
+            query='{__schema { queryType { name }}}',
+            transport=self.transport
+        )
+
+        try:
+            result = await request.execute_dict()
+            return 'Query' == result['data']['__schema']['queryType']['name']
+        except (KeyError, PortalException):
+            return False
@@ -0,0 +1,134 @@
+# Copyright (c) 2021, DCSO GmbH
+
+from typing import Optional, Sequence
+
+from ..auth.auth import Authentication, _DEFAULT_TOKEN_RESOURCE, _GRAPHQL_MUTATION_AUTHN
+from ..auth.rbac import ServicePermissions, _GRAPHQL_QUERY_USER_SERVICE_PERMISSIONS
+from ..exceptions import PortalAPIResponse, PortalException
+from .graphql import AsyncGraphQLRequest
+
+
+class AsyncRBACMixin:
+    _api = None  # mixed in
+
+    async def user_service_permissions(self, user_id: Optional[str] = None,
+                                       services: Optional[Sequence[str]] = None) -> ServicePermissions:
+        """Retrieves permissions available to user with ID `user_id`. The result is an instance
+        of `ServicePermissions` which holds the user's permission for all or for selected services.
+
+        Raises `PortalAPIError` When the GraphQL API endpoint returned an error.
+        When there was an issue with the request itself, or decoding JSON failed,
+        the `PortalAPIRequest` exception is raised.
+        """
+        variables = {
+            "id": user_id,
+            "services": services
+        }
+
+        request = AsyncGraphQLRequest(api_url=self._api.api_url, token=self._api.token,
+                                      transport=self._api.transport,
+                                      query=_GRAPHQL_QUERY_USER_SERVICE_PERMISSIONS, variables=variables)
+
+        try:
+            response = await request.execute_dict()
+        except PortalException:
+            raise
+
+        try:
+            return ServicePermissions(graphql_response=response['data']['user'])
+        except PortalAPIResponse:
+            raise
+
+
+class AsyncAuth(AsyncRBACMixin):
+    """AsyncAuth is the asyncio counterpart of `dcso.portal.auth.Auth`.
+
+    Typical use:
+
+        apic = AsyncAPIClient('https://api.example.com/api')
+        user = await apic.auth.authenticate("alice", "alice.password")
+    """
+
+    @property
+    def token(self) -> str:
+        return self._api.token
+
+    @token.setter
+    def token(self, token: str) -> None:
+        self._api.token = token
+
+    def __init__(self, api):
+        self._api = api
+
+    async def authenticate(self, username: str, password: str, resource: str = _DEFAULT_TOKEN_RESOURCE,
+                           set_api_token: bool = True) -> Authentication:
+        """Authenticates with DCSO Portal using credentials or `username` and `password`.
+
+        See `dcso.portal.auth.Auth.authenticate`.
+        """
+        variables = {
+            "portalauth": {
+                "username": username,
+                "password": password,
+                "resource": resource
+            }
+        }
+
+        authn = await self._authorize(variables)
+        if not authn.token_is_temporary and set_api_token:
+            self._api.token = authn.token.token
+        return authn
+
+    async def second_authentication_totp(self, username: str, temp_token: str, totp: str,
+                                         set_api_token: bool = True,
+                                         resource: str = _DEFAULT_TOKEN_RESOURCE) -> Authentication:
+        """Two-factor authentication using Time-based One-Time Password (TOTP).
+
+        See `dcso.portal.auth.Auth.second_authentication_totp`.
+        """
+        variables = {
+            "portalauth": {
+                "username": username,
+                "temporaryToken": temp_token,
+                "otpCode": totp,
+                "resource": resource,
+            }
+        }
+
+        authn = await self._authorize(variables)
+        if set_api_token:
+            self._api.token = authn.token.token
+        return authn
+
+    async def refresh_jwt_token(self, username: str, token: str, resource: str = _DEFAULT_TOKEN_RESOURCE,
+                                set_api_token: bool = True) -> Authentication:
+        """Refreshes a User Token (JWT) with DCSO Portal.
+
+        See `dcso.portal.auth.Auth.refresh_jwt_token`.
+        """
+        variables = {
+            "portalauth": {
+                "username": username,
+                "refreshToken": token,
+                "resource": resource,
+            }
+        }
+
+        authn = await self._authorize(variables)
+        if set_api_token:
+            self._api.token = authn.token.token
+        return authn
+
+    async def _authorize(self, variables: dict) -> Authentication:
+        request = AsyncGraphQLRequest(api_url=self._api.api_url, transport=self._api.transport,
+                                      query=_GRAPHQL_MUTATION_AUTHN, variables=variables)
+
+        try:
+            response = await request.execute_dict()
+        except PortalException:
+            raise
+
+        try:
+            return Authentication(graphql_response=response['data']['portalauth'])
+        except PortalAPIResponse:
+            raise
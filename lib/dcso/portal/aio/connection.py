@@ -0,0 +1,394 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+Non-blocking HTTP/1.1 transport, written on asyncio streams, used by
+`dcso.portal.aio.AsyncAPIClient`.
+"""
+
+import asyncio
+import http.client
+import ssl
+import time
+from collections import deque
+from email.parser import BytesParser
+from typing import Dict, Optional, Union
+from urllib.parse import ParseResult, urlparse
+
+from ..exceptions import PortalAPIRequest, PortalTimeout
+from ..util.compression import ACCEPT_ENCODING, decompressor_for, gzip_body, rejects_gzip_body
+from ..util.connection import (DEFAULT_POOL_IDLE_TIMEOUT, DEFAULT_POOL_MAXSIZE, _pool_key, create_ssl_context,
+                               request_target)
+from ..util.ratelimit import RateLimiter
+from ..util.retry import RetryPolicy, parse_retry_after
+from ..util.timeout import Deadline, Timeout
+from ..util.transport import TransportStats
+
+DEFAULT_MAX_IN_FLIGHT = 100
+"""Default maximum of requests which are in flight at the same time."""
+
+_MAX_HEADER_SIZE = 65536
+
+# exceptions indicating that a kept-alive connection was closed by the peer
+_STALE_CONNECTION_ERRORS = (asyncio.IncompleteReadError, BrokenPipeError,
+                            ConnectionResetError, ConnectionAbortedError)
+
+
+class AsyncResponse:
+    """Response of a request done through an `AsyncConnectionPool`.
+
+    The body has already been read completely when the response is returned.
+    """
+
+    def __init__(self, status: int, reason: str, headers: http.client.HTTPMessage, body: bytes):
+        self.status: int = status
+        self.reason: str = reason
+        self.headers: http.client.HTTPMessage = headers
+        self.body: bytes = body
+
+
+class _AsyncConnection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader: asyncio.StreamReader = reader
+        self.writer: asyncio.StreamWriter = writer
+        self.last_used: float = time.monotonic()
+        # whether the current request was written completely
+        self.sent: bool = False
+
+    def close(self) -> None:
+        self.writer.close()
+
+    async def request(self, method: str, url: ParseResult, body: Optional[bytes],
+                      headers: dict) -> (AsyncResponse, bool):
+        """Sends the request and reads the response. Returns the response and
+        whether the connection can be reused."""
+        self.sent = False
+        lines = [f"{method} {request_target(url)} HTTP/1.1", f"Host: {url.netloc}"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        lines.append(f"Content-Length: {len(body) if body else 0}")
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if body:
+            self.writer.write(body)
+        await self.writer.drain()
+        self.sent = True
+
+        try:
+            head = await self.reader.readuntil(b'\r\n\r\n')
+        except asyncio.LimitOverrunError:
+            raise PortalAPIRequest("API response header too large")
+
+        status_line, _, raw_headers = head.partition(b'\r\n')
+        try:
+            version, status, reason = status_line.decode('latin-1').split(' ', 2)
+            status = int(status)
+        except ValueError:
+            try:
+                version, status = status_line.decode('latin-1').split(' ', 1)
+                status, reason = int(status), ''
+            except ValueError:
+                raise PortalAPIRequest(f"malformed API response status line: {status_line!r}")
+
+        response_headers = BytesParser(_class=http.client.HTTPMessage).parsebytes(raw_headers)
+
+        connection = response_headers.get('Connection', '').lower()
+        keep_alive = (version == 'HTTP/1.1' and connection != 'close') or connection == 'keep-alive'
+
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            body = b''
+        elif response_headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = await self._read_chunked()
+        elif response_headers.get('Content-Length') is not None:
+            try:
+                length = int(response_headers['Content-Length'])
+            except ValueError:
+                raise PortalAPIRequest("malformed API response Content-Length")
+            body = await self.reader.readexactly(length)
+        else:
+            body = await self.reader.read()
+            keep_alive = False
+
+        self.last_used = time.monotonic()
+        return AsyncResponse(status, reason.strip(), response_headers, body), keep_alive
+
+    async def _read_chunked(self) -> bytes:
+        chunks = []
+        while True:
+            line = await self.reader.readline()
+            try:
+                size = int(line.split(b';', 1)[0], 16)
+            except ValueError:
+                raise PortalAPIRequest("malformed chunk in API response")
+
+            if size == 0:
+                # skip trailers
+                while (await self.reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readexactly(2)
+
+
+class AsyncConnectionPool:
+    """AsyncConnectionPool keeps HTTP/1.1 connections alive, per host, so they
+    can be reused by subsequent requests. It is the asyncio counterpart of
+    `dcso.portal.util.connection.ConnectionPool`.
+
+    At most `maxsize` idle connections are kept per host, and connections idle
+    for longer than `idle_timeout` seconds are evicted. No more than `max_in_flight`
+    requests are sent at the same time; other requests wait for their turn.
+
+    When `decompress` is True, the API is told that responses may be compressed
+    using gzip or deflate, and these are decompressed transparently.
+
+    Request bodies of at least `compress_min_size` bytes are compressed using
+    gzip, and failed requests are retried following the `retry` policy; see
+    `dcso.portal.util.connection.ConnectionPool`.
+
+    When a `rate_limit` is given, requests are started at the rate it allows,
+    and it adapts when the API throttles us. Its `max_in_flight` is not used;
+    the pool's own `max_in_flight` applies instead.
+
+    Requests are limited in time using `timeout`, which defaults to `Timeout()`.
+    Its read timeout limits how long we wait for the complete response.
+
+    The pool must be used within one event loop.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_POOL_MAXSIZE,
+                 idle_timeout: float = DEFAULT_POOL_IDLE_TIMEOUT,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                 ssl_context: Optional[ssl.SSLContext] = None,
+                 decompress: bool = True,
+                 compress_min_size: Optional[int] = None,
+                 retry: Optional[RetryPolicy] = None,
+                 rate_limit: Optional[RateLimiter] = None,
+                 timeout: Optional[Timeout] = None):
+        self.maxsize: int = maxsize
+        self.idle_timeout: float = idle_timeout
+        self.decompress: bool = decompress
+        self.compress_min_size: Optional[int] = compress_min_size
+        self.retry: Optional[RetryPolicy] = retry
+        self.rate_limit: Optional[RateLimiter] = rate_limit
+        self.timeout: Timeout = timeout or Timeout()
+        self.max_in_flight: int = max_in_flight
+        self.stats: TransportStats = TransportStats()
+        self._ssl_context: Optional[ssl.SSLContext] = ssl_context
+
+        self._idle: Dict[tuple, deque] = {}
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._gzip_rejected: set = set()
+        self._closed: bool = False
+
+    async def __aenter__(self) -> 'AsyncConnectionPool':
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def ssl_context(self) -> ssl.SSLContext:
+        """SSL context used for all HTTPS connections of this pool."""
+        if self._ssl_context is None:
+            self._ssl_context = create_ssl_context()
+        return self._ssl_context
+
+    async def close(self) -> None:
+        """Closes all idle connections."""
+        self._closed = True
+        idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for conn in connections:
+                conn.close()
+
+    def evict_idle(self) -> int:
+        """Closes connections which were idle for longer than `idle_timeout`
+        seconds, and returns how many were evicted."""
+        deadline = time.monotonic() - self.idle_timeout
+        evicted = 0
+        for connections in self._idle.values():
+            while connections and connections[0].last_used < deadline:
+                connections.popleft().close()
+                evicted += 1
+
+        if evicted:
+            self.stats.increment('connections_evicted', evicted)
+        return evicted
+
+    async def request(self, method: str, url: Union[ParseResult, str],
+                      body: Optional[bytes] = None, headers: Optional[dict] = None,
+                      idempotent: bool = True, timeout: Optional[Timeout] = None,
+                      deadline: Optional[Deadline] = None) -> AsyncResponse:
+        """Sends the request using a pooled connection, and returns the response.
+
+        Failed requests are retried following the `retry` policy of the pool, and
+        requests are limited in time using `timeout` and `deadline`; see
+        `dcso.portal.util.connection.ConnectionPool.request`.
+
+        Raises `PortalTimeout` when the request timed out, and `PortalAPIRequest`
+        when the request could not be sent or no response was received.
+        """
+        if self._closed:
+            raise PortalAPIRequest("connection pool is closed")
+
+        if isinstance(url, str):
+            url = urlparse(url)
+
+        if self._in_flight is None:
+            self._in_flight = asyncio.Semaphore(self.max_in_flight)
+
+        key = _pool_key(url)
+        headers = dict(headers or {})
+        if self.decompress:
+            headers.setdefault('Accept-Encoding', ACCEPT_ENCODING)
+
+        timeout = timeout or self.timeout
+        if timeout.total is not None:
+            deadline = Deadline.earliest(deadline, Deadline(timeout.total))
+
+        self.stats.increment('requests')
+        self.evict_idle()
+
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            if deadline is not None:
+                deadline.check()
+            attempt += 1
+            self.stats.increment('attempts')
+            if self.rate_limit is not None:
+                delay = self.rate_limit.reserve()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            try:
+                response = await self._request_once(key, method, url, body, headers, idempotent, timeout, deadline)
+            except PortalAPIRequest:
+                wait = self.retry.next_wait(attempt, started, idempotent) if self.retry else None
+                if wait is None or (deadline is not None and wait >= deadline.remaining()):
+                    raise
+            else:
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                if response.status == 429:
+                    self.stats.increment('throttled')
+                    if self.rate_limit is not None:
+                        self.rate_limit.throttled(retry_after)
+                elif response.status < 400 and self.rate_limit is not None:
+                    self.rate_limit.succeeded()
+
+                if self.retry is None or response.status not in self.retry.statuses:
+                    return response
+
+                wait = self.retry.next_wait(attempt, started, idempotent, retry_after)
+                if wait is None or (deadline is not None and wait >= deadline.remaining()):
+                    return response
+
+            self.stats.increment('retries')
+            await asyncio.sleep(wait)
+
+    async def _request_once(self, key: tuple, method: str, url: ParseResult, body: Optional[bytes],
+                            headers: dict, idempotent: bool, timeout: Timeout,
+                            deadline: Optional[Deadline]) -> AsyncResponse:
+        if (body and self.compress_min_size is not None and len(body) >= self.compress_min_size
+                and key not in self._gzip_rejected):
+            response = await self._send(key, method, url, gzip_body(body),
+                                        dict(headers, **{'Content-Encoding': 'gzip'}), len(body),
+                                        idempotent, timeout, deadline)
+            if not rejects_gzip_body(response.status, response.headers):
+                return response
+
+            # try again uncompressed
+            self._gzip_rejected.add(key)
+            self.stats.increment('compressed_bodies_rejected')
+
+        return await self._send(key, method, url, body, headers, len(body or b''), idempotent, timeout, deadline)
+
+    async def _send(self, key: tuple, method: str, url: ParseResult, body: Optional[bytes],
+                    headers: dict, encoded_size: int, idempotent: bool, timeout: Timeout,
+                    deadline: Optional[Deadline]) -> AsyncResponse:
+        self.stats.increment('bytes_encoded', encoded_size)
+        self.stats.increment('bytes_sent', len(body or b''))
+
+        connect_timeout, read_timeout = timeout.connect, timeout.read
+        if deadline is not None:
+            connect_timeout, read_timeout = deadline.limit(connect_timeout), deadline.limit(read_timeout)
+            # when the deadline passed, the timeouts are 0, which must not be used
+            deadline.check()
+
+        async with self._in_flight:
+            while True:
+                conn = self._get_connection(key)
+                reused = conn is not None
+                try:
+                    if conn is None:
+                        conn = await asyncio.wait_for(self._new_connection(key), connect_timeout)
+                    response, keep_alive = await asyncio.wait_for(conn.request(method, url, body, headers),
+                                                                  read_timeout)
+                except asyncio.TimeoutError:
+                    if conn is not None:
+                        conn.close()
+                    raise PortalTimeout("timed out waiting for API")
+                except _STALE_CONNECTION_ERRORS as exc:
+                    if conn is not None:
+                        conn.close()
+                    if reused and (idempotent or not conn.sent):
+                        # peer closed the kept-alive connection; try again, unless the peer
+                        # might have received a request which must not be sent twice
+                        continue
+                    raise PortalAPIRequest(str(exc) or exc.__class__.__name__)
+                except (OSError, asyncio.IncompleteReadError, ValueError) as exc:
+                    if conn is not None:
+                        conn.close()
+                    raise PortalAPIRequest(str(exc) or exc.__class__.__name__)
+                except BaseException:
+                    # includes cancellation; connection state is unknown
+                    if conn is not None:
+                        conn.close()
+                    raise
+
+                if reused:
+                    self.stats.increment('connections_reused')
+
+                if keep_alive:
+                    self._put_connection(key, conn)
+                else:
+                    conn.close()
+                break
+
+        self.stats.increment('bytes_received', len(response.body))
+        if self.decompress:
+            decompressor = decompressor_for(response.headers.get('Content-Encoding'))
+            if decompressor is not None:
+                response.body = decompressor.decompress(response.body) + decompressor.flush()
+        self.stats.increment('bytes_decoded', len(response.body))
+
+        return response
+
+    def _get_connection(self, key: tuple) -> Optional[_AsyncConnection]:
+        connections = self._idle.get(key)
+        while connections:
+            conn = connections.pop()
+            if not conn.reader.at_eof():
+                return conn
+            conn.close()
+        return None
+
+    def _put_connection(self, key: tuple, conn: _AsyncConnection) -> None:
+        connections = self._idle.setdefault(key, deque())
+        if self._closed or len(connections) >= self.maxsize:
+            conn.close()
+        else:
+            connections.append(conn)
+
+    async def _new_connection(self, key: tuple) -> _AsyncConnection:
+        scheme, host, port = key
+        self.stats.increment('connections_opened')
+        if scheme == 'https':
+            reader, writer = await asyncio.open_connection(host, port, ssl=self.ssl_context,
+                                                           server_hostname=host, limit=_MAX_HEADER_SIZE)
+            self.stats.increment('tls_handshakes')
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=_MAX_HEADER_SIZE)
+        return _AsyncConnection(reader, writer)
@@ -0,0 +1,60 @@
+# Copyright (c) 2021, DCSO GmbH
+
+from collections import namedtuple
+from typing import List, Optional, Union
+from urllib.parse import ParseResult
+
+from ..exceptions import PortalAPIRequest
+from ..util.graphql import GraphQLRequest, decode_graphql_response, graphql_data_to_namedtuple
+from ..util.timeout import Deadline, Timeout
+from .connection import AsyncConnectionPool
+
+
+class AsyncGraphQLRequest(GraphQLRequest):
+    """Asyncio counterpart of `dcso.portal.util.graphql.GraphQLRequest`, sending
+    the request using an `AsyncConnectionPool`."""
+
+    def __init__(self,
+                 query: str,
+                 api_url: Union[ParseResult, str],
+                 transport: AsyncConnectionPool,
+                 variables: Optional[dict] = None,
+                 fragments: Optional[List[str]] = None,
+                 token: Optional[str] = None,
+                 idempotent: Optional[bool] = None,
+                 timeout: Optional[Timeout] = None,
+                 deadline: Optional[Deadline] = None):
+        super().__init__(query=query, api_url=api_url, variables=variables,
+                         fragments=fragments, token=token, idempotent=idempotent,
+                         timeout=timeout, deadline=deadline)
+        self.transport: AsyncConnectionPool = transport
+
+    async def execute_raw(self) -> bytes:
+        """Executes the GraphQL query and return the response from the wire as JSON.
+
+        Raises PortalAPIRequest when request with API or decoding result fails.
+        """
+        response = await self.transport.request('POST', self.url(), body=self.json(), headers=self.headers(),
+                                                idempotent=self.is_idempotent(),
+                                                timeout=self.timeout, deadline=self.deadline)
+        if not 200 <= response.status < 300:
+            raise PortalAPIRequest(response.reason)
+        return response.body
+
+    async def execute_dict(self) -> dict:
+        """Executes the GraphQL request returning response as a dictionary.
+
+        Raises `PortalAPIError` When the GraphQL API endpoint returned an error.
+        When there was an issue with the request itself, or decoding JSON failed,
+        the `PortalAPIRequest` exception is raised.
+        """
+        return decode_graphql_response(await self.execute_raw())
+
+    async def execute(self) -> namedtuple:
+        """Executes the GraphQL request returning response as a namedtuple.
+
+        Raises `PortalAPIError` When the GraphQL API endpoint returned an error.
+        When there was an issue with the request itself, or decoding JSON failed,
+        the `PortalAPIRequest` exception is raised.
+        """
+        return graphql_data_to_namedtuple((await self.execute_dict())['data'])
@@ -0,0 +1,170 @@
+# Copyright (c) 2021, DCSO GmbH
+
+import asyncio
+import json
+import unittest
+
+from ..auth.test_token import _TEST_USER_RESP, _TEST_USER_TOKEN_10Y
+from ..exceptions import PortalAPIError, PortalAPIRequest, PortalTimeout
+from ..util.retry import RetryPolicy
+from ..util.test_connection import _GraphQLHandler, start_test_server, stop_test_server
+from ..util.timeout import Deadline, Timeout
+from .api import AsyncAPIClient
+from .connection import AsyncConnectionPool
+
+
+class _ChunkedHandler(_GraphQLHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        payload = json.dumps(self.server.response).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for i in range(0, len(payload), 7):
+            chunk = payload[i:i + 7]
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+        self.wfile.write(b'0\r\n\r\n')
+
+
+class TestAsyncAPIClient(unittest.TestCase):
+    def setUp(self):
+        self.server = start_test_server({'data': {'ping': 'pong'}})
+
+    def tearDown(self):
+        stop_test_server(self.server)
+
+    def test_execute_graphql(self):
+        async def run():
+            async with AsyncAPIClient(api_url=self.server.url) as client:
+                result = await client.execute_graphql('{ ping }')
+                self.assertEqual('pong', result.ping)
+                self.assertEqual('pong', (await client.execute_graphql_dict('{ ping }'))['ping'])
+                return client.stats.as_dict()
+
+        stats = asyncio.run(run())
+        self.assertEqual(1, stats['connections_opened'])
+        self.assertEqual(1, stats['connections_reused'])
+
+    def test_query_string(self):
+        async def run():
+            pool = AsyncConnectionPool()
+            try:
+                await pool.request('POST', self.server.url + '?tenant=a', body=b'{}')
+            finally:
+                await pool.close()
+
+        asyncio.run(run())
+        self.assertEqual(['/graphql?tenant=a'], self.server.paths)
+
+    def test_concurrency(self):
+        async def run():
+            async with AsyncAPIClient(api_url=self.server.url, max_in_flight=3) as client:
+                results = await asyncio.gather(*[client.execute_graphql_dict('{ ping }') for _ in range(30)])
+                return results, client.stats.as_dict()
+
+        results, stats = asyncio.run(run())
+        self.assertEqual([{'ping': 'pong'}] * 30, results)
+        self.assertLessEqual(stats['connections_opened'], 3)
+        self.assertEqual(30, len(self.server.requests))
+
+    def test_chunked(self):
+        stop_test_server(self.server)
+        self.server = start_test_server({'data': {'ping': 'pong' * 10}}, handler=_ChunkedHandler)
+
+        async def run():
+            async with AsyncAPIClient(api_url=self.server.url) as client:
+                return [await client.execute_graphql_dict('{ ping }') for _ in range(2)]
+
+        self.assertEqual([{'ping': 'pong' * 10}] * 2, asyncio.run(run()))
+
+    def test_decompress(self):
+        self.server.response = {'data': {'ping': 'pong' * 1000}}
+        self.server.content_encoding = 'gzip'
+
+        async def run():
+            async with AsyncAPIClient(api_url=self.server.url) as client:
+                return await client.execute_graphql_dict('{ ping }'), client.stats.as_dict()
+
+        result, stats = asyncio.run(run())
+        self.assertEqual('pong' * 1000, result['ping'])
+        self.assertLess(stats['bytes_received'], stats['bytes_decoded'])
+
+    def test_compress_request_body(self):
+        self.server.reject_gzip = True
+
+        async def run():
+            async with AsyncAPIClient(api_url=self.server.url, compress_min_size=0) as client:
+                results = [await client.execute_graphql_dict('{ ping }') for _ in range(2)]
+                return results, client.stats.as_dict()
+
+        results, stats = asyncio.run(run())
+        self.assertEqual([{'ping': 'pong'}] * 2, results)
+        self.assertEqual(1, stats['compressed_bodies_rejected'])
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_retry(self):
+        self.server.statuses = [502, 504]
+
+        async def run():
+            async with AsyncAPIClient(api_url=self.server.url, retry=RetryPolicy(backoff_base=0)) as client:
+                return await client.execute_graphql_dict('{ ping }'), client.stats.as_dict()
+
+        result, stats = asyncio.run(run())
+        self.assertEqual({'ping': 'pong'}, result)
+        self.assertEqual(3, stats['attempts'])
+        self.assertEqual(2, stats['retries'])
+
+    def test_timeout(self):
+        self.server.delay = 0.5
+
+        async def run(**kwargs):
+            async with AsyncAPIClient(api_url=self.server.url, timeout=0.05,
+                                      retry=RetryPolicy(max_attempts=1)) as client:
+                return await client.execute_graphql_dict('{ ping }', **kwargs)
+
+        self.assertRaises(PortalTimeout, asyncio.run, run())
+        self.assertRaises(PortalTimeout, asyncio.run, run(timeout=Timeout(read=1), deadline=Deadline(0.05)))
+
+        self.server.delay = 0.1
+        self.assertEqual({'ping': 'pong'}, asyncio.run(run(timeout=Timeout(read=1))))
+
+    def test_errors(self):
+        with self.subTest("GraphQL error"):
+            self.server.response = {'errors': [{'message': 'error occurred'}]}
+            client = AsyncAPIClient(api_url=self.server.url)
+            with self.assertRaises(PortalAPIError) as ctx:
+                asyncio.run(client.execute_graphql('{ ping }'))
+            self.assertEqual("error occurred", str(ctx.exception))
+
+        with self.subTest("HTTP error"):
+            self.server.status = 503
+            client = AsyncAPIClient(api_url=self.server.url, retry=RetryPolicy(max_attempts=1))
+            with self.assertRaises(PortalAPIRequest) as ctx:
+                asyncio.run(client.execute_graphql('{ ping }'))
+            self.assertEqual("Service Unavailable", str(ctx.exception))
+
+    def test_is_alive(self):
+        self.server.response = {'data': {'__schema': {'queryType': {'name': 'Query'}}}}
+        self.assertTrue(asyncio.run(AsyncAPIClient(api_url=self.server.url).is_alive()))
+
+    def test_authenticate(self):
+        self.server.response = _TEST_USER_RESP
+
+        async def run():
+            async with AsyncAPIClient(api_url=self.server.url) as client:
+                authn = await client.auth.authenticate('admin', 'secret')
+                return authn, client.token
+
+        authn, token = asyncio.run(run())
+        self.assertEqual('admin', authn.username)
+        self.assertEqual(_TEST_USER_TOKEN_10Y, token)
+
+        _, headers, body = self.server.requests[0]
+        self.assertIsNone(headers.get('Authorization'))
+        self.assertEqual('secret', json.loads(body)['variables']['portalauth']['password'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,38 +5,196 @@ Definition of the APIClient class which is used to start interactions with
 the DCSO Portal API.
 """
 import os
+import ssl
 import urllib.parse
 from collections import namedtuple
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
 from .abstracts import APIAbstract
 from .auth import Auth
-from .exceptions import PortalAPIRequest, PortalException
-from .util.graphql import GraphQLRequest
+from .exceptions import PortalAPIRequest, PortalAPIResponse, PortalException
+from .util.cache import ResponseCache
+from .util.checkpoint import Checkpoint
+from .util.connection import ConnectionPool, DEFAULT_POOL_IDLE_TIMEOUT, DEFAULT_POOL_MAXSIZE, create_ssl_context
+from .util.graphql import (GraphQLBatchRequest, GraphQLRequest, PreparedQuery, check_graphql_errors,
+                           graphql_data_to_namedtuple)
+from .util.incremental import is_incremental
 from .util.networking import validate_api_url
+from .util.pagination import DEFAULT_PAGE_SIZE, DEFAULT_PREFETCH, Paginator
+from .util.persisted import PersistedQueries
+from .util.ratelimit import RateLimiter
+from .util.retry import RetryPolicy, is_mutation
+from .util.schema import DEFAULT_DATETIME_SCALARS, INTROSPECTION_QUERY, Schema, SchemaCache, introspection_schema
+from .util.subscription import DEFAULT_KEEPALIVE, Subscription, websocket_url
+from .util.timeout import Deadline, Timeout
+from .util.transport import Transport, TransportStats
+from .util.views import ResultView
+from .util.watcher import DEFAULT_MAX_INTERVAL, DEFAULT_MIN_INTERVAL, Watcher
 
 ENV_PORTAL_TOKEN: str = "DCSO_PORTAL_TOKEN"
 """Name of the environment variable holding the
 DCSO Portal Token to be used when Authorizing."""
 
+BATCH_MAX_WORKERS: int = 8
+"""Maximum number of threads sending requests when a batch is executed
+using single requests."""
+
 
 class APIClient(APIAbstract):
     """
     .. include:: apiclient.md
     """
 
-    def __init__(self, api_url: str):
+    def __init__(self, api_url: str,
+                 pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+                 pool_idle_timeout: float = DEFAULT_POOL_IDLE_TIMEOUT,
+                 ssl_context: Optional[ssl.SSLContext] = None,
+                 cafile: Optional[str] = None,
+                 decompress: bool = True,
+                 compress_min_size: Optional[int] = None,
+                 retry: Optional[RetryPolicy] = None,
+                 rate_limit: Optional[RateLimiter] = None,
+                 timeout: Union[Timeout, float, None] = None,
+                 transport: Optional[Transport] = None,
+                 persisted_queries: bool = False,
+                 cache: Optional[ResponseCache] = None,
+                 datetime_fields: Optional[Iterable[str]] = None):
         """
         The `api_url` parameter is the DCSO Portal API endpoint and must be provided;
         there is no default.
+
+        Connections to the API are kept alive and reused. At most `pool_maxsize`
+        idle connections are kept, and they are closed after being idle for
+        `pool_idle_timeout` seconds. Use `close()`, or use the client as context
+        manager, to close all connections when done.
+
+        The TLS configuration is created once and shared by all connections, which
+        allows resuming TLS sessions when reconnecting. Use `ssl_context` to provide
+        a custom context, or `cafile` to verify the API's certificate using the CA
+        certificates in the given file.
+
+        Responses are requested compressed (gzip or deflate), and decompressed
+        transparently, unless `decompress` is False.
+
+        Request bodies, for example holding large variables, are compressed using gzip
+        when they are at least `compress_min_size` bytes. By default, request bodies are
+        not compressed. When the API rejects a compressed body, the request is sent
+        again uncompressed, and compression is no longer used.
+
+        Requests failing because of connection issues, or because the API is
+        (temporarily) unavailable, are retried following the `retry` policy. By default,
+        queries are attempted 3 times, but mutations are not retried. See `RetryPolicy`
+        for details. Use `RetryPolicy(max_attempts=1)` to never retry.
+
+        Use `rate_limit` to limit the number of requests per second, and the number
+        of requests in flight. The limiter is shared by all threads and services using
+        this client, such as `auth`, and lowers the rate when the API responds with
+        status 429. For example, at most 20 requests per second, 4 at a time:
+
+            apic = APIClient(api_url, rate_limit=RateLimiter(rate=20, max_in_flight=4))
+
+        Requests are limited in time using `timeout`, which is either a `Timeout`, or a
+        number of seconds used for both connecting and reading. By default, we wait 10
+        seconds for a connection, and 60 seconds for data from the API.
+
+        Requests are sent using a `dcso.portal.util.connection.ConnectionPool` created
+        with the above arguments. Use `transport` to provide another implementation of
+        `dcso.portal.util.transport.Transport` instead, in which case these arguments
+        are not used. For example, `dcso.portal.util.standin.StandInTransport` answers
+        requests in-process, which is useful for testing.
+
+        When `persisted_queries` is True, queries executed using `execute_graphql` and
+        `execute_graphql_dict` are sent as Automatic Persisted Queries: once the API
+        knows a query, only its SHA-256 hash is sent instead of the full text. See
+        `dcso.portal.util.persisted.PersistedQueries`.
+
+        When a `cache` is given, responses of queries executed using `execute_graphql`
+        and `execute_graphql_dict` are cached, per query, variables, and token. Executing
+        a mutation invalidates the cache. See `dcso.portal.util.cache.ResponseCache`.
+
+        Timestamps in responses are decoded as `datetime.datetime`. By default, any
+        string value which looks like a UTC timestamp is decoded; use `datetime_fields`
+        to only decode values of fields with the given names, which is faster, and
+        leaves other strings alone:
+
+            apic = APIClient(api_url, datetime_fields={'occurredOn', 'updatedOn'})
+
+        Use `load_schema` to decode fields as given by the schema of the API instead.
         """
         self._api_url: str = ""
         self.api_url = api_url
         self._token: str = os.environ.get(ENV_PORTAL_TOKEN, "")
+        if transport is None:
+            if ssl_context is None and cafile:
+                ssl_context = create_ssl_context(cafile=cafile)
+            transport = ConnectionPool(maxsize=pool_maxsize,
+                                       idle_timeout=pool_idle_timeout,
+                                       ssl_context=ssl_context,
+                                       decompress=decompress,
+                                       compress_min_size=compress_min_size,
+                                       retry=retry or RetryPolicy(),
+                                       rate_limit=rate_limit,
+                                       timeout=Timeout.from_value(timeout))
+        self._transport: Transport = transport
+        self._ssl_context: Optional[ssl.SSLContext] = ssl_context
+        self._batching: bool = True
+        self._persisted: Optional[PersistedQueries] = PersistedQueries() if persisted_queries else None
+        self._cache: Optional[ResponseCache] = cache
+        self._datetime_fields: Optional[FrozenSet[str]] = (
+            frozenset(datetime_fields) if datetime_fields is not None else None)
+        self._schema: Optional[Schema] = None
 
         # default services
         self.auth = Auth(api=self)
 
+    def __enter__(self) -> 'APIClient':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Closes all connections kept alive by this client."""
+        self._transport.close()
+
+    @property
+    def transport(self) -> Transport:
+        """Transport used for all requests done through this client."""
+        return self._transport
+
+    @property
+    def stats(self) -> TransportStats:
+        """Counters about requests, connections, and bytes transferred by this client.
+
+        For example, `bytes_received` holds the number of body bytes as received
+        from the wire, and `bytes_decoded` after decompression.
+        """
+        return self._transport.stats
+
+    @property
+    def cache(self) -> Optional[ResponseCache]:
+        """Cache of query responses, or None when responses are not cached."""
+        return self._cache
+
+    @property
+    def datetime_fields(self) -> Optional[FrozenSet[str]]:
+        """Names of fields of which timestamps are decoded, or None when timestamps
+        in any field are decoded."""
+        return self._datetime_fields
+
+    @property
+    def schema(self) -> Optional[Schema]:
+        """Schema of the API used to decode timestamps, or None when `load_schema`
+        was not used."""
+        return self._schema
+
+    @property
+    def persisted_queries(self) -> Optional[PersistedQueries]:
+        """Registration status of persisted queries, or None when not used."""
+        return self._persisted
+
     @property
     def api_url(self) -> str:
         return self._api_url
@@ -64,7 +222,12 @@ class APIClient(APIAbstract):
 
     def execute_graphql(self, query: str,
                         variables: Optional[dict] = None,
-                        fragments: Optional[List[str]] = None) -> namedtuple:
+                        fragments: Optional[List[str]] = None,
+                        idempotent: Optional[bool] = None,
+                        timeout: Union[Timeout, float, None] = None,
+                        deadline: Optional[Deadline] = None,
+                        invalidate: Optional[List[str]] = None,
+                        lazy: bool = False) -> Union[namedtuple, ResultView]:
         """Executes the GraphQL query and returns response as namedtuple. This
         namedtuple starts from the 'data'-object.
 
@@ -84,22 +247,52 @@ class APIClient(APIAbstract):
 
             print(f"Name: {response.user.name}")
 
+        Queries are retried when failing because of transient issues. Mutations are
+        only retried when `idempotent` is True, meaning it is safe to execute them
+        more than once.
+
+        Use `timeout` to override the timeout of the client for this request. A
+        `Deadline` can be shared by several requests, limiting how long they take
+        together, including retries:
+
+            deadline = Deadline(30)
+            users = apic.execute_graphql('{ users { id } }', deadline=deadline)
+            groups = apic.execute_graphql('{ groups { id } }', deadline=deadline)
+
+        When the client has a `cache`, and a mutation is executed, cached responses of
+        the queries listed in `invalidate` are removed; by default, all are removed.
+
+        When `lazy` is True, a read-only `dcso.portal.util.views.ResultView` of the data
+        is returned instead, giving the same attribute access. Nested objects and lists
+        are only wrapped when accessed, which is much cheaper for large responses of
+        which only a few fields are used.
+
+        Raises `PortalTimeout`, a `PortalAPIRequest`, when the request timed out.
+
         Raises `PortalAPIError` When the GraphQL API endpoint returned an error.
         When there was an issue with the request itself, or decoding JSON failed,
         the `PortalAPIRequest` exception is raised.
         """
         request = GraphQLRequest(api_url=self.api_url,
                                  query=query, variables=variables, fragments=fragments,
-                                 token=self.token)
+                                 token=self.token, transport=self.transport,
+                                 idempotent=idempotent, timeout=Timeout.from_value(timeout),
+                                 deadline=deadline, persisted=self._persisted,
+                                 datetime_fields=self._datetime_fields, schema=self._schema)
 
         try:
-            return request.execute()
+            data = self._execute_dict(request, invalidate)['data']
+            return ResultView(data) if lazy else graphql_data_to_namedtuple(data)
         except PortalException:
             raise
 
     def execute_graphql_dict(self, query: str,
                              variables: Optional[dict] = None,
-                             fragments: Optional[List[str]] = None) -> dict:
+                             fragments: Optional[List[str]] = None,
+                             idempotent: Optional[bool] = None,
+                             timeout: Union[Timeout, float, None] = None,
+                             deadline: Optional[Deadline] = None,
+                             invalidate: Optional[List[str]] = None) -> dict:
         """Executes the GraphQL request and return response a dictionary.
 
         For example, when executing query getting user information:
@@ -118,26 +311,362 @@ class APIClient(APIAbstract):
 
             print(f"Name: {response['user']['name']}")
 
+        See `execute_graphql` about `idempotent`, `timeout`, `deadline`, and `invalidate`.
+
         Raises `PortalAPIError` When the GraphQL API endpoint returned an error.
         When there was an issue with the request itself, or decoding JSON failed,
         the `PortalAPIRequest` exception is raised.
         """
         request = GraphQLRequest(api_url=self.api_url,
                                  query=query, variables=variables, fragments=fragments,
-                                 token=self.token)
+                                 token=self.token, transport=self.transport,
+                                 idempotent=idempotent, timeout=Timeout.from_value(timeout),
+                                 deadline=deadline, persisted=self._persisted,
+                                 datetime_fields=self._datetime_fields, schema=self._schema)
 
         try:
-            return request.execute_dict()['data']
+            return self._execute_dict(request, invalidate)['data']
         except KeyError as exc:
             raise PortalAPIRequest(f"API request contained unusable error definition {exc}")
         except PortalException:
             raise
 
+    def _execute_dict(self, request: GraphQLRequest, invalidate: Optional[List[str]] = None) -> dict:
+        """Executes `request` using the cache, when available."""
+        cache = self._cache
+        if cache is None or is_incremental(request.query, request.fragments):
+            return request.execute_dict()
+
+        if is_mutation(request.query):
+            try:
+                return request.execute_dict()
+            finally:
+                cache.invalidate_queries(invalidate)
+
+        key = cache.key(request.payload()['query'], request.variables, request.token)
+        raw = cache.get(key)
+        if raw is not None:
+            return request.decode(raw)
+
+        raw = request.execute_raw()
+        response = request.decode(raw)
+        cache.put(key, raw)
+        return response
+
+    def execute_incremental(self, query: str,
+                            variables: Optional[dict] = None,
+                            fragments: Optional[List[str]] = None,
+                            timeout: Union[Timeout, float, None] = None,
+                            deadline: Optional[Deadline] = None) -> Iterator[dict]:
+        """Executes the GraphQL query, which uses the @defer or @stream directive,
+        and yields its data as dictionary as soon as the initial payload arrived,
+        and again each time later payloads were merged into it:
+
+            query = '''{
+                alert(id: "1") { id title ... @defer { details { summary } } }
+            }'''
+            for data in apic.execute_incremental(query):
+                render(data['alert'])
+
+        The same dictionary is yielded each time, growing with each payload. When
+        the API does not support incremental delivery, the complete data is yielded
+        once. Use `execute_graphql` or `execute_graphql_dict` to only get the
+        complete result; they also understand incremental responses.
+
+        See `execute_graphql` about `timeout` and `deadline`; the read timeout applies
+        to waiting for each payload.
+
+        Raises `PortalAPIError` When the GraphQL API endpoint returned an error.
+        When there was an issue with the request itself, or decoding JSON failed,
+        the `PortalAPIRequest` exception is raised.
+        """
+        request = GraphQLRequest(api_url=self.api_url,
+                                 query=query, variables=variables, fragments=fragments,
+                                 token=self.token, transport=self.transport,
+                                 timeout=Timeout.from_value(timeout), deadline=deadline,
+                                 datetime_fields=self._datetime_fields, schema=self._schema)
+
+        for result in request.iter_incremental():
+            try:
+                yield result['data']
+            except KeyError as exc:
+                raise PortalAPIRequest(f"API request contained unusable error definition {exc}")
+
+    def prepare(self, query: str,
+                fragments: Optional[List[str]] = None,
+                idempotent: Optional[bool] = None,
+                invalidate: Optional[List[str]] = None) -> PreparedQuery:
+        """Prepares the GraphQL query, with its fragments, for being executed many
+        times, each time with other variables. Building requests is cheaper this way,
+        which helps applications executing the same query at a high rate:
+
+            alert = apic.prepare('query ($id: ID!) { alert(id: $id) { id } }')
+            for alert_id in alert_ids:
+                print(alert.execute({'id': alert_id}).alert.id)
+
+        Prepared queries use the token of the client at the time of execution, but
+        the API endpoint at the time of preparing. See `execute_graphql` about
+        `idempotent` and `invalidate`.
+        """
+        return PreparedQuery(self, query, fragments=fragments, idempotent=idempotent, invalidate=invalidate)
+
+    def execute_batch(self, operations: Sequence[Union[str, Tuple[str, Optional[dict]]]],
+                      fragments: Optional[List[str]] = None,
+                      return_exceptions: bool = False,
+                      timeout: Union[Timeout, float, None] = None,
+                      deadline: Optional[Deadline] = None,
+                      invalidate: Optional[List[str]] = None) -> List[Any]:
+        """Executes several GraphQL operations using one HTTP request, and returns
+        their data as dictionaries, in the same order as `operations`. Each operation
+        is either a query, or a tuple holding the query and its variables. The
+        `fragments` are used by all operations.
+
+        For example, getting several users using a single round trip:
+
+            query = 'query ($id: ID!) { user(id: $id) { name } }'
+            alice, bob = apic.execute_batch([(query, {'id': '1'}), (query, {'id': '2'})])
+
+        The operations are sent as a JSON array, which is a common convention for
+        batching GraphQL requests. When the API does not support this, the operations
+        are executed using single requests, sent concurrently, and batching is no
+        longer tried by this client.
+
+        When one of the operations fails, its exception is raised once all operations
+        are done. When `return_exceptions` is True, exceptions are returned in place of
+        the data of the failed operation instead.
+
+        See `execute_graphql` about `timeout` and `deadline`; they apply to the batch
+        as a whole. When one of the operations is a mutation, cached responses are
+        invalidated as described for `invalidate` of `execute_graphql`.
+
+        Raises `PortalAPIError` When the GraphQL API endpoint returned an error.
+        When there was an issue with the request itself, or decoding JSON failed,
+        the `PortalAPIRequest` exception is raised.
+        """
+        timeout = Timeout.from_value(timeout)
+        requests = []
+        for operation in operations:
+            query, variables = (operation, None) if isinstance(operation, str) else operation
+            requests.append(GraphQLRequest(api_url=self.api_url,
+                                           query=query, variables=variables, fragments=fragments,
+                                           token=self.token, transport=self.transport,
+                                           timeout=timeout, deadline=deadline,
+                                           datetime_fields=self._datetime_fields, schema=self._schema))
+
+        if not requests:
+            return []
+
+        cache = self._cache
+        if cache is None or not any(is_mutation(request.query) for request in requests):
+            results = self._execute_batch(requests, timeout, deadline)
+        else:
+            try:
+                results = self._execute_batch(requests, timeout, deadline)
+            finally:
+                cache.invalidate_queries(invalidate)
+
+        for result in results:
+            if isinstance(result, PortalException) and not return_exceptions:
+                raise result
+        return results
+
+    def _execute_batch(self, requests: List[GraphQLRequest], timeout: Optional[Timeout],
+                       deadline: Optional[Deadline]) -> List[Any]:
+        """Executes `requests` as batch, or as single requests when the API does
+        not support batching, and returns their data or exceptions."""
+        results = None
+        if self._batching and len(requests) > 1:
+            batch = GraphQLBatchRequest(requests, api_url=self.api_url, transport=self.transport,
+                                        token=self.token, timeout=timeout, deadline=deadline,
+                                        datetime_fields=self._datetime_fields, schema=self._schema)
+            try:
+                results = [_batch_result(lambda: check_graphql_errors(response)) for response in batch.execute_list()]
+            except PortalAPIResponse:
+                self._batching = False
+
+        if results is None:
+            with ThreadPoolExecutor(max_workers=min(BATCH_MAX_WORKERS, len(requests))) as executor:
+                results = list(executor.map(lambda r: _batch_result(r.execute_dict), requests))
+        return results
+
+    def iter_path(self, query: str, path: str,
+                  variables: Optional[dict] = None,
+                  fragments: Optional[List[str]] = None,
+                  timeout: Union[Timeout, float, None] = None,
+                  deadline: Optional[Deadline] = None) -> Iterator[Any]:
+        """Executes the GraphQL query and yields, one by one, the elements of the
+        list found using `path` within the response data. The path is a string
+        with keys separated by dots.
+
+        The response is parsed incrementally as it is read from the connection,
+        which keeps memory usage low, even for very large responses. Elements
+        are yielded as dictionaries.
+
+        For example, printing the ID of all alerts:
+
+            query = '{ alerts { edges { node { id } } } }'
+            for edge in apic.iter_path(query, path='alerts.edges'):
+                print(edge['node']['id'])
+
+        See `execute_graphql` about `timeout` and `deadline`; the read timeout applies
+        to each read from the connection.
+
+        Raises `PortalAPIError` When the GraphQL API endpoint returned an error.
+        When there was an issue with the request itself, or decoding JSON failed,
+        the `PortalAPIRequest` exception is raised.
+        """
+        request = GraphQLRequest(api_url=self.api_url,
+                                 query=query, variables=variables, fragments=fragments,
+                                 token=self.token, transport=self.transport,
+                                 timeout=Timeout.from_value(timeout), deadline=deadline,
+                                 datetime_fields=self._datetime_fields, schema=self._schema)
+
+        try:
+            yield from request.iter_path(['data'] + path.split('.'))
+        except PortalException:
+            raise
+
+    def paginate(self, query: str, connection_path: str,
+                 page_size: int = DEFAULT_PAGE_SIZE,
+                 variables: Optional[dict] = None,
+                 fragments: Optional[List[str]] = None,
+                 prefetch: int = DEFAULT_PREFETCH,
+                 cursor_variable: str = 'cursor',
+                 size_variable: str = 'first',
+                 timeout: Union[Timeout, float, None] = None,
+                 deadline: Optional[Deadline] = None,
+                 checkpoint: Union[Checkpoint, str, None] = None) -> Iterator[namedtuple]:
+        """Executes the GraphQL query once per page of the connection found using
+        `connection_path`, and yields, one by one, the nodes of all pages. The path
+        is a string with keys separated by dots.
+
+        The query gets the page size and the cursor of the page using the variables
+        named `size_variable` and `cursor_variable`. It must select the `pageInfo`
+        of the connection. For example, printing all alerts:
+
+            query = '''query ($first: Int, $cursor: Cursor) {
+                alerts(first: $first, after: $cursor) {
+                    edges { node { id occurredOn } }
+                    pageInfo { hasNextPage endCursor }
+                }
+            }'''
+            for alert in apic.paginate(query, 'alerts', page_size=500):
+                print(alert.id, alert.occurredOn)
+
+        While nodes are yielded, up to `prefetch` following pages are fetched in the
+        background, so waiting for the API overlaps with processing the nodes. Nodes
+        are namedtuples, like those returned by `execute_graphql`.
+
+        See `execute_graphql` about `timeout` and `deadline`; the timeout applies
+        to each page, and the deadline to all pages together.
+
+        Long running iterations can be resumed after a failure using a `checkpoint`,
+        which is a `Checkpoint` or the path of its file. Once all nodes of a page
+        were processed, the cursor of the next page is saved. When iterating using
+        the same query and variables again, iteration starts at that page. The
+        checkpoint is removed when all pages were iterated:
+
+            for alert in apic.paginate(query, 'alerts', checkpoint='alerts.checkpoint'):
+                export(alert)
+
+        Raises `PortalAPIError` When the GraphQL API endpoint returned an error.
+        When there was an issue with the request itself, or decoding JSON failed,
+        the `PortalAPIRequest` exception is raised.
+        """
+        yield from Paginator(self, query, connection_path, page_size=page_size,
+                             variables=variables, fragments=fragments, prefetch=prefetch,
+                             cursor_variable=cursor_variable, size_variable=size_variable,
+                             timeout=timeout, deadline=deadline,
+                             checkpoint=Checkpoint(checkpoint) if isinstance(checkpoint, str) else checkpoint)
+
+    def watch(self, query: str, connection_path: str,
+              since: Union[datetime, str, None] = None,
+              since_field: Optional[str] = 'occurredOn',
+              since_variable: str = 'since',
+              id_field: str = 'id',
+              page_size: int = DEFAULT_PAGE_SIZE,
+              variables: Optional[dict] = None,
+              fragments: Optional[List[str]] = None,
+              min_interval: float = DEFAULT_MIN_INTERVAL,
+              max_interval: float = DEFAULT_MAX_INTERVAL,
+              timeout: Union[Timeout, float, None] = None) -> Watcher:
+        """Returns a `dcso.portal.util.watcher.Watcher` following the nodes added to
+        the connection found using `connection_path`, such as new alerts. Iterating
+        over the watcher yields new nodes, as namedtuples, as they arrive:
+
+            query = '''query ($first: Int, $cursor: Cursor, $since: DateTime) {
+                alerts(first: $first, after: $cursor, filter: {occurredSince: $since}) {
+                    edges { node { id occurredOn } }
+                    pageInfo { hasNextPage endCursor }
+                }
+            }'''
+            for alert in apic.watch(query, 'alerts', since=utc_now()):
+                print(alert.id, alert.occurredOn)
+
+        Only nodes of which the `since_field` is equal to or later than the latest
+        one seen are requested, passing it as the variable named `since_variable`.
+        When `since_field` is None, the query is continued using the cursor of the
+        last page instead. Nodes are reported once, using their `id_field`.
+
+        The interval between polls adapts to how often new nodes arrive, between
+        `min_interval` and `max_interval` seconds. See `paginate` about `page_size`,
+        and `execute_graphql` about `timeout`.
+
+        Raises `PortalAPIError` When the GraphQL API endpoint returned an error.
+        When there was an issue with the request itself, or decoding JSON failed,
+        the `PortalAPIRequest` exception is raised.
+        """
+        return Watcher(self, query, connection_path, since=since, since_field=since_field,
+                       since_variable=since_variable, id_field=id_field, page_size=page_size,
+                       variables=variables, fragments=fragments,
+                       min_interval=min_interval, max_interval=max_interval, timeout=timeout)
+
+    def subscribe(self, query: str,
+                  variables: Optional[dict] = None,
+                  fragments: Optional[List[str]] = None,
+                  url: Optional[str] = None,
+                  keepalive: float = DEFAULT_KEEPALIVE,
+                  reconnect: Optional[RetryPolicy] = None) -> Subscription:
+        """Returns a `dcso.portal.util.subscription.Subscription` receiving the
+        events of the GraphQL subscription `query`, using a WebSocket connection
+        speaking the graphql-transport-ws protocol. Iterating over it yields the
+        data of each event as namedtuple:
+
+            with apic.subscribe('subscription { alertCreated { id } }') as events:
+                for event in events:
+                    print(event.alertCreated.id)
+
+        Or call a function for each event, for example from another thread:
+
+            events = apic.subscribe('subscription { alertCreated { id } }')
+            threading.Thread(target=events.run, args=(handle_alert,)).start()
+
+        The connection is made with `url`, which defaults to the API endpoint using
+        scheme wss (or ws), and authenticated using the token of the client. A ping
+        is sent after `keepalive` seconds without messages. Lost connections are
+        re-established following the `reconnect` policy, after which we subscribe
+        again.
+
+        Raises `PortalAPIError` When the server reported an error for the
+        subscription. When the connection could not be (re-)established, the
+        `PortalConnection` exception is raised.
+        """
+        payload = GraphQLRequest(api_url=self.api_url, query=query, variables=variables,
+                                 fragments=fragments).payload()
+        ssl_context = self._ssl_context
+        if ssl_context is None and isinstance(self.transport, ConnectionPool):
+            ssl_context = self.transport.ssl_context
+
+        return Subscription(url or websocket_url(self.api_url), payload, token=self.token,
+                            ssl_context=ssl_context, keepalive=keepalive, reconnect=reconnect,
+                            datetime_fields=self._datetime_fields, schema=self._schema)
+
     def is_alive(self) -> bool:
         """Returns whether it is possible to communicate with API endpoint."""
         request = GraphQLRequest(
             api_url=self.api_url,
-            query='{__schema { queryType { name }}}'
+            query='{__schema { queryType { name }}}',
+            transport=self.transport
         )
 
         try:
@@ -145,3 +674,54 @@ class APIClient(APIAbstract):
             return 'Query' == result['data']['__schema']['queryType']['name']
         except (KeyError, PortalException):
             return False
+
+    def load_schema(self, cache: Union[SchemaCache, str, None] = None,
+                    refresh: bool = False,
+                    scalars: Iterable[str] = DEFAULT_DATETIME_SCALARS) -> dict:
+        """Introspects the complete schema of the API, and returns it as dictionary,
+        the value of `__schema`. From then on, only values of fields of which the type
+        is one of the scalar types `scalars` are decoded as timestamps; strings in other
+        fields are left alone, even when they look like timestamps. Fields are looked up
+        following the selections of each query, so aliases and fragments are understood.
+        This replaces `datetime_fields`; see `dcso.portal.util.schema.Schema`.
+
+        When `cache`, a `dcso.portal.util.schema.SchemaCache` or path of a file, is
+        given, the schema is introspected only when the cache holds no schema of this
+        API, or it is too old, or when `refresh` is True. For example:
+
+            apic = APIClient(api_url)
+            apic.load_schema(cache='portal-schema.json')
+
+        Raises `PortalAPIError` When the GraphQL API endpoint returned an error.
+        When there was an issue with the request itself, or the response holds no
+        schema, the `PortalAPIRequest` exception is raised.
+        """
+        if isinstance(cache, str):
+            cache = SchemaCache(cache)
+
+        schema = None
+        if cache is not None and not refresh:
+            schema = cache.load(self.api_url)
+
+        if schema is None:
+            # default values in the schema are not decoded
+            request = GraphQLRequest(api_url=self.api_url, query=INTROSPECTION_QUERY,
+                                     token=self.token, transport=self.transport,
+                                     datetime_fields=frozenset())
+            schema = introspection_schema(request.execute_dict().get('data'))
+            if cache is not None:
+                cache.save(self.api_url, schema)
+
+        self._schema = Schema(schema, scalars)
+        return schema
+
+
+def _batch_result(execute) -> Any:
+    """Returns the data of the response returned by `execute`, or the
+    exception raised."""
+    try:
+        return execute()['data']
+    except KeyError as exc:
+        return PortalAPIRequest(f"API request contained unusable error definition {exc}")
+    except PortalException as exc:
+        return exc
@@ -92,7 +92,7 @@ class Auth(RBACMixin):
             }
         }
 
-        request = GraphQLRequest(api_url=self._api.api_url,
+        request = GraphQLRequest(api_url=self._api.api_url, transport=self._api.transport,
                                  query=_GRAPHQL_MUTATION_AUTHN, variables=variables)
 
         try:
@@ -141,7 +141,7 @@ class Auth(RBACMixin):
             }
         }
 
-        request = GraphQLRequest(api_url=self._api.api_url,
+        request = GraphQLRequest(api_url=self._api.api_url, transport=self._api.transport,
                                  query=_GRAPHQL_MUTATION_AUTHN, variables=variables)
 
         try:
@@ -181,7 +181,7 @@ class Auth(RBACMixin):
             }
         }
 
-        request = GraphQLRequest(api_url=self._api.api_url,
+        request = GraphQLRequest(api_url=self._api.api_url, transport=self._api.transport,
                                  query=_GRAPHQL_MUTATION_AUTHN, variables=variables)
 
         try:
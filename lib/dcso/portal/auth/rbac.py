@@ -102,6 +102,7 @@ class RBACMixin(ServiceAbstract):
         }
 
         request = GraphQLRequest(api_url=self._api.api_url, token=self._api.token,
+                                 transport=self._api.transport,
                                  query=_GRAPHQL_QUERY_USER_SERVICE_PERMISSIONS, variables=variables)
 
         try:
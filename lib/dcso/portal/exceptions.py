@@ -27,6 +27,11 @@ class PortalAPIRequest(PortalConnection):
     pass
 
 
+class PortalTimeout(PortalAPIRequest):
+    """Exception raised when a request did not complete in time."""
+    pass
+
+
 class PortalAPIError(GlosomException, PortalException):
     """Exception raised with the error received from the API."""
 
@@ -6,7 +6,12 @@ import unittest
 from unittest.mock import patch
 
 from . import api
-from .exceptions import PortalConfiguration
+from .abstracts import APIAbstract
+from .exceptions import PortalAPIError, PortalAPIRequest, PortalConfiguration, PortalException, PortalTimeout
+from .util.retry import RetryPolicy
+from .util.standin import StandInTransport, generate_connection
+from .util.test_connection import start_test_server, stop_test_server
+from .util.timeout import Deadline
 
 _TEST_API_URI = 'http://127.0.0.1:9170'
 
@@ -65,6 +70,145 @@ class TestAPIClient(unittest.TestCase):
 
         self.assertEqual(exp['arrayOfNonDicts'], fields.arrayOfNonDicts)
 
+    def test_keep_alive(self):
+        server = start_test_server({'data': {'ping': 'pong'}})
+        try:
+            with api.APIClient(api_url=server.url) as client:
+                self.assertIs(client.transport, client.auth._api.transport)
+                for _ in range(3):
+                    self.assertEqual('pong', client.execute_graphql_dict('{ ping }')['ping'])
+                self.assertEqual(1, client.stats.connections_opened)
+
+            self.assertTrue(client.transport.closed)
+            self.assertRaises(PortalAPIRequest, client.execute_graphql, '{ ping }')
+        finally:
+            stop_test_server(server)
+
+    def test_iter_path(self):
+        edges = [{'node': {'id': str(i), 'occurredOn': '2021-02-08T10:00:00Z'}} for i in range(100)]
+        server = start_test_server({'data': {'alerts': {'edges': edges}}})
+        server.content_encoding = 'gzip'
+        try:
+            with api.APIClient(api_url=server.url) as client:
+                result = list(client.iter_path('{ alerts { edges { node { id } } } }', path='alerts.edges'))
+                self.assertEqual([e['node']['id'] for e in edges], [e['node']['id'] for e in result])
+                self.assertEqual(datetime(2021, 2, 8, 10, tzinfo=timezone.utc), result[0]['node']['occurredOn'])
+
+                # connection is reused after iterating completely
+                list(client.iter_path('{ alerts { edges { node { id } } } }', path='alerts.edges'))
+                self.assertEqual(1, client.stats.connections_opened)
+
+                server.response = {'data': {'alerts': None}, 'errors': [{'message': 'not authorized'}]}
+                with self.assertRaises(PortalAPIError) as ctx:
+                    list(client.iter_path('{ alerts { edges { node { id } } } }', path='alerts.edges'))
+                self.assertEqual("not authorized", str(ctx.exception))
+        finally:
+            stop_test_server(server)
+
+    def test_timeout(self):
+        server = start_test_server({'data': {'ping': 'pong'}})
+        server.delay = 0.3
+        try:
+            with api.APIClient(api_url=server.url, timeout=0.05, retry=RetryPolicy(max_attempts=1)) as client:
+                self.assertRaises(PortalTimeout, client.execute_graphql, '{ ping }')
+                self.assertEqual('pong', client.execute_graphql('{ ping }', timeout=1).ping)
+                self.assertRaises(PortalTimeout, client.execute_graphql_dict, '{ ping }',
+                                  timeout=1, deadline=Deadline(0.05))
+        finally:
+            stop_test_server(server)
+
+    def test_transport(self):
+        transport = StandInTransport(response=generate_connection('alerts', 5))
+        with api.APIClient(api_url='https://localhost/graphql', transport=transport) as client:
+            self.assertIs(transport, client.auth._api.transport)
+            client.token = 'secret'
+
+            result = client.execute_graphql('{ alerts { edges { node { id } } } }')
+            self.assertEqual(5, len(result.alerts.edges))
+            self.assertEqual(2021, result.alerts.edges[0].node.occurredOn.year)
+            self.assertEqual(5, len(list(client.iter_path('{ alerts { edges { node { id } } } }', 'alerts.edges'))))
+
+        self.assertTrue(transport.closed)
+        self.assertEqual(2, transport.stats.requests)
+
+    def test_execute_batch(self):
+        def answer(payload):
+            if payload['variables']['id'] == 'bad':
+                return {'data': None, 'errors': [{'message': 'not found'}]}
+            return {'data': {'user': {'id': payload['variables']['id']}}}
+
+        query = 'query ($id: ID!) { user(id: $id) { id } }'
+        operations = [(query, {'id': '1'}), (query, {'id': 'bad'}), (query, {'id': '3'})]
+
+        with self.subTest("batching"):
+            transport = StandInTransport(responder=lambda p: [answer(r) for r in p])
+            client = api.APIClient(api_url='https://localhost/graphql', transport=transport)
+
+            results = client.execute_batch(operations, return_exceptions=True)
+            self.assertEqual({'user': {'id': '1'}}, results[0])
+            self.assertIsInstance(results[1], PortalAPIError)
+            self.assertEqual({'user': {'id': '3'}}, results[2])
+            self.assertEqual(1, transport.stats.requests)
+            self.assertEqual(3, len(transport.requests[0]))
+
+            with self.assertRaises(PortalAPIError):
+                client.execute_batch(operations)
+
+        with self.subTest("fallback"):
+            def single(payload):
+                if isinstance(payload, list):
+                    return {'errors': [{'message': 'Must provide query string.'}]}
+                return answer(payload)
+
+            transport = StandInTransport(responder=single)
+            client = api.APIClient(api_url='https://localhost/graphql', transport=transport)
+
+            for _ in range(2):
+                results = client.execute_batch(operations, return_exceptions=True)
+                self.assertEqual({'user': {'id': '1'}}, results[0])
+                self.assertIsInstance(results[1], PortalException)
+                self.assertEqual({'user': {'id': '3'}}, results[2])
+
+            # batching is tried once
+            self.assertEqual(1 + 2 * 3, transport.stats.requests)
+
+        with self.subTest("not responses"):
+            transport = StandInTransport(responder=lambda p: ['ok'] * len(p) if isinstance(p, list) else answer(p))
+            client = api.APIClient(api_url='https://localhost/graphql', transport=transport)
+            results = client.execute_batch(operations, return_exceptions=True)
+            self.assertEqual({'user': {'id': '3'}}, results[2])
+            self.assertFalse(client._batching)
+
+        for status in (401, 403, 429):
+            with self.subTest("failed", status=status):
+                transport = StandInTransport(responder=lambda p: [answer(r) for r in p], status=status)
+                client = api.APIClient(api_url='https://localhost/graphql', transport=transport,
+                                       retry=RetryPolicy(max_attempts=1))
+                self.assertRaises(PortalAPIRequest, client.execute_batch, operations)
+                self.assertEqual(1, transport.stats.requests)
+                self.assertTrue(client._batching)
+
+        with self.subTest("rejected"):
+            server = start_test_server({'data': {'ping': 'pong'}}, status=400)
+            server.statuses = [400, 200, 200]
+            try:
+                with api.APIClient(api_url=server.url) as client:
+                    self.assertEqual([{'ping': 'pong'}] * 2, client.execute_batch(['{ ping }', '{ ping }']))
+            finally:
+                stop_test_server(server)
+
+
+class TestAPIAbstract(unittest.TestCase):
+    def test_without_transport(self):
+        class Client(APIAbstract):
+            api_url = 'https://localhost/graphql'
+            token = ''
+
+            def execute_graphql(self, query, variables=None, fragments=None):
+                pass
+
+        self.assertIsNone(Client().transport)
+
 
 if __name__ == '__main__':
     unittest.main()
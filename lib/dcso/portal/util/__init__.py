@@ -5,7 +5,25 @@ Various helper functions and classes.
 """
 
 __pdoc__ = {
+    'test_cache': False,
+    'test_checkpoint': False,
+    'test_compression': False,
+    'test_connection': False,
+    'test_document': False,
     'test_graphql': False,
+    'test_incremental': False,
+    'test_jsonstream': False,
+    'test_loader': False,
+    'test_pagination': False,
+    'test_persisted': False,
+    'test_ratelimit': False,
+    'test_retry': False,
+    'test_schema': False,
+    'test_standin': False,
+    'test_subscription': False,
+    'test_timeout': False,
     'test_temporal': False,
     'test_utils': False,
+    'test_views': False,
+    'test_watcher': False,
 }
@@ -0,0 +1,190 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+In-memory cache of responses of read-only GraphQL queries.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, Optional, Tuple
+
+from .document import tokens
+from .graphql import GraphQLJSONEncoder
+
+DEFAULT_CACHE_MAX_BYTES = 16 * 1024 * 1024
+"""Default maximum size, in bytes, of all responses held by a cache."""
+
+DEFAULT_CACHE_TTL = 60.0
+"""Default number of seconds a response is cached."""
+
+_WORD_CHARS = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_.+-')
+
+
+class CacheStats:
+    """Counters describing the use of a `ResponseCache`:
+
+    * `hits`: responses found in the cache
+    * `misses`: responses not found, or expired
+    * `stores`: responses added to the cache
+    * `evictions`: responses removed to make room for others
+    * `invalidations`: responses removed using `ResponseCache.invalidate`
+    """
+
+    _counters = ('hits', 'misses', 'stores', 'evictions', 'invalidations')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        for name in self._counters:
+            setattr(self, name, 0)
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {name: getattr(self, name) for name in self._counters}
+
+
+class ResponseCache:
+    """ResponseCache keeps responses of GraphQL queries in memory, so executing
+    the same query again does not need a request with the API.
+
+    Responses are cached per query, variables, and token: the query is normalized
+    first, so that differences in whitespace and comments do not matter, and the
+    variables are encoded with sorted keys. The token is only kept as hash.
+
+    Responses are kept for `default_ttl` seconds, unless another TTL was set for
+    the query using `set_ttl`. When all responses together take more than
+    `max_bytes`, the least recently used are evicted. Only responses without
+    errors are cached.
+
+    Use with `dcso.portal.APIClient` using its `cache` argument. Mutations are
+    never cached; executing them invalidates cached responses.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+                 default_ttl: float = DEFAULT_CACHE_TTL):
+        self.max_bytes: int = max_bytes
+        self.default_ttl: float = default_ttl
+        self.stats: CacheStats = CacheStats()
+
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[Hashable, Tuple[float, bytes]]' = OrderedDict()
+        self._size: int = 0
+        self._ttls: Dict[str, float] = {}
+        self._token_ids: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """Number of bytes of all responses held."""
+        return self._size
+
+    def set_ttl(self, query: str, ttl: Optional[float]) -> None:
+        """Sets the number of seconds responses of `query` are cached. With 0, the
+        query is not cached; with None, the default is used again."""
+        query = normalize_query(query)
+        with self._lock:
+            if ttl is None:
+                self._ttls.pop(query, None)
+            else:
+                self._ttls[query] = ttl
+
+    def key(self, query: str, variables: Optional[dict] = None, token: Optional[str] = None) -> Hashable:
+        """Returns the key under which the response of `query`, executed with
+        `variables` and `token`, is cached."""
+        if variables:
+            encoded = json.dumps(variables, sort_keys=True, separators=(',', ':'), cls=GraphQLJSONEncoder)
+        else:
+            encoded = ''
+        return normalize_query(query), encoded, self._token_id(token)
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        """Returns the cached response, or None when there is none, or it expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, response = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.stats.increment('hits')
+                    return response
+                self._remove(key)
+
+        self.stats.increment('misses')
+        return None
+
+    def put(self, key: Hashable, response: bytes) -> None:
+        """Caches `response` under `key`, evicting least recently used responses
+        when needed. Responses larger than `max_bytes` are not cached."""
+        ttl = self._ttls.get(key[0], self.default_ttl)
+        if ttl <= 0 or len(response) > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, response)
+            self._size += len(response)
+            self.stats.increment('stores')
+
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.stats.increment('evictions')
+
+    def invalidate(self, query: Optional[str] = None) -> int:
+        """Removes the cached responses of `query`, whatever the variables or token,
+        or all responses when `query` is None. Returns how many were removed."""
+        with self._lock:
+            if query is None:
+                keys = list(self._entries)
+            else:
+                query = normalize_query(query)
+                keys = [key for key in self._entries if key[0] == query]
+            for key in keys:
+                self._remove(key)
+
+        self.stats.increment('invalidations', len(keys))
+        return len(keys)
+
+    def invalidate_queries(self, queries: Optional[Iterable[str]] = None) -> int:
+        """Removes the cached responses of each of `queries`, or all responses when
+        `queries` is None, as done after executing a mutation. Returns how many
+        were removed."""
+        if queries is None:
+            return self.invalidate()
+        return sum(self.invalidate(query) for query in queries)
+
+    def _remove(self, key: Hashable) -> None:
+        _, response = self._entries.pop(key)
+        self._size -= len(response)
+
+    def _token_id(self, token: Optional[str]) -> str:
+        if not token:
+            return ''
+        token_id = self._token_ids.get(token)
+        if token_id is None:
+            token_id = hashlib.sha256(token.encode('utf-8')).hexdigest()
+            with self._lock:
+                if len(self._token_ids) > 64:
+                    self._token_ids.clear()
+                self._token_ids[token] = token_id
+        return token_id
+
+
+def normalize_query(query: str) -> str:
+    """Returns `query` without comments and insignificant whitespace and commas,
+    so that queries only differing in formatting are the same."""
+    parts = []
+    for token in tokens(query):
+        first = token[0]
+        if parts and parts[-1][-1] in _WORD_CHARS and first in _WORD_CHARS and parts[-1] != '...':
+            parts.append(' ')
+        parts.append(token)
+    return ''.join(parts)
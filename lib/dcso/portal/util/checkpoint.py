@@ -0,0 +1,117 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+Durable checkpoints of paginated iteration, allowing to resume it after
+a failure instead of starting over.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from ..exceptions import PortalException
+from .cache import normalize_query
+from .graphql import GraphQLJSONEncoder
+
+
+class Checkpoint:
+    """Checkpoint stores the progress of iterating over the pages of a
+    connection in the file found at `path`: the cursor of the next page, the
+    number of nodes done, and a fingerprint of the query.
+
+    The file is replaced atomically, and the replacement is flushed to disk, so
+    it always holds a complete checkpoint, even when the process or system dies
+    while saving it. A checkpoint is only used when
+    its fingerprint matches, so changing the query or its variables starts over.
+
+    Use with `dcso.portal.APIClient.paginate` using its `checkpoint` argument.
+    """
+
+    def __init__(self, path: str):
+        self.path: str = path
+        self.fingerprint: Optional[str] = None
+        self.cursor: Optional[str] = None
+        self.count: int = 0
+
+    def load(self, fingerprint: str) -> bool:
+        """Loads the checkpoint when the file exists and its fingerprint matches
+        `fingerprint`, and returns whether it did. Otherwise, progress is reset."""
+        self.fingerprint, self.cursor, self.count = fingerprint, None, 0
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as fp:
+                stored = json.load(fp)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as exc:
+            raise PortalException(f"failed reading checkpoint {self.path}: {exc}")
+
+        if not isinstance(stored, dict) or stored.get('fingerprint') != fingerprint:
+            return False
+
+        self.cursor = stored.get('cursor')
+        self.count = stored.get('count') or 0
+        return True
+
+    def save(self, cursor: str, count: int) -> None:
+        """Stores `cursor` as cursor of the next page, and `count` as the number of
+        nodes done, replacing the file atomically."""
+        self.cursor, self.count = cursor, count
+        data = json.dumps({
+            'fingerprint': self.fingerprint,
+            'cursor': cursor,
+            'count': count,
+            'updatedOn': datetime.now(timezone.utc).isoformat(),
+        })
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.checkpoint-', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as fp:
+                fp.write(data)
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.replace(tmp_path, self.path)
+            fsync_directory(directory)
+        except OSError as exc:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise PortalException(f"failed writing checkpoint {self.path}: {exc}")
+
+    def clear(self) -> None:
+        """Removes the file, for example because iteration finished."""
+        self.cursor, self.count = None, 0
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            raise PortalException(f"failed removing checkpoint {self.path}: {exc}")
+
+
+def fsync_directory(directory: str) -> None:
+    """Flushes `directory` to disk, so a file renamed into it stays renamed after a
+    crash. Does nothing on platforms which cannot open directories, like Windows."""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fingerprint(query: str, connection_path: str, variables: Optional[dict] = None,
+                fragments: Optional[List[str]] = None) -> str:
+    """Returns a fingerprint identifying the iteration over the connection found
+    using `connection_path` of `query`, executed with `variables` and `fragments`.
+    Differences in formatting of the query do not matter."""
+    identity = json.dumps([normalize_query(query), connection_path, variables or {},
+                           [normalize_query(f) for f in fragments or []]],
+                          sort_keys=True, separators=(',', ':'), cls=GraphQLJSONEncoder)
+    return hashlib.sha256(identity.encode('utf-8')).hexdigest()
@@ -0,0 +1,94 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+Helpers for (de)compressing HTTP message bodies using the standard
+library's `zlib` module.
+"""
+
+import gzip
+import zlib
+from typing import Optional
+
+from ..exceptions import PortalAPIRequest
+
+ACCEPT_ENCODING = 'gzip, deflate'
+"""Value of the Accept-Encoding header sent when responses may be compressed."""
+
+_GZIP_LEVEL = 6
+
+
+class StreamDecompressor:
+    """Decompresses a HTTP message body, encoded using `encoding`, chunk by chunk.
+
+    Supported encodings are 'gzip' (including 'x-gzip') and 'deflate'. For the
+    latter, both zlib-wrapped and raw deflate streams are accepted since servers
+    do not agree on what it means.
+
+    Raises `PortalAPIRequest` when the encoding is not supported, or when
+    decompressing fails.
+    """
+
+    def __init__(self, encoding: str):
+        self.encoding: str = encoding.strip().lower()
+        if self.encoding in ('gzip', 'x-gzip'):
+            self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif self.encoding == 'deflate':
+            self._obj = zlib.decompressobj()
+        else:
+            raise PortalAPIRequest(f"API response uses unsupported content encoding '{encoding}'")
+
+        self._first_chunk: bool = True
+
+    def decompress(self, data: bytes) -> bytes:
+        try:
+            try:
+                result = self._obj.decompress(data)
+            except zlib.error:
+                if not (self._first_chunk and self.encoding == 'deflate'):
+                    raise
+                # raw deflate stream without zlib header
+                self._obj = zlib.decompressobj(-zlib.MAX_WBITS)
+                result = self._obj.decompress(data)
+        except zlib.error as exc:
+            raise PortalAPIRequest(f"failed decompressing API response ({self.encoding}): {exc}")
+
+        if data:
+            self._first_chunk = False
+        return result
+
+    def flush(self) -> bytes:
+        try:
+            return self._obj.flush()
+        except zlib.error as exc:
+            raise PortalAPIRequest(f"failed decompressing API response ({self.encoding}): {exc}")
+
+
+def decompressor_for(content_encoding: Optional[str]) -> Optional[StreamDecompressor]:
+    """Returns a `StreamDecompressor` for the given Content-Encoding header value,
+    or None when the body is not encoded."""
+    if not content_encoding or content_encoding.strip().lower() == 'identity':
+        return None
+    return StreamDecompressor(content_encoding)
+
+
+def gzip_body(body: bytes) -> bytes:
+    """Returns the request `body` compressed using gzip."""
+    return gzip.compress(body, compresslevel=_GZIP_LEVEL)
+
+
+def rejects_gzip_body(status: int, headers) -> bool:
+    """Returns whether a response with HTTP `status` and `headers` tells us
+    that the server does not accept gzip-compressed request bodies.
+
+    This is the case with status 415 (Unsupported Media Type), or with any other
+    client error when the server lists the encodings it does accept, and gzip is
+    not among them (RFC 7694).
+    """
+    if status == 415:
+        return True
+
+    accepted = headers.get('Accept-Encoding')
+    if 400 <= status < 500 and accepted is not None:
+        return 'gzip' not in [e.split(';')[0].strip().lower() for e in accepted.split(',')]
+
+    return False
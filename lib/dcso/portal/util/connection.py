@@ -0,0 +1,541 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+Keep-alive HTTP connection pooling used by `dcso.portal.APIClient` when
+communicating with the DCSO Portal API.
+"""
+
+import http.client
+import select
+import selectors
+import socket
+import ssl
+import threading
+import time
+from collections import deque
+from os import environ
+from typing import Callable, Dict, Optional, Tuple, Union
+from urllib.parse import ParseResult, urlparse
+
+from ..exceptions import PortalAPIRequest, PortalTimeout
+from .compression import ACCEPT_ENCODING, decompressor_for, gzip_body, rejects_gzip_body
+from .ratelimit import RateLimiter
+from .retry import RetryPolicy, parse_retry_after
+from .timeout import Deadline, Timeout
+from .transport import Transport, TransportStats
+
+_ENV_SKIP_TLS_VERIFY = "DCSO_PORTAL_SKIP_TLS_VERIFY"
+
+DEFAULT_POOL_MAXSIZE = 10
+"""Default maximum of idle connections kept per host."""
+
+DEFAULT_POOL_IDLE_TIMEOUT = 60.0
+"""Default number of seconds an idle connection is kept before it is evicted."""
+
+_READ1_SIZE = 64 * 1024
+
+# exceptions indicating that a kept-alive connection was closed by the peer
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                            BrokenPipeError, ConnectionResetError, ConnectionAbortedError)
+
+
+class PooledResponse:
+    """Response of a request done through a `ConnectionPool`.
+
+    The underlying connection is handed back to the pool once the body has been
+    read completely. When the response is closed before this, the connection is
+    discarded since it cannot be reused.
+
+    When `decompress` is True, a body encoded using gzip or deflate is decompressed
+    transparently while reading.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', key: tuple,
+                 conn: http.client.HTTPConnection, response: http.client.HTTPResponse,
+                 decompress: bool = False):
+        self._pool = pool
+        self._key = key
+        self._conn: Optional[http.client.HTTPConnection] = conn
+        self._response = response
+
+        self.status: int = response.status
+        self.reason: str = response.reason
+        self.headers = response.headers
+        self._on_release: Optional[Callable[[], None]] = None
+
+        self._decompressor = None
+        if decompress:
+            try:
+                self._decompressor = decompressor_for(response.headers.get('Content-Encoding'))
+            except PortalAPIRequest:
+                self.close()
+                raise
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        """Reads and returns at most `amt` bytes of the body, or everything
+        when `amt` is None. An empty bytes object signals end of the body.
+
+        When the body is compressed, `amt` limits the number of bytes read from
+        the wire; more bytes might be returned.
+        """
+        return self._read(amt, partial=False)
+
+    def read1(self, amt: int = _READ1_SIZE) -> bytes:
+        """Reads and returns at most `amt` bytes of the body, returning as soon
+        as some bytes are available instead of waiting for `amt` bytes. This is
+        needed for responses streamed in parts, such as multipart/mixed."""
+        return self._read(amt, partial=True)
+
+    def _read(self, amt: Optional[int], partial: bool) -> bytes:
+        while True:
+            data = self._read_raw(amt, partial)
+            if self._decompressor is None:
+                self._pool.stats.increment('bytes_decoded', len(data))
+                return data
+
+            if data:
+                decoded = self._decompressor.decompress(data)
+            else:
+                decoded = self._decompressor.flush()
+            self._pool.stats.increment('bytes_decoded', len(decoded))
+
+            if amt is None or decoded or not data:
+                if amt is None and data:
+                    decoded += self._decompressor.flush()
+                return decoded
+
+    def _read_raw(self, amt: Optional[int], partial: bool = False) -> bytes:
+        try:
+            data = self._response.read1(amt) if partial else self._response.read(amt)
+        except socket.timeout:
+            self.close()
+            raise PortalTimeout("timed out reading API response")
+        except (OSError, http.client.HTTPException) as exc:
+            self.close()
+            raise PortalAPIRequest(f"failed reading API response: {exc}")
+
+        self._pool.stats.increment('bytes_received', len(data))
+        if not data or self._response.isclosed():
+            self.release()
+        return data
+
+    def release(self) -> None:
+        """Hands the connection back to the pool when the body was read completely,
+        otherwise the connection is closed."""
+        if self._conn is None:
+            return
+
+        conn, self._conn = self._conn, None
+        if self._response.isclosed() and not self._response.will_close:
+            self._pool._put_connection(self._key, conn)
+        else:
+            conn.close()
+        self._released()
+
+    def close(self) -> None:
+        """Closes the response, discarding the connection unless the body was
+        already read completely."""
+        if self._conn is None:
+            return
+
+        if self._response.isclosed():
+            self.release()
+        else:
+            conn, self._conn = self._conn, None
+            conn.close()
+            self._released()
+
+    def _call_on_release(self, callback: Callable[[], None]) -> None:
+        """Calls `callback` once the connection is released or closed."""
+        if self._conn is None:
+            callback()
+        else:
+            self._on_release = callback
+
+    def _released(self) -> None:
+        callback, self._on_release = self._on_release, None
+        if callback is not None:
+            callback()
+
+    def __enter__(self) -> 'PooledResponse':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+class ConnectionPool(Transport):
+    """ConnectionPool keeps HTTP/1.1 connections alive, per host, so they
+    can be reused for subsequent requests. This saves TCP and TLS handshakes
+    when many requests are done against the same API endpoint.
+
+    At most `maxsize` idle connections are kept per host; any extra connection
+    is closed when released. Connections which are idle for longer than
+    `idle_timeout` seconds are evicted.
+
+    All HTTPS connections share `ssl_context`, which defaults to the context
+    returned by `create_ssl_context`. The TLS session of a host is remembered
+    so that new connections to the same host can resume it, using an
+    abbreviated handshake.
+
+    When `decompress` is True, the API is told that responses may be compressed
+    using gzip or deflate, and these are decompressed transparently.
+
+    Request bodies of at least `compress_min_size` bytes are compressed using
+    gzip; by default, they are not compressed. When a host rejects a compressed
+    body, the request is sent again uncompressed, and compression is switched
+    off for this host.
+
+    Requests are limited in time using `timeout`, which defaults to `Timeout()`.
+
+    Failed requests are attempted again following the `retry` policy, if given.
+
+    When a `rate_limit` is given, each attempt waits for its turn; see `RateLimiter`.
+    The rate limiter is told when the API throttles us using status 429.
+
+    The pool is thread-safe and can be used as context manager, which will
+    close all connections on exit.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_POOL_MAXSIZE,
+                 idle_timeout: float = DEFAULT_POOL_IDLE_TIMEOUT,
+                 ssl_context: Optional[ssl.SSLContext] = None,
+                 decompress: bool = True,
+                 compress_min_size: Optional[int] = None,
+                 retry: Optional[RetryPolicy] = None,
+                 rate_limit: Optional[RateLimiter] = None,
+                 timeout: Optional[Timeout] = None):
+        self.maxsize: int = maxsize
+        self.idle_timeout: float = idle_timeout
+        self.decompress: bool = decompress
+        self.compress_min_size: Optional[int] = compress_min_size
+        self.retry: Optional[RetryPolicy] = retry
+        self.rate_limit: Optional[RateLimiter] = rate_limit
+        self.timeout: Timeout = timeout or Timeout()
+        self.stats: TransportStats = TransportStats()
+        self._ssl_context: Optional[ssl.SSLContext] = ssl_context
+
+        self._lock = threading.Lock()
+        self._idle: Dict[tuple, deque] = {}
+        self._tls_sessions: Dict[tuple, ssl.SSLSession] = {}
+        self._gzip_rejected: set = set()
+        self._closed: bool = False
+
+    @property
+    def ssl_context(self) -> ssl.SSLContext:
+        """SSL context used for all HTTPS connections of this pool."""
+        with self._lock:
+            if self._ssl_context is None:
+                # loading CA certificates is expensive; only do it when needed
+                self._ssl_context = create_ssl_context()
+            return self._ssl_context
+
+    def __enter__(self) -> 'ConnectionPool':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def close(self) -> None:
+        """Closes all idle connections. Connections still in use are closed
+        when they are released."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, {}
+
+        for connections in idle.values():
+            for conn, _ in connections:
+                conn.close()
+
+    def evict_idle(self) -> int:
+        """Closes connections which were idle for longer than `idle_timeout`
+        seconds, and returns how many were evicted."""
+        deadline = time.monotonic() - self.idle_timeout
+        evicted = []
+        with self._lock:
+            for connections in self._idle.values():
+                while connections and connections[0][1] < deadline:
+                    evicted.append(connections.popleft()[0])
+
+        for conn in evicted:
+            conn.close()
+
+        if evicted:
+            self.stats.increment('connections_evicted', len(evicted))
+        return len(evicted)
+
+    def request(self, method: str, url: Union[ParseResult, str],
+                body: Optional[bytes] = None, headers: Optional[dict] = None,
+                idempotent: bool = True, timeout: Optional[Timeout] = None,
+                deadline: Optional[Deadline] = None) -> PooledResponse:
+        """Sends the request using a pooled connection, and returns the response.
+
+        When the pool has a `retry` policy, the request is attempted again when
+        the connection failed or the response status asks for it. Requests which
+        are not `idempotent` are only retried when the policy allows this.
+
+        The `timeout` overrides the pool's timeout for this request. When a
+        `deadline` is given, the request, including retries, is not allowed to
+        take longer than the time remaining.
+
+        Raises `PortalTimeout` when the request timed out, and `PortalAPIRequest`
+        when the request could not be sent or no response was received.
+        """
+        if self._closed:
+            raise PortalAPIRequest("connection pool is closed")
+
+        if isinstance(url, str):
+            url = urlparse(url)
+
+        key = _pool_key(url)
+        path = request_target(url)
+        headers = dict(headers or {})
+        if self.decompress:
+            headers.setdefault('Accept-Encoding', ACCEPT_ENCODING)
+
+        timeout = timeout or self.timeout
+        if timeout.total is not None:
+            deadline = Deadline.earliest(deadline, Deadline(timeout.total))
+
+        self.stats.increment('requests')
+        self.evict_idle()
+
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            if deadline is not None:
+                deadline.check()
+            attempt += 1
+            self.stats.increment('attempts')
+            if self.rate_limit is not None:
+                self.rate_limit.acquire()
+            try:
+                response = self._request_once(key, method, path, body, headers, idempotent, timeout, deadline)
+            except PortalAPIRequest:
+                if self.rate_limit is not None:
+                    self.rate_limit.release()
+                wait = self.retry.next_wait(attempt, started, idempotent) if self.retry else None
+                if wait is None or (deadline is not None and wait >= deadline.remaining()):
+                    raise
+            else:
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                self._feedback(response.status, retry_after)
+                if self.rate_limit is not None:
+                    response._call_on_release(self.rate_limit.release)
+
+                if self.retry is None or response.status not in self.retry.statuses:
+                    return response
+
+                wait = self.retry.next_wait(attempt, started, idempotent, retry_after)
+                if wait is None or (deadline is not None and wait >= deadline.remaining()):
+                    return response
+                response.read()
+                response.close()
+
+            self.stats.increment('retries')
+            time.sleep(wait)
+
+    def _feedback(self, status: int, retry_after: Optional[float]) -> None:
+        if status == 429:
+            self.stats.increment('throttled')
+            if self.rate_limit is not None:
+                self.rate_limit.throttled(retry_after)
+        elif status < 400 and self.rate_limit is not None:
+            self.rate_limit.succeeded()
+
+    def _request_once(self, key: tuple, method: str, path: str, body: Optional[bytes],
+                      headers: dict, idempotent: bool, timeout: Timeout,
+                      deadline: Optional[Deadline]) -> PooledResponse:
+        if body and self._should_compress(key, body):
+            response = self._send(key, method, path, gzip_body(body),
+                                  dict(headers, **{'Content-Encoding': 'gzip'}), len(body),
+                                  idempotent, timeout, deadline)
+            if not rejects_gzip_body(response.status, response.headers):
+                return response
+
+            # drain so the connection can be reused, and try again uncompressed
+            response.read()
+            with self._lock:
+                self._gzip_rejected.add(key)
+            self.stats.increment('compressed_bodies_rejected')
+
+        return self._send(key, method, path, body, headers, len(body or b''), idempotent, timeout, deadline)
+
+    def _should_compress(self, key: tuple, body: bytes) -> bool:
+        if self.compress_min_size is None or len(body) < self.compress_min_size:
+            return False
+        with self._lock:
+            return key not in self._gzip_rejected
+
+    def _send(self, key: tuple, method: str, path: str, body: Optional[bytes],
+              headers: dict, encoded_size: int, idempotent: bool, timeout: Timeout,
+              deadline: Optional[Deadline]) -> PooledResponse:
+        self.stats.increment('bytes_encoded', encoded_size)
+        self.stats.increment('bytes_sent', len(body or b''))
+
+        connect_timeout, read_timeout = timeout.connect, timeout.read
+        if deadline is not None:
+            connect_timeout, read_timeout = deadline.limit(connect_timeout), deadline.limit(read_timeout)
+            # when the deadline passed, the timeouts are 0, which would make the socket non-blocking
+            deadline.check()
+
+        while True:
+            conn = self._get_connection(key)
+            reused = conn is not None
+            if conn is None:
+                conn = self._new_connection(key)
+
+            sent = False
+            try:
+                if conn.sock is None:
+                    conn.timeout = connect_timeout
+                    conn.connect()
+                conn.sock.settimeout(read_timeout)
+                conn.request(method, path, body=body, headers=headers)
+                sent = True
+                response = conn.getresponse()
+            except socket.timeout:
+                conn.close()
+                raise PortalTimeout("timed out waiting for API")
+            except _STALE_CONNECTION_ERRORS as exc:
+                conn.close()
+                if reused and (idempotent or not sent):
+                    # peer closed the kept-alive connection; try again, unless the peer
+                    # might have received a request which must not be sent twice
+                    continue
+                raise PortalAPIRequest(str(exc))
+            except (OSError, http.client.HTTPException) as exc:
+                conn.close()
+                raise PortalAPIRequest(str(exc))
+
+            if reused:
+                self.stats.increment('connections_reused')
+            return PooledResponse(self, key, conn, response, decompress=self.decompress)
+
+    def _get_connection(self, key: tuple) -> Optional[http.client.HTTPConnection]:
+        with self._lock:
+            try:
+                conn, _ = self._idle[key].pop()
+            except (KeyError, IndexError):
+                return None
+
+        if conn.sock is None or _is_dropped(conn.sock):
+            # closed by us or by the peer
+            conn.close()
+            return None
+        return conn
+
+    def _put_connection(self, key: tuple, conn: http.client.HTTPConnection) -> None:
+        self._save_tls_session(key, conn)
+
+        with self._lock:
+            if not self._closed and conn.sock is not None:
+                connections = self._idle.setdefault(key, deque())
+                if len(connections) < self.maxsize:
+                    connections.append((conn, time.monotonic()))
+                    return
+
+        conn.close()
+
+    def _new_connection(self, key: tuple) -> http.client.HTTPConnection:
+        scheme, host, port = key
+        self.stats.increment('connections_opened')
+        if scheme == 'https':
+            return _ResumableHTTPSConnection(self, key, host, port, context=self.ssl_context)
+        return http.client.HTTPConnection(host, port)
+
+    def _tls_session(self, key: tuple) -> Optional[ssl.SSLSession]:
+        with self._lock:
+            return self._tls_sessions.get(key)
+
+    def _save_tls_session(self, key: tuple, conn: http.client.HTTPConnection) -> None:
+        # with TLS 1.3 the session ticket arrives after the handshake, which
+        # is why we take the session when the connection is released
+        session = getattr(conn.sock, 'session', None)
+        if session is not None:
+            with self._lock:
+                self._tls_sessions[key] = session
+
+
+class _ResumableHTTPSConnection(http.client.HTTPSConnection):
+    """HTTPS connection resuming the TLS session stored in the pool for the host."""
+
+    def __init__(self, pool: ConnectionPool, key: tuple, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool = pool
+        self._pool_key = key
+
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+
+        server_hostname = self._tunnel_host or self.host
+        session = self._pool._tls_session(self._pool_key)
+        try:
+            self.sock = self._context.wrap_socket(self.sock, server_hostname=server_hostname, session=session)
+        except ValueError:
+            # session is not usable with this context; do a full handshake
+            self.sock = self._context.wrap_socket(self.sock, server_hostname=server_hostname)
+
+        self._pool.stats.increment('tls_handshakes')
+        if self.sock.session_reused:
+            self._pool.stats.increment('tls_sessions_resumed')
+
+
+def _is_dropped(sock: socket.socket) -> bool:
+    """Returns whether the idle connection of `sock` was closed by the peer, or
+    is otherwise unusable: an idle connection has nothing to read."""
+    # select.select() fails for descriptors of FD_SETSIZE (1024) and above
+    try:
+        if hasattr(select, 'poll'):
+            poller = select.poll()
+            poller.register(sock, select.POLLIN)
+            return bool(poller.poll(0))
+        with selectors.DefaultSelector() as selector:
+            selector.register(sock, selectors.EVENT_READ)
+            return bool(selector.select(0))
+    except (OSError, ValueError):
+        return True
+
+
+def request_target(url: ParseResult) -> str:
+    """Returns the target of HTTP requests to `url`: its path, and its query
+    when it has one."""
+    path = url.path or '/'
+    if url.query:
+        path += '?' + url.query
+    return path
+
+
+def _pool_key(url: ParseResult) -> Tuple[str, str, int]:
+    scheme = url.scheme.lower()
+    port = url.port
+    if port is None:
+        port = 443 if scheme == 'https' else 80
+    return scheme, url.hostname, port
+
+
+def create_ssl_context(cafile: Optional[str] = None, capath: Optional[str] = None,
+                       skip_verify: Optional[bool] = None) -> ssl.SSLContext:
+    """Creates the SSL context used for HTTPS connections with the API.
+
+    Certificates are verified against the system's CA certificates, or against
+    those found in `cafile` or `capath` when given.
+
+    When `skip_verify` is None, the environment variable `DCSO_PORTAL_SKIP_TLS_VERIFY`
+    is checked, and when set, certificates are not verified. Note that the environment
+    is only read once, when creating the context.
+    """
+    ssl_ctx = ssl.create_default_context(cafile=cafile, capath=capath)
+
+    if skip_verify is None:
+        skip_verify = bool(environ.get(_ENV_SKIP_TLS_VERIFY))
+
+    if skip_verify:
+        ssl_ctx.check_hostname = False
+        ssl_ctx.verify_mode = ssl.CERT_NONE
+
+    return ssl_ctx
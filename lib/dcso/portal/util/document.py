@@ -0,0 +1,159 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+Minimal lexing and parsing of GraphQL documents, sufficient for finding the
+fields selected by queries and the directives they use.
+"""
+
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+from ..exceptions import PortalAPIRequest
+
+# strings, comments, ignored characters, spread operator, names, numbers, punctuators
+_RE_TOKENS = re.compile(r'"""(?:[^"\\]|\\.|"(?!""))*"""|"(?:[^"\\]|\\.)*"|#[^\n\r]*|[\s,\ufeff]+'
+                        r'|\.\.\.|[_A-Za-z][_0-9A-Za-z]*|-?[0-9][\w.+-]*|.')
+_IGNORED_START = frozenset('#, \t\r\n\ufeff')
+
+
+def tokens(document: str) -> List[str]:
+    """Returns the significant tokens of `document`: without white space,
+    commas, and comments. Strings are kept as one token, including quotes."""
+    return [token for token in _RE_TOKENS.findall(document) if token[0] not in _IGNORED_START]
+
+
+class Field(NamedTuple):
+    """Field selected by a query, of which the result is found using `key`,
+    the alias or name of the field."""
+    key: str
+    name: str
+    selections: List['Selection']
+
+
+class FragmentSpread(NamedTuple):
+    name: str
+
+
+class InlineFragment(NamedTuple):
+    type_condition: Optional[str]
+    selections: List['Selection']
+
+
+Selection = Union[Field, FragmentSpread, InlineFragment]
+
+
+class Operation(NamedTuple):
+    """Operation of a document: its `kind` is 'query', 'mutation', or 'subscription'."""
+    kind: str
+    name: Optional[str]
+    selections: List[Selection]
+
+
+class Document(NamedTuple):
+    operations: List[Operation]
+    fragments: Dict[str, Tuple[str, List[Selection]]]
+    """Selections of the fragments by name, with the type they apply to."""
+
+
+def parse_document(document: str) -> Document:
+    """Parses the operations and fragments of `document`. Arguments, variables, and
+    directives are skipped.
+
+    Raises `PortalAPIRequest` when the document cannot be parsed.
+    """
+    return _Parser(tokens(document)).document()
+
+
+class _Parser:
+    def __init__(self, document_tokens: List[str]):
+        self._tokens: List[str] = document_tokens
+        self._pos: int = 0
+
+    def _peek(self) -> Optional[str]:
+        return self._tokens[self._pos] if self._pos < len(self._tokens) else None
+
+    def _next(self) -> str:
+        token = self._peek()
+        if token is None:
+            raise PortalAPIRequest("GraphQL document ended unexpectedly")
+        self._pos += 1
+        return token
+
+    def _expect(self, expected: str) -> None:
+        token = self._next()
+        if token != expected:
+            raise PortalAPIRequest(f"GraphQL document has '{token}' where '{expected}' was expected")
+
+    def _skip_balanced(self, opening: str, closing: str) -> None:
+        self._expect(opening)
+        depth = 1
+        while depth:
+            token = self._next()
+            if token == opening:
+                depth += 1
+            elif token == closing:
+                depth -= 1
+
+    def _skip_directives(self) -> None:
+        while self._peek() == '@':
+            self._next()
+            self._next()
+            if self._peek() == '(':
+                self._skip_balanced('(', ')')
+
+    def document(self) -> Document:
+        operations, fragments = [], {}
+        while self._peek() is not None:
+            token = self._peek()
+            if token == '{':
+                operations.append(Operation('query', None, self.selection_set()))
+            elif token in ('query', 'mutation', 'subscription'):
+                self._next()
+                name = None
+                if self._peek() not in ('(', '@', '{'):
+                    name = self._next()
+                if self._peek() == '(':
+                    self._skip_balanced('(', ')')
+                self._skip_directives()
+                operations.append(Operation(token, name, self.selection_set()))
+            elif token == 'fragment':
+                self._next()
+                name = self._next()
+                self._expect('on')
+                type_condition = self._next()
+                self._skip_directives()
+                fragments[name] = (type_condition, self.selection_set())
+            else:
+                raise PortalAPIRequest(f"GraphQL document has unexpected '{token}'")
+        return Document(operations, fragments)
+
+    def selection_set(self) -> List[Selection]:
+        self._expect('{')
+        selections = []
+        while self._peek() != '}':
+            if self._peek() == '...':
+                self._next()
+                if self._peek() in ('on', '@', '{'):
+                    type_condition = None
+                    if self._peek() == 'on':
+                        self._next()
+                        type_condition = self._next()
+                    self._skip_directives()
+                    selections.append(InlineFragment(type_condition, self.selection_set()))
+                else:
+                    name = self._next()
+                    self._skip_directives()
+                    selections.append(FragmentSpread(name))
+                continue
+
+            key = name = self._next()
+            if self._peek() == ':':
+                self._next()
+                name = self._next()
+            if self._peek() == '(':
+                self._skip_balanced('(', ')')
+            self._skip_directives()
+            children = self.selection_set() if self._peek() == '{' else []
+            selections.append(Field(key, name, children))
+        self._next()
+        return selections
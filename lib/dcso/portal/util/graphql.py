@@ -1,20 +1,33 @@
 # Copyright (c) 2020, DCSO GmbH
 
 import json
-import ssl
+import socket
 from collections import namedtuple
 from datetime import datetime, timezone
-from os import environ
-from typing import AnyStr, List, Optional, Union
+from functools import lru_cache
+from typing import Any, AnyStr, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 from urllib.error import URLError
 from urllib.parse import ParseResult, urlparse
 from urllib.request import Request, urlopen
 
 from dcso.glosom import Glosom
-from ..exceptions import PortalAPIError, PortalAPIRequest
+from ..abstracts import APIAbstract
+from ..exceptions import PortalAPIError, PortalAPIRequest, PortalAPIResponse, PortalTimeout
+from ..util.connection import create_ssl_context
+from ..util.incremental import MULTIPART_ACCEPT, is_incremental, iter_multipart, merge_incremental, multipart_boundary
+from ..util.jsonstream import JSONPathStream
+from ..util.persisted import PERSISTED_QUERY_NOT_SUPPORTED, PersistedQueries, extensions, persisted_query_error
+from ..util.retry import is_mutation
+from ..util.schema import Schema
 from ..util.temporal import decode_utc_iso8601
+from ..util.timeout import Deadline, Timeout
+from ..util.transport import Transport
 
-_ENV_SKIP_TLS_VERIFY = "DCSO_PORTAL_SKIP_TLS_VERIFY"
+NAMEDTUPLE_CACHE_SIZE = 1024
+"""Maximum number of namedtuple classes kept by `namedtuple_class`."""
+
+BATCH_UNSUPPORTED_STATUSES = frozenset({400, 404, 405, 415, 422})
+"""HTTP status codes with which an API rejects batches it does not support."""
 
 
 class GraphQLJSONEncoder(json.JSONEncoder):
@@ -25,23 +38,71 @@ class GraphQLJSONEncoder(json.JSONEncoder):
         return super().default(o)
 
 
+# sizes of the shortest and longest timestamps decoded, such as '2021-02-08T10:11Z'
+# and '2021-02-08T10:11:12.123456789+00:00' (leaving room for longer fractions)
+_TIMESTAMP_MIN_SIZE = 17
+_TIMESTAMP_MAX_SIZE = 40
+
+
+def maybe_timestamp(value: Any) -> bool:
+    """Returns whether `value` could be a timestamp decoded by
+    `dcso.portal.util.temporal.decode_utc_iso8601`: a string of the right size,
+    starting with a date, and ending with a UTC designator. This is much cheaper
+    than trying to decode the value, which fails for most values."""
+    return (type(value) is str
+            and _TIMESTAMP_MIN_SIZE <= len(value) <= _TIMESTAMP_MAX_SIZE
+            and value[-1] in 'ZC0'
+            and value[4] == '-' and value[7] == '-' and value[10] in 'T ')
+
+
 class GraphQLJSONDecoder(json.JSONDecoder):
-    def __init__(self, *args, **kwargs):
+    """GraphQLJSONDecoder decodes JSON, turning UTC timestamps into non-naive
+    `datetime.datetime` instances. Only strings passing `maybe_timestamp` are
+    decoded.
+
+    By default, values of any field are decoded. Use `datetime_fields` to decode
+    only values of fields with the given names, for example:
+
+        json.loads(body, cls=GraphQLJSONDecoder, datetime_fields={'occurredOn', 'updatedOn'})
+
+    With no `datetime_fields`, no timestamps are decoded, and decoding is as fast
+    as with `json.JSONDecoder`.
+    """
+
+    def __init__(self, *args, datetime_fields: Optional[Iterable[str]] = None, **kwargs):
         try:
             del kwargs['object_hook']
         except KeyError:
             # ok when not in kwargs
             pass
-        super().__init__(*args, **kwargs, object_hook=self.object_hook)
+        self.datetime_fields: Optional[FrozenSet[str]] = None
+        object_hook = self.object_hook
+        if datetime_fields is not None:
+            self.datetime_fields = frozenset(datetime_fields)
+            # without fields, nothing is decoded, and objects are left to the C scanner
+            object_hook = self._object_hook_fields if self.datetime_fields else None
+        super().__init__(*args, **kwargs, object_hook=object_hook)
 
     @staticmethod
     def object_hook(o: dict) -> dict:
         for k, v in o.items():
-            try:
-                o[k] = decode_utc_iso8601(v)
-            except ValueError as exc:
-                # not an ISO date formatted string; let others figure it out
-                pass
+            if maybe_timestamp(v):
+                try:
+                    o[k] = decode_utc_iso8601(v)
+                except ValueError:
+                    # not an ISO date formatted string; let others figure it out
+                    pass
+
+        return o
+
+    def _object_hook_fields(self, o: dict) -> dict:
+        fields = self.datetime_fields
+        for k, v in o.items():
+            if k in fields and maybe_timestamp(v):
+                try:
+                    o[k] = decode_utc_iso8601(v)
+                except ValueError:
+                    pass
 
         return o
 
@@ -52,14 +113,29 @@ class GraphQLRequest:
                  api_url: Union[ParseResult, str],
                  variables: Optional[dict] = None,
                  fragments: Optional[List[str]] = None,
-                 token: Optional[str] = None):
+                 token: Optional[str] = None,
+                 transport: Optional[Transport] = None,
+                 idempotent: Optional[bool] = None,
+                 timeout: Optional[Timeout] = None,
+                 deadline: Optional[Deadline] = None,
+                 persisted: Optional[PersistedQueries] = None,
+                 datetime_fields: Optional[FrozenSet[str]] = None,
+                 schema: Optional[Schema] = None):
         self.query: str = query
         self.api_url: Union[ParseResult, str] = api_url
         self.variables: dict = variables
         self.fragments: List[str] = fragments
         self.token: Optional[str] = token
-
-    def json(self) -> bytes:
+        self.transport: Optional[Transport] = transport
+        self.idempotent: Optional[bool] = idempotent
+        self.timeout: Optional[Timeout] = timeout
+        self.deadline: Optional[Deadline] = deadline
+        self.persisted: Optional[PersistedQueries] = persisted
+        self.datetime_fields: Optional[FrozenSet[str]] = datetime_fields
+        self.schema: Optional[Schema] = schema
+
+    def payload(self) -> dict:
+        """Returns the GraphQL request as dictionary, before encoding it as JSON."""
         q = self.query
         if self.fragments:
             q += '\n'.join(self.fragments)
@@ -71,7 +147,41 @@ class GraphQLRequest:
         if self.variables:
             r['variables'] = self.variables
 
-        return json.dumps(r, cls=GraphQLJSONEncoder).encode('utf-8')
+        return r
+
+    def json(self, payload: Optional[dict] = None) -> bytes:
+        """Returns `payload`, by default the GraphQL request, encoded as JSON."""
+        if payload is None:
+            payload = self.payload()
+        return json.dumps(payload, cls=GraphQLJSONEncoder).encode('utf-8')
+
+    def headers(self) -> dict:
+        """Returns the HTTP headers sent with the request."""
+        headers = {
+            'Content-Type': 'application/json'
+        }
+
+        if self.token:
+            headers['Authorization'] = 'Bearer ' + self.token
+
+        if is_incremental(self.query, self.fragments):
+            headers['Accept'] = MULTIPART_ACCEPT
+
+        return headers
+
+    def is_idempotent(self) -> bool:
+        """Returns whether sending the request more than once is safe. Unless set
+        explicitly using `idempotent`, this is True for queries, and False for
+        mutations."""
+        if self.idempotent is not None:
+            return self.idempotent
+        return not is_mutation(self.query)
+
+    def url(self) -> ParseResult:
+        """Returns the parsed URL of the API endpoint."""
+        if isinstance(self.api_url, str):
+            return urlparse(self.api_url)
+        return self.api_url
 
     def execute_raw(self) -> AnyStr:
         """Executes the GraphQL query and return the response from the wire as JSON.
@@ -80,32 +190,123 @@ class GraphQLRequest:
         Methods `execute_dict` and `execute` have a more Pythonic result, and easier
         to use.
 
+        When `persisted` is given, the query is sent as persisted query when
+        possible; see `dcso.portal.util.persisted.PersistedQueries`.
+
         Raises PortalAPIRequest when request with API or decoding result fails.
         """
-        headers = {
-            'Content-Type': 'application/json'
-        }
+        if self.persisted is not None and self.persisted.supported and self.transport is not None:
+            return self._execute_persisted()
 
-        if self.token:
-            headers['Authorization'] = 'Bearer ' + self.token
+        response = self.send()
+        try:
+            return response.read()
+        finally:
+            response.close()
+
+    def _execute_persisted(self) -> bytes:
+        payload = self.payload()
+        digest = self.persisted.sha256(payload['query'])
+        payload['extensions'] = extensions(digest)
+
+        if self.persisted.is_registered(digest):
+            status, reason, body = self._exchange({k: v for k, v in payload.items() if k != 'query'})
+            error = persisted_query_error(body)
+            if error is None:
+                return _check_status(status, reason, body)
+            # API forgot the query, or does not support persisted queries (anymore)
+            self.persisted.forget(digest)
+            if error == PERSISTED_QUERY_NOT_SUPPORTED:
+                self.persisted.supported = False
+                del payload['extensions']
+
+        status, reason, body = self._exchange(payload)
+        if 'extensions' in payload:
+            if persisted_query_error(body) == PERSISTED_QUERY_NOT_SUPPORTED:
+                self.persisted.supported = False
+                del payload['extensions']
+                status, reason, body = self._exchange(payload)
+            elif 200 <= status < 300:
+                self.persisted.registered(digest)
+
+        return _check_status(status, reason, body)
+
+    def _exchange(self, payload: dict) -> Tuple[int, str, bytes]:
+        response = self.transport.request('POST', self.url(), body=self.json(payload), headers=self.headers(),
+                                          idempotent=self.is_idempotent(),
+                                          timeout=self.timeout, deadline=self.deadline)
+        try:
+            return response.status, response.reason, response.read()
+        finally:
+            response.close()
+
+    def send(self):
+        """Sends the GraphQL request and returns the HTTP response, of which the body
+        was not yet read. The caller must close the response when done.
 
-        url = self.api_url
-        if isinstance(url, str):
-            url = urlparse(self.api_url)
+        When a `transport` was given, the request is sent using one of its
+        (kept-alive) connections. Otherwise, a new connection is opened.
+
+        The request is limited in time by `timeout`, which defaults to the timeout
+        of the transport, and by `deadline`.
+
+        Raises PortalTimeout when the request timed out, and PortalAPIRequest when
+        request with API fails.
+        """
+        headers = self.headers()
+        url = self.url()
+
+        if self.transport is not None:
+            response = self.transport.request('POST', url, body=self.json(), headers=headers,
+                                              idempotent=self.is_idempotent(),
+                                              timeout=self.timeout, deadline=self.deadline)
+            if not 200 <= response.status < 300:
+                # read the body so the connection can be reused
+                response.read()
+                response.close()
+                raise PortalAPIRequest(response.reason)
+            return response
 
         req = Request(url.geturl(), headers=headers, method='POST', data=self.json())
 
         ssl_ctx = None
         if url.scheme == 'https':
-            ssl_ctx = ssl.SSLContext()
-            if environ.get(_ENV_SKIP_TLS_VERIFY):
-                ssl_ctx.verify_mode = ssl.CERT_NONE
+            ssl_ctx = create_ssl_context()
+
+        timeout = (self.timeout or Timeout()).read
+        if self.deadline is not None:
+            timeout = self.deadline.limit(timeout)
+            # when the deadline passed, the timeout is 0, which would make the socket non-blocking
+            self.deadline.check()
 
         try:
-            return urlopen(req, context=ssl_ctx).read()
+            return urlopen(req, context=ssl_ctx, timeout=timeout)
+        except socket.timeout:
+            raise PortalTimeout("timed out waiting for API")
         except URLError as exc:
+            if isinstance(exc.reason, socket.timeout):
+                raise PortalTimeout("timed out waiting for API")
             raise PortalAPIRequest(str(exc.reason))
 
+    def decode(self, body: AnyStr) -> dict:
+        """Decodes `body`, the response to this request, as `decode_graphql_response`
+        does. When a `schema` is given, timestamps are decoded following the types
+        of the fields selected by the query, instead of using `datetime_fields`.
+        """
+        if self.schema is None:
+            return decode_graphql_response(body, self.datetime_fields)
+        response = decode_graphql_response(body, frozenset())
+        self._decode_timestamps(response)
+        return response
+
+    def _decode_timestamps(self, response: dict) -> None:
+        if self.schema is not None and response.get('data') is not None:
+            self.schema.decode_timestamps(response['data'], self.payload()['query'])
+
+    def _fields(self) -> Optional[FrozenSet[str]]:
+        """Returns the fields of which timestamps are decoded while decoding JSON."""
+        return frozenset() if self.schema is not None else self.datetime_fields
+
     def execute_dict(self) -> dict:
         """Executes the GraphQL request returning response as a dictionary.
 
@@ -113,35 +314,76 @@ class GraphQLRequest:
         When there was an issue with the request itself, or decoding JSON failed,
         the `PortalAPIRequest` exception is raised.
         """
-        res = self.execute_raw()
-        if isinstance(res, bytes):
-            res = res.decode('utf-8')
+        if is_incremental(self.query, self.fragments):
+            result = None
+            for result in self.iter_incremental():
+                pass
+            return result
 
-        try:
-            response = json.loads(res, cls=GraphQLJSONDecoder)
-        except json.JSONDecodeError as exc:
-            raise PortalAPIRequest("failed decoding API response: " + str(exc))
+        return self.decode(self.execute_raw())
 
-        try:
-            first_error = response['errors'][0]
-        except (TypeError, KeyError, IndexError):
-            # all is good; return response
-            return response
+    def iter_incremental(self) -> Iterator[dict]:
+        """Executes the GraphQL request, of which the query uses @defer or @stream,
+        and yields the result as dictionary once the initial payload arrived, and
+        again each time a later payload was merged into it. The same dictionary is
+        yielded each time; it is complete once `hasNext` is false.
 
+        When the API does not answer incrementally, the complete result is
+        yielded once.
+
+        Raises `PortalAPIError` When the GraphQL API endpoint returned an error,
+        including errors in later payloads.
+        When there was an issue with the request itself, or decoding JSON failed,
+        the `PortalAPIRequest` exception is raised.
+        """
+        response = self.send()
         try:
-            err = first_error['message']
-            code = ""
-            if 'extensions' in first_error:
-                if 'detail' in first_error['extensions']:
-                    err += ' (' + first_error['extensions']['detail'] + ')'
-                code = first_error['extensions'].get('code', "")
-            g = Glosom(message=first_error['message'], code=code)
-        except KeyError as exc:
-            raise PortalAPIRequest(f"API request contained unusable error definition {exc}")
-        except AttributeError:
-            raise PortalAPIRequest(f"API request contained unusable error extensions")
-        else:
-            raise PortalAPIError(glosom=g)
+            boundary = multipart_boundary(response.headers.get('Content-Type'))
+            if boundary is None:
+                yield self.decode(response.read())
+                return
+
+            result = None
+            read = getattr(response, 'read1', response.read)
+            for part in iter_multipart(read, boundary):
+                if not part.strip():
+                    continue
+                if result is None:
+                    result = self.decode(part)
+                else:
+                    merge_incremental(result, _decode_json(part, self._fields()))
+                    check_graphql_errors(result)
+                    self._decode_timestamps(result)
+                yield result
+                if not result.get('hasNext', False):
+                    return
+
+            if result is None:
+                raise PortalAPIRequest("multipart API response holds no result")
+        finally:
+            response.close()
+
+    def iter_path(self, path: Sequence[str]) -> Iterator[Any]:
+        """Executes the GraphQL request and yields, one by one, the elements of
+        the list found in the response using `path`, a sequence of keys starting
+        with 'data'. The response is parsed incrementally while it is read from
+        the connection, so only the current element is kept in memory.
+
+        Raises `PortalAPIError` When the GraphQL API endpoint returned an error;
+        elements preceding the error in the response might have been yielded.
+        When there was an issue with the request itself, or decoding JSON failed,
+        the `PortalAPIRequest` exception is raised.
+        """
+        decoder = GraphQLJSONDecoder(datetime_fields=self._fields())
+        document = self.payload()['query'] if self.schema is not None else None
+        response = self.send()
+        try:
+            for element in JSONPathStream(response.read, path, decoder=decoder, on_top_level=_check_top_level_errors):
+                if document is not None:
+                    element = self.schema.decode_timestamps(element, document, path[1:])
+                yield element
+        finally:
+            response.close()
 
     def execute(self) -> namedtuple:
         """Executes the GraphQL request returning response as a namedtuple.
@@ -156,21 +398,308 @@ class GraphQLRequest:
         return graphql_data_to_namedtuple(self.execute_dict()['data'])
 
 
+class GraphQLBatchRequest:
+    """GraphQLBatchRequest sends several GraphQL `requests` to the API using one
+    HTTP request, of which the body is a JSON array holding the requests. The API
+    answers with a JSON array holding the responses, in the same order.
+
+    The `api_url`, `token`, and limits in time of the batch are used, not those of
+    the individual requests. The batch is only retried when all requests are
+    idempotent.
+    """
+
+    def __init__(self,
+                 requests: Sequence[GraphQLRequest],
+                 api_url: Union[ParseResult, str],
+                 transport: Transport,
+                 token: Optional[str] = None,
+                 timeout: Optional[Timeout] = None,
+                 deadline: Optional[Deadline] = None,
+                 datetime_fields: Optional[FrozenSet[str]] = None,
+                 schema: Optional[Schema] = None):
+        self.requests: List[GraphQLRequest] = list(requests)
+        self.api_url: Union[ParseResult, str] = api_url
+        self.transport: Transport = transport
+        self.token: Optional[str] = token
+        self.timeout: Optional[Timeout] = timeout
+        self.deadline: Optional[Deadline] = deadline
+        self.datetime_fields: Optional[FrozenSet[str]] = datetime_fields
+        self.schema: Optional[Schema] = schema
+
+    def json(self) -> bytes:
+        payload = [request.payload() for request in self.requests]
+        return json.dumps(payload, cls=GraphQLJSONEncoder).encode('utf-8')
+
+    def execute_list(self) -> List[dict]:
+        """Executes the batch and returns the decoded responses, one for each
+        request, in order. Responses are not checked for GraphQL errors; use
+        `check_graphql_errors` for this.
+
+        Raises `PortalAPIResponse` when the API does not support batching: it
+        rejected the request with one of `BATCH_UNSUPPORTED_STATUSES`, or did not
+        respond with one response object per request. Raises `PortalAPIRequest` when
+        the request with the API failed otherwise, for example with status 401, 403,
+        or 429, or decoding JSON failed.
+        """
+        request = GraphQLRequest(query='', api_url=self.api_url, token=self.token)
+        idempotent = all(r.is_idempotent() for r in self.requests)
+
+        response = self.transport.request('POST', request.url(), body=self.json(), headers=request.headers(),
+                                          idempotent=idempotent, timeout=self.timeout, deadline=self.deadline)
+        try:
+            body = response.read()
+        finally:
+            response.close()
+
+        if response.status in BATCH_UNSUPPORTED_STATUSES:
+            raise PortalAPIResponse(f"API does not support batching ({response.status} {response.reason})")
+        if not 200 <= response.status < 300:
+            raise PortalAPIRequest(response.reason)
+
+        try:
+            result = json.loads(body.decode('utf-8'), cls=GraphQLJSONDecoder,
+                                datetime_fields=frozenset() if self.schema is not None else self.datetime_fields)
+        except (ValueError, UnicodeError) as exc:
+            raise PortalAPIRequest("failed decoding API response: " + str(exc))
+
+        if (not isinstance(result, list) or len(result) != len(self.requests)
+                or not all(isinstance(response, dict) for response in result)):
+            raise PortalAPIResponse("API does not support batching (response is not a list of responses)")
+
+        if self.schema is not None:
+            for request, response in zip(self.requests, result):
+                if response.get('data') is not None:
+                    self.schema.decode_timestamps(response['data'], request.payload()['query'])
+        return result
+
+
+class PreparedQuery:
+    """PreparedQuery is a GraphQL query, with its fragments, prepared once to be
+    executed many times using the client `api`, each time with other variables.
+
+    The query, with duplicate fragments removed, is encoded as JSON once, and the
+    URL of the API is parsed once. Each execution only encodes the variables.
+    Headers are only created again when the token of the client changed.
+
+    Executing a mutation invalidates the cached responses of the client, those
+    of the queries in `invalidate`, or all.
+
+    Use `dcso.portal.APIClient.prepare` to create prepared queries.
+    """
+
+    def __init__(self, api: APIAbstract, query: str,
+                 fragments: Optional[List[str]] = None,
+                 idempotent: Optional[bool] = None,
+                 invalidate: Optional[List[str]] = None):
+        self._api: APIAbstract = api
+        self.query: str = query
+        self.fragments: List[str] = list(dict.fromkeys(fragments or []))
+        self.document: str = query + '\n'.join(self.fragments)
+        self.url: ParseResult = urlparse(api.api_url)
+        self.mutation: bool = is_mutation(query)
+        self.idempotent: bool = idempotent if idempotent is not None else not self.mutation
+        self.invalidate: Optional[List[str]] = invalidate
+        self.incremental: bool = is_incremental(query, self.fragments)
+
+        self._prefix: bytes = b'{"query": ' + json.dumps(self.document).encode('utf-8')
+        self._headers: dict = {}
+        self._headers_token: Optional[str] = None
+
+    def body(self, variables: Optional[dict] = None) -> bytes:
+        """Returns the request body, encoded as JSON, for `variables`."""
+        if not variables:
+            return self._prefix + b'}'
+        return (self._prefix + b', "variables": '
+                + json.dumps(variables, cls=GraphQLJSONEncoder).encode('utf-8') + b'}')
+
+    def headers(self, token: Optional[str]) -> dict:
+        """Returns the HTTP headers sent with the request using `token`."""
+        if token != self._headers_token or not self._headers:
+            headers = {'Content-Type': 'application/json'}
+            if token:
+                headers['Authorization'] = 'Bearer ' + token
+            if self.incremental:
+                headers['Accept'] = MULTIPART_ACCEPT
+            self._headers, self._headers_token = headers, token
+        return self._headers
+
+    def invalidate_cache(self) -> None:
+        """Invalidates the cached responses of the client after executing a mutation."""
+        cache = getattr(self._api, 'cache', None)
+        if self.mutation and cache is not None:
+            cache.invalidate_queries(self.invalidate)
+
+    def request(self, variables: Optional[dict] = None,
+                timeout: Optional[Timeout] = None,
+                deadline: Optional[Deadline] = None) -> GraphQLRequest:
+        """Returns the request executing the query with `variables`."""
+        return _PreparedRequest(self, variables, timeout, deadline)
+
+    def execute(self, variables: Optional[dict] = None,
+                timeout: Optional[Timeout] = None,
+                deadline: Optional[Deadline] = None) -> namedtuple:
+        """Executes the query with `variables`, and returns the response data
+        as namedtuple. See `dcso.portal.APIClient.execute_graphql`.
+
+        Raises `PortalAPIError` When the GraphQL API endpoint returned an error.
+        When there was an issue with the request itself, or decoding JSON failed,
+        the `PortalAPIRequest` exception is raised.
+        """
+        return self.request(variables, timeout, deadline).execute()
+
+    def execute_dict(self, variables: Optional[dict] = None,
+                     timeout: Optional[Timeout] = None,
+                     deadline: Optional[Deadline] = None) -> dict:
+        """Executes the query with `variables`, and returns the response data
+        as dictionary. See `dcso.portal.APIClient.execute_graphql_dict`.
+
+        Raises `PortalAPIError` When the GraphQL API endpoint returned an error.
+        When there was an issue with the request itself, or decoding JSON failed,
+        the `PortalAPIRequest` exception is raised.
+        """
+        try:
+            return self.request(variables, timeout, deadline).execute_dict()['data']
+        except KeyError as exc:
+            raise PortalAPIRequest(f"API request contained unusable error definition {exc}")
+
+
+class _PreparedRequest(GraphQLRequest):
+    """GraphQLRequest using what was prepared by a `PreparedQuery`."""
+
+    def __init__(self, prepared: PreparedQuery, variables: Optional[dict],
+                 timeout: Optional[Timeout], deadline: Optional[Deadline]):
+        api = prepared._api
+        super().__init__(query=prepared.document, api_url=prepared.url, variables=variables,
+                         token=api.token, transport=api.transport, idempotent=prepared.idempotent,
+                         timeout=timeout, deadline=deadline,
+                         persisted=getattr(api, 'persisted_queries', None),
+                         datetime_fields=getattr(api, 'datetime_fields', None),
+                         schema=getattr(api, 'schema', None))
+        self._prepared: PreparedQuery = prepared
+
+    def json(self, payload: Optional[dict] = None) -> bytes:
+        if payload is None:
+            return self._prepared.body(self.variables)
+        return super().json(payload)
+
+    def headers(self) -> dict:
+        return self._prepared.headers(self.token)
+
+    def execute_dict(self) -> dict:
+        try:
+            return super().execute_dict()
+        finally:
+            self._prepared.invalidate_cache()
+
+
+def _check_status(status: int, reason: str, body: bytes) -> bytes:
+    if not 200 <= status < 300:
+        raise PortalAPIRequest(reason)
+    return body
+
+
+def decode_graphql_response(res: AnyStr, datetime_fields: Optional[FrozenSet[str]] = None) -> dict:
+    """Decodes the GraphQL response `res` as received from the wire and returns
+    it as a dictionary. When `datetime_fields` is given, only timestamps in fields
+    with these names are decoded; see `GraphQLJSONDecoder`.
+
+    Raises `PortalAPIError` When the response contains an error.
+    When decoding JSON failed, the `PortalAPIRequest` exception is raised.
+    """
+    if isinstance(res, bytes):
+        res = res.decode('utf-8')
+
+    try:
+        response = json.loads(res, cls=GraphQLJSONDecoder, datetime_fields=datetime_fields)
+    except json.JSONDecodeError as exc:
+        raise PortalAPIRequest("failed decoding API response: " + str(exc))
+
+    return check_graphql_errors(response)
+
+
+def _decode_json(body: bytes, datetime_fields: Optional[FrozenSet[str]] = None) -> dict:
+    try:
+        return json.loads(body.decode('utf-8'), cls=GraphQLJSONDecoder, datetime_fields=datetime_fields)
+    except (ValueError, UnicodeError) as exc:
+        raise PortalAPIRequest("failed decoding API response: " + str(exc))
+
+
+def check_graphql_errors(response: dict) -> dict:
+    """Checks the decoded GraphQL `response` for errors, and returns the
+    response when there are none.
+
+    Raises `PortalAPIError` with the first error of the response.
+    """
+    try:
+        first_error = response['errors'][0]
+    except (TypeError, KeyError, IndexError):
+        # all is good; return response
+        return response
+
+    try:
+        err = first_error['message']
+        code = ""
+        if 'extensions' in first_error:
+            if 'detail' in first_error['extensions']:
+                err += ' (' + first_error['extensions']['detail'] + ')'
+            code = first_error['extensions'].get('code', "")
+        g = Glosom(message=first_error['message'], code=code)
+    except KeyError as exc:
+        raise PortalAPIRequest(f"API request contained unusable error definition {exc}")
+    except AttributeError:
+        raise PortalAPIRequest(f"API request contained unusable error extensions")
+    else:
+        raise PortalAPIError(glosom=g)
+
+
+def _check_top_level_errors(key: str, value: Any) -> None:
+    if key == 'errors':
+        check_graphql_errors({'errors': value})
+
+
 def graphql_data_to_namedtuple(mapping: dict, name: str = 'data') -> namedtuple:
     """Transforms GraphQL response data and returns it as a namedtuple.
 
-    This method takes the mapping as GraphQL Response data and recursively goes
-    through it converting dict object to namedtuple, and array of objects as list.
+    This method takes the mapping as GraphQL Response data and goes through it
+    converting dict object to namedtuple, and array of objects as list. Nesting
+    is handled without recursion, so deeply nested data does not reach the
+    recursion limit.
 
     The name of the namedtuple is the key of value it is created from. The
-    starting named tuple is by default called 'data'.
+    starting named tuple is by default called 'data'. Objects having the same
+    name and keys share their namedtuple class; see `namedtuple_class`.
     """
-    if isinstance(mapping, dict):
-        for key, value in mapping.items():
-            if isinstance(value, (list, tuple)):
-                for idx, p in enumerate(value):
-                    value[idx] = graphql_data_to_namedtuple(p, key)
-            else:
-                mapping[key] = graphql_data_to_namedtuple(value, key)
-        return namedtuple(name, field_names=mapping.keys())(*mapping.values())
-    return mapping
+    if not isinstance(mapping, dict):
+        return mapping
+
+    # objects in pre-order, so that converting them in reverse converts
+    # children before their parents
+    objects = []
+    stack = [(mapping, name, None, None)]
+    while stack:
+        item = stack.pop()
+        objects.append(item)
+        for key, value in item[0].items():
+            if isinstance(value, dict):
+                stack.append((value, key, item[0], key))
+            elif isinstance(value, list):
+                for idx, element in enumerate(value):
+                    if isinstance(element, dict):
+                        stack.append((element, key, value, idx))
+
+    result = None
+    for obj, obj_name, container, slot in reversed(objects):
+        converted = namedtuple_class(obj_name, tuple(obj))(*obj.values())
+        if container is None:
+            result = converted
+        else:
+            container[slot] = converted
+    return result
+
+
+@lru_cache(maxsize=NAMEDTUPLE_CACHE_SIZE)
+def namedtuple_class(name: str, fields: Tuple[str, ...]) -> type:
+    """Returns the namedtuple class called `name` having `fields`. Creating a
+    namedtuple class is expensive, so classes are cached; the least recently
+    used are evicted once `NAMEDTUPLE_CACHE_SIZE` classes are cached."""
+    return namedtuple(name, field_names=fields)
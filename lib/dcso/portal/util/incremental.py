@@ -0,0 +1,157 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+Support for incremental delivery of GraphQL results, as used by the @defer
+and @stream directives: the result is sent as multipart/mixed response, of
+which the first part holds the initial payload, and later parts patches.
+"""
+
+import re
+from typing import Any, Callable, Iterator, List, Optional
+
+from ..exceptions import PortalAPIRequest
+from .document import tokens
+
+MULTIPART_ACCEPT = 'multipart/mixed; deferSpec=20220824, application/json'
+"""Value of the Accept header of requests which can be answered incrementally."""
+
+_RE_INCREMENTAL = re.compile(r'@(?:defer|stream)\b')
+_RE_BOUNDARY = re.compile(r'boundary\s*=\s*(?:"([^"]+)"|([^\s;]+))', re.IGNORECASE)
+_CHUNK_SIZE = 64 * 1024
+
+
+def is_incremental(query: str, fragments: Optional[List[str]] = None) -> bool:
+    """Returns whether `query`, or one of its `fragments`, uses the @defer or
+    @stream directive. Mentions in comments and strings are not counted."""
+    for document in [query] + list(fragments or []):
+        if _RE_INCREMENTAL.search(document) is None:
+            continue
+        document_tokens = tokens(document)
+        for i, token in enumerate(document_tokens[:-1]):
+            if token == '@' and document_tokens[i + 1] in ('defer', 'stream'):
+                return True
+    return False
+
+
+def multipart_boundary(content_type: Optional[str]) -> Optional[str]:
+    """Returns the boundary of a multipart/mixed `content_type`, or None when it
+    is another content type."""
+    if not content_type or not content_type.lower().startswith('multipart/mixed'):
+        return None
+    match = _RE_BOUNDARY.search(content_type)
+    return (match.group(1) or match.group(2)) if match else '-'
+
+
+def iter_multipart(read: Callable[[int], bytes], boundary: str) -> Iterator[bytes]:
+    """Yields the body of each part of the multipart body read using `read`, as
+    soon as the part is complete. Headers of the parts are skipped."""
+    marker = b'\r\n--' + boundary.encode('latin-1')
+    # the first delimiter is not preceded by a line break
+    buffer = bytearray(b'\r\n')
+    in_part = False
+    eof = False
+
+    while True:
+        idx = buffer.find(marker)
+        if idx >= 0:
+            if in_part:
+                part = bytes(buffer[:idx])
+                del buffer[:idx]
+                in_part = False
+                yield _part_body(part)
+                continue
+
+            after = idx + len(marker)
+            if len(buffer) >= after + 2 or eof:
+                if buffer[after:after + 2] == b'--':
+                    return
+                eol = buffer.find(b'\r\n', after)
+                if eol >= 0:
+                    del buffer[:eol + 2]
+                    in_part = True
+                    continue
+
+        if eof:
+            if in_part:
+                raise PortalAPIRequest("multipart API response ended unexpectedly")
+            return
+
+        chunk = read(_CHUNK_SIZE)
+        if chunk:
+            buffer += chunk
+        else:
+            eof = True
+
+
+def _part_body(part: bytes) -> bytes:
+    end = part.find(b'\r\n\r\n')
+    if end >= 0:
+        return part[end + 4:]
+    # part without headers
+    return part[2:] if part.startswith(b'\r\n') else part
+
+
+def merge_incremental(result: dict, payload: dict) -> dict:
+    """Merges the subsequent `payload` into `result`, which holds the initial
+    payload and previously merged ones, and returns it.
+
+    Both the current format, with patches listed in `incremental`, as the
+    earlier format, with one patch per payload, are supported. Errors are
+    added to those of the result.
+    """
+    patches = payload.get('incremental')
+    if patches is None and 'path' in payload:
+        patches = [payload]
+
+    for patch in patches or []:
+        path = patch.get('path') or []
+        if 'items' in patch:
+            _merge_items(result, path, patch['items'] or [])
+        elif patch.get('data') is not None:
+            _merge_data(result, path, patch['data'])
+        if patch.get('errors'):
+            result.setdefault('errors', []).extend(patch['errors'])
+
+    if payload.get('errors'):
+        result.setdefault('errors', []).extend(payload['errors'])
+    if 'hasNext' in payload:
+        result['hasNext'] = payload['hasNext']
+    return result
+
+
+def _locate(result: dict, path: List[Any]) -> Any:
+    target = result.get('data')
+    try:
+        for key in path:
+            target = target[key]
+    except (KeyError, IndexError, TypeError):
+        raise PortalAPIRequest(f"API response patch has unknown path {path}")
+    return target
+
+
+def _merge_data(result: dict, path: List[Any], data: dict) -> None:
+    if not path and result.get('data') is None:
+        result['data'] = data
+        return
+    target = _locate(result, path)
+    if not isinstance(target, dict):
+        raise PortalAPIRequest(f"API response patch at {path} is not an object")
+    _deep_merge(target, data)
+
+
+def _deep_merge(target: dict, data: dict) -> None:
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _deep_merge(target[key], value)
+        else:
+            target[key] = value
+
+
+def _merge_items(result: dict, path: List[Any], items: list) -> None:
+    if not path or not isinstance(path[-1], int):
+        raise PortalAPIRequest(f"API response patch has invalid path {path} for items")
+    target = _locate(result, path[:-1])
+    if not isinstance(target, list):
+        raise PortalAPIRequest(f"API response patch at {path} is not a list")
+    index = path[-1]
+    target[index:index + len(items)] = items
@@ -0,0 +1,223 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+Incremental parsing of (large) JSON documents, yielding the elements of
+one array found at a given path, without holding the complete document
+in memory.
+"""
+
+import json
+import re
+from typing import Any, Callable, Iterator, Optional, Sequence
+
+from ..exceptions import PortalAPIRequest
+
+DEFAULT_CHUNK_SIZE = 65536
+"""Default number of bytes read at once from the stream."""
+
+_WHITESPACE = b' \t\n\r'
+_STRUCTURE = re.compile(rb'["{}\[\]]')
+_STRING_END = re.compile(rb'["\\]')
+_SCALAR_END = re.compile(rb'[,}\]\s]')
+
+
+class JSONPathStream:
+    """JSONPathStream reads a JSON document from `read`, a callable returning at
+    most the requested number of bytes (an empty bytes object at the end), and
+    yields the elements of the array found using `path`, which is a sequence
+    of object keys.
+
+    For example, iterating with path `['data', 'alerts', 'edges']` over the
+    document `{"data": {"alerts": {"edges": [{"id": 1}, {"id": 2}]}}}` yields
+    `{"id": 1}` and `{"id": 2}`. Nothing is yielded when the path does not
+    exist, or its value is null.
+
+    Each element is decoded using `decoder`. Only the element being decoded,
+    and the last chunk read, are kept in memory.
+
+    Values of top-level keys which are not on the path are passed to the
+    `on_top_level` callable, if given, after they were decoded. This can be
+    used, for example, to handle GraphQL errors.
+
+    Raises `PortalAPIRequest` when the document is not valid JSON.
+    """
+
+    def __init__(self, read: Callable[[int], bytes], path: Sequence[str],
+                 decoder: Optional[json.JSONDecoder] = None,
+                 on_top_level: Optional[Callable[[str, Any], None]] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self._read = read
+        self._path = list(path)
+        self._decoder = decoder or json.JSONDecoder()
+        self._on_top_level = on_top_level
+        self._chunk_size = chunk_size
+
+        self._buf: bytearray = bytearray()
+        self._pos: int = 0
+        self._eof: bool = False
+
+    def __iter__(self) -> Iterator[Any]:
+        self._expect(b'{')
+        for key in self._object_keys():
+            if self._path and key == self._path[0]:
+                yield from self._descend(1)
+            elif self._on_top_level is not None:
+                self._on_top_level(key, self._decode(self._value_bytes()))
+            else:
+                self._skip_value()
+
+        if self._peek() is not None:
+            raise PortalAPIRequest("failed decoding API response: extra data after document")
+
+    def _descend(self, depth: int) -> Iterator[Any]:
+        if self._peek() == b'n':
+            self._skip_value()  # null
+            return
+
+        if depth == len(self._path):
+            self._expect(b'[')
+            if self._peek() == b']':
+                self._pos += 1
+                return
+
+            while True:
+                yield self._decode(self._value_bytes())
+                if self._expect_one_of(b',]') == b']':
+                    return
+
+        self._expect(b'{')
+        for key in self._object_keys():
+            if key == self._path[depth]:
+                yield from self._descend(depth + 1)
+            else:
+                self._skip_value()
+
+    def _object_keys(self) -> Iterator[str]:
+        """Yields the keys of the object which opening brace was consumed. After
+        each key, the caller must consume the value."""
+        if self._peek() == b'}':
+            self._pos += 1
+            return
+
+        while True:
+            if self._peek() != b'"':
+                self._fail("expected object key")
+            key = self._decode(self._value_bytes())
+            self._expect(b':')
+            yield key
+            if self._expect_one_of(b',}') == b'}':
+                return
+
+    def _decode(self, raw: bytes) -> Any:
+        try:
+            return self._decoder.decode(raw.decode('utf-8'))
+        except (ValueError, UnicodeError) as exc:
+            raise PortalAPIRequest("failed decoding API response: " + str(exc))
+
+    def _skip_value(self) -> None:
+        self._value_bytes()
+
+    def _value_bytes(self) -> bytes:
+        """Consumes the next value and returns it as raw bytes.
+
+        While scanning, the value starts at the current position, which is kept
+        when reading more data. Offsets are therefore relative to it."""
+        first = self._peek()
+        if first is None:
+            self._fail("unexpected end of document")
+
+        if first == b'"':
+            end = self._scan_string(1)
+        elif first in (b'{', b'['):
+            end = self._scan_container(1)
+        else:
+            end = self._scan_scalar(0)
+
+        raw = bytes(self._buf[self._pos:self._pos + end])
+        self._pos += end
+        return raw
+
+    def _search(self, pattern, offset: int):
+        while True:
+            m = pattern.search(self._buf, self._pos + offset)
+            if m is not None or not self._fill():
+                return m
+
+    def _scan_string(self, offset: int) -> int:
+        while True:
+            m = self._search(_STRING_END, offset)
+            if m is None:
+                self._fail("unexpected end of document")
+
+            offset = m.end() - self._pos
+            if m.group() == b'"':
+                return offset
+            offset += 1  # skip escaped character
+
+    def _scan_container(self, offset: int) -> int:
+        depth = 1
+        while True:
+            m = self._search(_STRUCTURE, offset)
+            if m is None:
+                self._fail("unexpected end of document")
+
+            offset = m.end() - self._pos
+            c = m.group()
+            if c == b'"':
+                offset = self._scan_string(offset)
+            elif c in (b'{', b'['):
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return offset
+
+    def _scan_scalar(self, offset: int) -> int:
+        m = self._search(_SCALAR_END, offset)
+        if m is None:
+            return len(self._buf) - self._pos
+        return m.start() - self._pos
+
+    def _fill(self) -> bool:
+        """Reads more data, dropping what was consumed from the buffer."""
+        if self._eof:
+            return False
+
+        data = self._read(self._chunk_size)
+        if not data:
+            self._eof = True
+            return False
+
+        del self._buf[:self._pos]
+        self._buf += data
+        self._pos = 0
+        return True
+
+    def _peek(self) -> Optional[bytes]:
+        """Skips whitespace and returns the next character without consuming it,
+        or None at the end of the document."""
+        while True:
+            buf = self._buf
+            pos = self._pos
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            self._pos = pos
+            if pos < len(buf):
+                return buf[pos:pos + 1]
+            if not self._fill():
+                return None
+
+    def _expect(self, c: bytes) -> None:
+        if self._peek() != c:
+            self._fail(f"expected '{c.decode()}'")
+        self._pos += 1
+
+    def _expect_one_of(self, chars: bytes) -> bytes:
+        c = self._peek()
+        if c is None or c not in chars:
+            self._fail("expected one of '{}'".format(chars.decode()))
+        self._pos += 1
+        return c
+
+    def _fail(self, reason: str) -> None:
+        raise PortalAPIRequest(f"failed decoding API response: {reason}")
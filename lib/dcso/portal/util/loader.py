@@ -0,0 +1,185 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+Coalescing of individual GraphQL lookups into one request, removing the
+need of sending one request per looked up object.
+"""
+
+import json
+import re
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Optional
+
+from ..abstracts import APIAbstract
+from ..exceptions import PortalAPIRequest, PortalException
+from .graphql import GraphQLJSONDecoder, GraphQLRequest, check_graphql_errors, graphql_data_to_namedtuple
+
+DEFAULT_WINDOW = 0.005
+"""Default number of seconds lookups are collected before they are sent."""
+
+DEFAULT_MAX_BATCH_SIZE = 100
+"""Default maximum of lookups sent using one request."""
+
+_RE_KEY_VARIABLE = re.compile(r'\$key\b')
+
+
+class QueryLoader:
+    """QueryLoader collects lookups of objects by key, and fetches them using
+    a single GraphQL document in which each lookup gets its own alias.
+
+    The looked up `field` is queried using `arguments`, in which `$key` is
+    replaced with a variable holding the key, of GraphQL type `key_type`. For
+    example, looking up users and issues by ID:
+
+        users = QueryLoader(apic, 'auth_user', '{ id username }', arguments='id: $key')
+        issues = QueryLoader(apic, 'tdh_issue', '{ id title }', arguments='filter: {id: $key}')
+
+    Lookups done using `load` return a `concurrent.futures.Future`. Lookups done
+    within `window` seconds after the first one are sent together, at most
+    `max_batch_size` at a time. When looking up the same key more than once within
+    the window, it is fetched once and all callers get the same result:
+
+        futures = [users.load(user_id) for user_id in user_ids]
+        names = [f.result().username for f in futures]
+
+    Within `batch`, lookups are collected until the scope is left, instead of
+    during the window:
+
+        with users.batch():
+            alice, bob = users.load('1'), users.load('2')
+        print(alice.result(), bob.result())
+
+    Results are namedtuples, like those returned by `dcso.portal.APIClient.execute_graphql`,
+    or None when the object was not found. When the API reports an error for a
+    lookup, it is raised by the result of its future.
+    """
+
+    def __init__(self, api: APIAbstract, field: str, selection: str,
+                 arguments: str = 'id: $key',
+                 key_type: str = 'ID!',
+                 window: float = DEFAULT_WINDOW,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE):
+        if not _RE_KEY_VARIABLE.search(arguments):
+            raise ValueError("arguments must use variable $key")
+
+        self._api: APIAbstract = api
+        self.field: str = field
+        self.selection: str = selection
+        self.arguments: str = arguments
+        self.key_type: str = key_type
+        self.window: float = window
+        self.max_batch_size: int = max(1, max_batch_size)
+
+        self._lock = threading.Lock()
+        self._pending: Dict[Hashable, Future] = {}
+        self._timer: Optional[threading.Timer] = None
+        self._scopes: int = 0
+
+    def load(self, key: Hashable) -> Future:
+        """Schedules looking up the object identified by `key`, and returns a
+        future which will hold it."""
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pending[key] = Future()
+            if self._scopes == 0 and self._timer is None:
+                self._timer = threading.Timer(self.window, self.dispatch)
+                self._timer.daemon = True
+                self._timer.start()
+        return future
+
+    def load_many(self, keys: Iterable[Hashable]) -> List[Future]:
+        """Schedules looking up all `keys`, and returns their futures in order."""
+        return [self.load(key) for key in keys]
+
+    def get(self, key: Hashable) -> Any:
+        """Looks up `key` and waits for the result."""
+        return self.load(key).result()
+
+    @contextmanager
+    def batch(self) -> Iterator['QueryLoader']:
+        """Collects lookups done within the scope and sends them when leaving it."""
+        with self._lock:
+            self._scopes += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._scopes -= 1
+                dispatch = self._scopes == 0
+            if dispatch:
+                self.dispatch()
+
+    def dispatch(self) -> None:
+        """Sends all collected lookups now."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            pending, self._pending = self._pending, {}
+
+        items = list(pending.items())
+        for i in range(0, len(items), self.max_batch_size):
+            self._fetch(items[i:i + self.max_batch_size])
+
+    def document(self, count: int) -> str:
+        """Returns the GraphQL document looking up `count` keys, using variables
+        `k0`, `k1`, and so on, and aliases `a0`, `a1`, and so on."""
+        variables = ', '.join(f'$k{i}: {self.key_type}' for i in range(count))
+        lookups = ' '.join('a{0}: {1}({2}) {3}'.format(i, self.field,
+                                                       _RE_KEY_VARIABLE.sub(f'$k{i}', self.arguments),
+                                                       self.selection)
+                           for i in range(count))
+        return f'query ({variables}) {{ {lookups} }}'
+
+    def _fetch(self, items: List[tuple]) -> None:
+        futures = {f'a{i}': future for i, (_, future) in enumerate(items)}
+        request = GraphQLRequest(api_url=self._api.api_url, query=self.document(len(items)),
+                                 variables={f'k{i}': key for i, (key, _) in enumerate(items)},
+                                 token=self._api.token, transport=self._api.transport)
+        schema = getattr(self._api, 'schema', None)
+        fields = frozenset() if schema is not None else getattr(self._api, 'datetime_fields', None)
+
+        try:
+            raw = request.execute_raw()
+            try:
+                response = json.loads(raw, cls=GraphQLJSONDecoder, datetime_fields=fields)
+            except ValueError as exc:
+                raise PortalAPIRequest("failed decoding API response: " + str(exc))
+            if schema is not None and isinstance(response, dict) and response.get('data') is not None:
+                schema.decode_timestamps(response['data'], request.query)
+            _resolve(response, futures, self.field)
+        except BaseException as exc:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(exc)
+            if not isinstance(exc, PortalException):
+                raise
+
+
+def _resolve(response: dict, futures: Dict[str, Future], name: str) -> None:
+    """Hands each future its part of the response, as namedtuple called `name`,
+    or the error reported for its alias. Errors not related to an alias fail
+    all futures."""
+    general_error = None
+    for error in response.get('errors') or []:
+        path = error.get('path') if isinstance(error, dict) else None
+        future = futures.get(path[0]) if path else None
+        try:
+            check_graphql_errors({'errors': [error]})
+        except PortalException as exc:
+            if future is None:
+                general_error = general_error or exc
+            elif not future.done():
+                future.set_exception(exc)
+
+    data = response.get('data') or {}
+    for alias, future in futures.items():
+        if future.done():
+            continue
+        if alias in data and (data[alias] is not None or general_error is None):
+            future.set_result(graphql_data_to_namedtuple(data[alias], name))
+        else:
+            future.set_exception(general_error or PortalAPIRequest(f"API response is missing '{alias}'"))
@@ -0,0 +1,199 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+Iteration over GraphQL connections using cursor-based pagination, fetching
+the next pages in the background.
+"""
+
+import queue
+import threading
+from typing import Any, Iterator, List, Optional, Tuple, Union
+
+from ..abstracts import APIAbstract
+from ..exceptions import PortalAPIRequest
+from .checkpoint import Checkpoint, fingerprint
+from .graphql import graphql_data_to_namedtuple
+from .timeout import Deadline, Timeout
+
+DEFAULT_PAGE_SIZE = 100
+"""Default number of nodes requested per page."""
+
+DEFAULT_PREFETCH = 2
+"""Default number of pages fetched ahead of the page being iterated."""
+
+_POLL_INTERVAL = 0.1
+
+
+class Paginator:
+    """Paginator iterates over all nodes of a GraphQL connection, requesting one
+    page after the other using the `endCursor` of the previous page, until its
+    `hasNextPage` is false.
+
+    The query must select `pageInfo { hasNextPage endCursor }` and either
+    `edges { node { ... } }` or `nodes { ... }` of the connection found using
+    `connection_path`, a string with keys separated by dots. The page size and
+    the cursor are passed as the variables named `size_variable` and
+    `cursor_variable`; the cursor is null for the first page:
+
+        query ($first: Int, $cursor: Cursor) {
+            alerts(first: $first, after: $cursor) {
+                edges { node { id occurredOn } }
+                pageInfo { hasNextPage endCursor }
+            }
+        }
+
+    While nodes of a page are iterated, up to `prefetch` following pages are
+    fetched by a background thread; at most `prefetch` pages are held besides
+    the page being iterated. With `prefetch` 0, pages are fetched only
+    when needed. Nodes are yielded as namedtuples called 'node'.
+
+    With a `checkpoint`, the cursor of the next page is saved once all nodes of
+    a page were handled, that is, when the node following the last node of the
+    page is requested, and iteration resumes from it when started again using
+    the same query, connection, and variables. Nodes of a page not completely
+    handled are iterated again. The checkpoint is cleared once the last page
+    was iterated.
+
+    Use `dcso.portal.APIClient.paginate` instead of creating Paginator directly.
+    """
+
+    def __init__(self, api: APIAbstract, query: str, connection_path: str,
+                 page_size: int = DEFAULT_PAGE_SIZE,
+                 variables: Optional[dict] = None,
+                 fragments: Optional[List[str]] = None,
+                 prefetch: int = DEFAULT_PREFETCH,
+                 cursor_variable: str = 'cursor',
+                 size_variable: str = 'first',
+                 timeout: Union[Timeout, float, None] = None,
+                 deadline: Optional[Deadline] = None,
+                 checkpoint: Optional[Checkpoint] = None):
+        if page_size < 1:
+            raise ValueError("page_size must be at least 1")
+
+        self._api: APIAbstract = api
+        self.query: str = query
+        self.path: List[str] = connection_path.split('.')
+        self.page_size: int = page_size
+        self.variables: dict = dict(variables or {})
+        self.fragments: Optional[List[str]] = fragments
+        self.prefetch: int = max(0, prefetch)
+        self.cursor_variable: str = cursor_variable
+        self.size_variable: str = size_variable
+        self.timeout: Union[Timeout, float, None] = timeout
+        self.deadline: Optional[Deadline] = deadline
+        self.checkpoint: Optional[Checkpoint] = checkpoint
+
+    def __iter__(self) -> Iterator[Any]:
+        cursor, count = None, 0
+        checkpoint = self.checkpoint
+        if checkpoint is not None:
+            checkpoint.load(fingerprint(self.query, '.'.join(self.path), self.variables, self.fragments))
+            cursor, count = checkpoint.cursor, checkpoint.count
+
+        pages = self._pages(cursor) if self.prefetch == 0 else self._prefetched_pages(cursor)
+        for nodes, next_cursor in pages:
+            for node in nodes:
+                yield graphql_data_to_namedtuple(node, 'node')
+
+            # the last node was handled once the next one is requested
+            count += len(nodes)
+            if checkpoint is not None:
+                if next_cursor is None:
+                    checkpoint.clear()
+                else:
+                    checkpoint.save(next_cursor, count)
+
+    def fetch(self, cursor: Optional[str]) -> Tuple[list, Optional[str]]:
+        """Fetches the page following `cursor`, and returns its nodes, as
+        dictionaries, and the cursor of the next page, or None when it is the last."""
+        variables = dict(self.variables)
+        variables[self.size_variable] = self.page_size
+        variables[self.cursor_variable] = cursor
+
+        data = self._api.execute_graphql_dict(self.query, variables=variables, fragments=self.fragments,
+                                              timeout=self.timeout, deadline=self.deadline)
+        nodes, page_info = connection_page(data, self.path)
+
+        end_cursor = page_info.get('endCursor')
+        if not page_info.get('hasNextPage') or end_cursor is None or end_cursor == cursor:
+            return nodes, None
+        return nodes, end_cursor
+
+    def _pages(self, cursor: Optional[str]) -> Iterator[Tuple[list, Optional[str]]]:
+        while True:
+            nodes, cursor = self.fetch(cursor)
+            yield nodes, cursor
+            if cursor is None:
+                return
+
+    def _prefetched_pages(self, cursor: Optional[str]) -> Iterator[Tuple[list, Optional[str]]]:
+        # a page is only fetched when one of the slots is free; a slot is freed
+        # once a fetched page is taken for being iterated
+        pages: queue.Queue = queue.Queue()
+        slots = threading.Semaphore(self.prefetch)
+        stop = threading.Event()
+
+        def produce():
+            try:
+                for page in self._pages_in_slots(cursor, slots, stop):
+                    pages.put((page, None))
+            except BaseException as exc:
+                pages.put((None, exc))
+                return
+            pages.put(None)
+
+        producer = threading.Thread(target=produce, name='dcso-portal-paginator', daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = pages.get()
+                slots.release()
+                if item is None:
+                    return
+                page, exc = item
+                if exc is not None:
+                    raise exc
+                yield page
+        finally:
+            stop.set()
+
+    def _pages_in_slots(self, cursor: Optional[str], slots: threading.Semaphore,
+                        stop: threading.Event) -> Iterator[Tuple[list, Optional[str]]]:
+        """Yields the pages as `_pages` does, fetching each only once one of
+        `slots` was acquired. Returns when `stop` is set."""
+        while _acquire(slots, stop):
+            nodes, cursor = self.fetch(cursor)
+            yield nodes, cursor
+            if cursor is None:
+                return
+
+
+def connection_page(data: dict, path: List[str]) -> Tuple[list, dict]:
+    """Returns the nodes, as dictionaries, and the page info of the connection
+    found using the keys in `path` within the response `data`."""
+    connection = data
+    for key in path:
+        if not isinstance(connection, dict) or key not in connection:
+            raise PortalAPIRequest(f"API response is missing connection '{'.'.join(path)}'")
+        connection = connection[key]
+
+    if connection is None:
+        return [], {}
+
+    try:
+        if 'edges' in connection:
+            nodes = [edge['node'] for edge in connection['edges'] or []]
+        else:
+            nodes = list(connection['nodes'] or [])
+        return nodes, connection['pageInfo'] or {}
+    except (KeyError, TypeError) as exc:
+        raise PortalAPIRequest(f"API response contained unusable connection: missing {exc}")
+
+
+def _acquire(slots: threading.Semaphore, stop: threading.Event) -> bool:
+    """Acquires one of `slots`, waiting for one unless `stop` is set. Returns
+    False when stopped."""
+    while not stop.is_set():
+        if slots.acquire(timeout=_POLL_INTERVAL):
+            return True
+    return False
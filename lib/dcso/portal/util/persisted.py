@@ -0,0 +1,93 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+Support for Automatic Persisted Queries (APQ): sending the SHA-256 hash of
+a GraphQL document instead of the document itself.
+"""
+
+import hashlib
+import json
+import threading
+from typing import Dict, Optional
+
+PERSISTED_QUERY_NOT_FOUND = 'PersistedQueryNotFound'
+PERSISTED_QUERY_NOT_SUPPORTED = 'PersistedQueryNotSupported'
+
+_ERROR_CODES = {
+    'PERSISTED_QUERY_NOT_FOUND': PERSISTED_QUERY_NOT_FOUND,
+    'PERSISTED_QUERY_NOT_SUPPORTED': PERSISTED_QUERY_NOT_SUPPORTED,
+}
+
+_MAX_HASHES = 1024
+
+
+class PersistedQueries:
+    """PersistedQueries remembers which GraphQL documents were registered with
+    the API as persisted query, for one client.
+
+    A document which is not yet registered is sent in full, together with its
+    hash, which registers it. After this, only the hash is sent. When the API
+    replies that it does not know the hash, for example because it forgot it,
+    the document is sent in full again.
+
+    When the API replies that it does not support persisted queries, documents
+    are sent in full from then on.
+    """
+
+    def __init__(self):
+        self.supported: bool = True
+        self._lock = threading.Lock()
+        self._registered: set = set()
+        self._hashes: Dict[str, str] = {}
+
+    def sha256(self, document: str) -> str:
+        """Returns the hex encoded SHA-256 hash of `document`, which is
+        remembered for frequently used documents."""
+        digest = self._hashes.get(document)
+        if digest is None:
+            digest = hashlib.sha256(document.encode('utf-8')).hexdigest()
+            with self._lock:
+                if len(self._hashes) >= _MAX_HASHES:
+                    self._hashes.clear()
+                self._hashes[document] = digest
+        return digest
+
+    def is_registered(self, digest: str) -> bool:
+        with self._lock:
+            return digest in self._registered
+
+    def registered(self, digest: str) -> None:
+        with self._lock:
+            self._registered.add(digest)
+
+    def forget(self, digest: str) -> None:
+        with self._lock:
+            self._registered.discard(digest)
+
+
+def extensions(digest: str) -> dict:
+    """Returns the `extensions` of a GraphQL request identifying the document
+    using its hash `digest`."""
+    return {'persistedQuery': {'version': 1, 'sha256Hash': digest}}
+
+
+def persisted_query_error(body: bytes) -> Optional[str]:
+    """Returns `PERSISTED_QUERY_NOT_FOUND` or `PERSISTED_QUERY_NOT_SUPPORTED`
+    when the response `body` holds this error, otherwise None."""
+    if b'PersistedQuery' not in body and b'PERSISTED_QUERY' not in body:
+        return None
+
+    try:
+        errors = json.loads(body.decode('utf-8'))['errors']
+    except (ValueError, UnicodeError, TypeError, KeyError):
+        return None
+
+    for error in errors if isinstance(errors, list) else []:
+        if not isinstance(error, dict):
+            continue
+        if error.get('message') in (PERSISTED_QUERY_NOT_FOUND, PERSISTED_QUERY_NOT_SUPPORTED):
+            return error['message']
+        code = (error.get('extensions') or {}).get('code')
+        if code in _ERROR_CODES:
+            return _ERROR_CODES[code]
+    return None
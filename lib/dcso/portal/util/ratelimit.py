@@ -0,0 +1,107 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+Client-side rate limiting of requests sent to the DCSO Portal API.
+"""
+
+import threading
+import time
+from typing import Optional
+
+_RECOVERY_STEPS = 20
+_THROTTLE_FACTOR = 0.5
+
+
+class RateLimiter:
+    """RateLimiter spreads requests over time using a token bucket, and caps
+    the number of requests in flight.
+
+    At most `rate` requests per second are started, with bursts of up to `burst`
+    requests (by default, one second worth of requests). When `rate` is None, the
+    number of requests per second is not limited. When `max_in_flight` is given,
+    no more than this number of requests are in flight at the same time; others
+    wait until a response was read.
+
+    The rate adapts to the API: when it responds with status 429 (Too Many
+    Requests), the rate is halved, down to `min_rate`, and no request is started
+    before the time given by the Retry-After header passed. With each successful
+    response, the rate is increased again, reaching the configured rate after
+    about 20 requests.
+
+    One RateLimiter is shared by all threads using the same `dcso.portal.APIClient`,
+    which makes them back off together instead of competing for the quota.
+    """
+
+    def __init__(self, rate: Optional[float] = None,
+                 burst: Optional[int] = None,
+                 max_in_flight: Optional[int] = None,
+                 min_rate: Optional[float] = None):
+        if rate is not None and rate <= 0:
+            raise ValueError("rate must be positive")
+
+        self.max_rate: Optional[float] = rate
+        self.min_rate: float = min_rate if min_rate is not None else (rate or 0) / 10
+        self.burst: float = float(burst if burst is not None else max(1.0, rate or 1.0))
+        self.max_in_flight: Optional[int] = max_in_flight
+
+        self._lock = threading.Lock()
+        self._rate: Optional[float] = rate
+        self._tokens: float = self.burst
+        self._updated: float = time.monotonic()
+        self._paused_until: float = 0.0
+        self._in_flight: Optional[threading.BoundedSemaphore] = None
+        if max_in_flight is not None:
+            self._in_flight = threading.BoundedSemaphore(max_in_flight)
+
+    @property
+    def rate(self) -> Optional[float]:
+        """Current number of requests per second, which is lower than the
+        configured rate after being throttled by the API."""
+        return self._rate
+
+    def reserve(self) -> float:
+        """Takes a token from the bucket and returns the number of seconds the
+        caller must wait before starting the request."""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._paused_until - now)
+            if self._rate is None:
+                return wait
+
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens < 0:
+                wait = max(wait, -self._tokens / self._rate)
+            return wait
+
+    def acquire(self) -> None:
+        """Blocks until a request may be started. Each call must be followed
+        by a call to `release` once the request is done."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        if self._in_flight is not None:
+            self._in_flight.acquire()
+
+    def release(self) -> None:
+        """Marks a request started using `acquire` as done."""
+        if self._in_flight is not None:
+            self._in_flight.release()
+
+    def throttled(self, retry_after: Optional[float] = None) -> None:
+        """Lowers the rate after the API responded with status 429. No request is
+        started during the next `retry_after` seconds, if given."""
+        with self._lock:
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            if self._rate is not None:
+                self._rate = max(self.min_rate, self._rate * _THROTTLE_FACTOR)
+                self._tokens = min(self._tokens, 0.0)
+
+    def succeeded(self) -> None:
+        """Raises the rate again, up to the configured rate, after a request
+        succeeded."""
+        with self._lock:
+            if self._rate is not None and self._rate < self.max_rate:
+                self._rate = min(self.max_rate, self._rate + self.max_rate / _RECOVERY_STEPS)
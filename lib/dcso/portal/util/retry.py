@@ -0,0 +1,118 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+Retry policy used when requests with the DCSO Portal API fail because
+of transient issues.
+"""
+
+import random
+import re
+import time
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import Optional, Sequence
+
+from ..exceptions import PortalAPIRequest
+from .document import parse_document, tokens
+from .temporal import utc_now
+
+DEFAULT_RETRY_STATUSES = (429, 502, 503, 504)
+"""HTTP status codes for which a request is retried by default."""
+
+_RE_MUTATION = re.compile(r'\bmutation\b')
+_MUTATION_CACHE_SIZE = 256
+
+
+class RetryPolicy:
+    """RetryPolicy defines when, and how often, a failed request is attempted again.
+
+    A request is retried when the connection with the API failed, or when the API
+    responded with one of the HTTP `statuses`. At most `max_attempts` attempts are
+    done (including the first), and retrying stops when `total_timeout` seconds
+    have passed since the first attempt.
+
+    Between attempts, we wait using exponential backoff with full jitter: a random
+    number of seconds between 0 and `backoff_base * 2 ** (attempt - 1)`, capped at
+    `backoff_max`. When the API tells us how long to wait, using the Retry-After
+    header, we wait that long instead.
+
+    Only requests which are idempotent, for example GraphQL queries, are retried.
+    Mutations are not retried, unless `retry_mutations` is True or the caller
+    marks the request as idempotent.
+    """
+
+    def __init__(self, max_attempts: int = 3,
+                 backoff_base: float = 0.5,
+                 backoff_max: float = 30.0,
+                 total_timeout: float = 60.0,
+                 statuses: Sequence[int] = DEFAULT_RETRY_STATUSES,
+                 retry_mutations: bool = False):
+        self.max_attempts: int = max(1, max_attempts)
+        self.backoff_base: float = backoff_base
+        self.backoff_max: float = backoff_max
+        self.total_timeout: float = total_timeout
+        self.statuses: frozenset = frozenset(statuses)
+        self.retry_mutations: bool = retry_mutations
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Returns the number of seconds to wait after failed `attempt`, which
+        starts at 1."""
+        if retry_after is not None:
+            return max(0.0, retry_after)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def next_wait(self, attempt: int, started: float, idempotent: bool,
+                  retry_after: Optional[float] = None) -> Optional[float]:
+        """Returns the number of seconds to wait before doing the next attempt,
+        or None when we must not retry. The `started` argument is the value of
+        `time.monotonic()` when the first attempt was done."""
+        if not (idempotent or self.retry_mutations) or attempt >= self.max_attempts:
+            return None
+
+        wait = self.backoff(attempt, retry_after)
+        if time.monotonic() + wait - started > self.total_timeout:
+            return None
+        return wait
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parses the value of the Retry-After header, which is either a number
+    of seconds or a HTTP date, and returns the number of seconds to wait.
+    None is returned when the value is missing or not valid."""
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - utc_now()).total_seconds())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def is_mutation(query: str, operation_name: Optional[str] = None) -> bool:
+    """Returns whether the operation executed by the GraphQL `query` document is
+    a mutation: the operation named `operation_name`, or the only operation of the
+    document. Fragment definitions may come first.
+
+    When it is not known which operation is executed, because the document holds
+    several and no name is given, or the document cannot be parsed, it is considered
+    a mutation when any operation might be one, so it is not retried or cached.
+    """
+    if _RE_MUTATION.search(query) is None:
+        return False
+    return _is_mutation(query, operation_name)
+
+
+@lru_cache(maxsize=_MUTATION_CACHE_SIZE)
+def _is_mutation(query: str, operation_name: Optional[str]) -> bool:
+    try:
+        operations = parse_document(query).operations
+    except PortalAPIRequest:
+        return 'mutation' in tokens(query)
+
+    if operation_name is not None:
+        operations = [operation for operation in operations if operation.name == operation_name]
+    return any(operation.kind == 'mutation' for operation in operations)
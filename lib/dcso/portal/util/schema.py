@@ -0,0 +1,279 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+Introspection of the GraphQL schema of the API, cached on disk, used to decode
+only fields of which the type is a timestamp.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Sequence, Union
+
+from ..exceptions import PortalAPIRequest, PortalException
+from .document import Field, InlineFragment, Selection, parse_document
+from .temporal import decode_utc_iso8601
+
+DEFAULT_DATETIME_SCALARS = frozenset({'DateTime', 'Timestamp'})
+"""Names of the scalar types of which values are decoded as timestamps."""
+
+DEFAULT_SCHEMA_MAX_AGE = 24 * 3600.0
+"""Default number of seconds after which a cached schema is introspected again."""
+
+_PLAN_CACHE_SIZE = 256
+
+INTROSPECTION_QUERY = '''
+query IntrospectionQuery {
+  __schema {
+    queryType { name }
+    mutationType { name }
+    subscriptionType { name }
+    types { ...FullType }
+    directives { name locations args { ...InputValue } }
+  }
+}
+
+fragment FullType on __Type {
+  kind
+  name
+  fields(includeDeprecated: true) { name args { ...InputValue } type { ...TypeRef } isDeprecated }
+  inputFields { ...InputValue }
+  interfaces { ...TypeRef }
+  enumValues(includeDeprecated: true) { name isDeprecated }
+  possibleTypes { ...TypeRef }
+}
+
+fragment InputValue on __InputValue {
+  name
+  type { ...TypeRef }
+  defaultValue
+}
+
+fragment TypeRef on __Type {
+  kind
+  name
+  ofType { kind name ofType { kind name ofType { kind name ofType { kind name
+    ofType { kind name ofType { kind name ofType { kind name } } } } } } }
+}
+'''
+"""Query getting the complete schema of the API, without descriptions."""
+
+
+def schema_checksum(schema: dict) -> str:
+    """Returns a checksum of `schema`, the value of `__schema` in the response to
+    `INTROSPECTION_QUERY`. The order of types does not matter.
+
+    The checksum only tells whether a stored copy of the schema is intact; it cannot
+    tell whether the schema of the API changed since it was introspected.
+    """
+    types = sorted(schema.get('types') or [], key=lambda t: t.get('name') or '')
+    canonical = json.dumps(dict(schema, types=types), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def named_type(type_ref: Optional[dict]) -> Optional[dict]:
+    """Returns the named type of `type_ref`, unwrapping non-null and list types."""
+    while type_ref is not None and type_ref.get('kind') in ('NON_NULL', 'LIST'):
+        type_ref = type_ref.get('ofType')
+    return type_ref
+
+
+class Schema:
+    """Schema holds the types of the fields of `schema`, the value of `__schema` in
+    the response to `INTROSPECTION_QUERY`, and decodes the values of fields of which
+    the type is one of the scalar types `scalars` as timestamps.
+
+    Fields are looked up by the type they belong to, following the selections of
+    the query, including aliases and fragments. For example, when `Alert.occurredOn`
+    is a `DateTime`, both `occurredOn` and `when` are decoded in:
+
+        { alert { occurredOn when: occurredOn note } }
+
+    while a field `occurredOn` of another type, of which the type is `String`, is
+    left alone.
+    """
+
+    def __init__(self, schema: dict, scalars: Iterable[str] = DEFAULT_DATETIME_SCALARS):
+        scalars = frozenset(scalars)
+        self._roots: Dict[str, Optional[str]] = {
+            kind: (schema.get(kind + 'Type') or {}).get('name') for kind in ('query', 'mutation', 'subscription')}
+
+        # type of each field, by type; True for timestamps
+        self._fields: Dict[str, Dict[str, Union[str, bool]]] = {}
+        for schema_type in schema.get('types') or []:
+            fields = {}
+            for field in schema_type.get('fields') or []:
+                field_type = named_type(field.get('type')) or {}
+                if field_type.get('kind') == 'SCALAR' and field_type.get('name') in scalars:
+                    fields[field['name']] = True
+                elif field_type.get('name'):
+                    fields[field['name']] = field_type['name']
+            self._fields[schema_type.get('name')] = fields
+
+        self._plans: Dict[str, dict] = {}
+
+    def timestamp_plan(self, document: str) -> dict:
+        """Returns where timestamps are found in the data of the response to the
+        query `document`: a dictionary mapping the keys of the fields holding
+        timestamps to True, and of the fields holding objects with timestamps to
+        the dictionary for those objects. Lists are not part of the plan.
+
+        Plans are kept per document.
+
+        Raises `PortalAPIRequest` when the document cannot be parsed.
+        """
+        plan = self._plans.get(document)
+        if plan is None:
+            parsed = parse_document(document)
+            plan = {}
+            for operation in parsed.operations:
+                self._plan(operation.selections, self._roots.get(operation.kind), parsed.fragments, plan, frozenset())
+            if len(self._plans) >= _PLAN_CACHE_SIZE:
+                self._plans.clear()
+            self._plans[document] = plan
+        return plan
+
+    def _plan(self, selections: List[Selection], parent: Optional[str], fragments: dict,
+              plan: dict, spreading: FrozenSet[str]) -> None:
+        fields = self._fields.get(parent) or {}
+        for selection in selections:
+            if isinstance(selection, Field):
+                field_type = fields.get(selection.name)
+                if field_type is True:
+                    plan.setdefault(selection.key, True)
+                elif field_type is not None and selection.selections:
+                    created = selection.key not in plan
+                    sub = plan.setdefault(selection.key, {})
+                    if isinstance(sub, dict):
+                        self._plan(selection.selections, field_type, fragments, sub, spreading)
+                        if created and not sub:
+                            del plan[selection.key]
+            elif isinstance(selection, InlineFragment):
+                self._plan(selection.selections, selection.type_condition or parent, fragments, plan, spreading)
+            elif selection.name in fragments and selection.name not in spreading:
+                type_condition, fragment = fragments[selection.name]
+                self._plan(fragment, type_condition, fragments, plan, spreading | {selection.name})
+
+    def decode_timestamps(self, data: Any, document: str, path: Sequence[str] = ()) -> Any:
+        """Decodes, in place, the timestamps in `data`, found in the response to the
+        query `document` using `path`, a sequence of keys within the response data.
+        Returns the decoded data, which is only another object when `data` itself
+        is a timestamp.
+
+        Raises `PortalAPIRequest` when the document cannot be parsed.
+        """
+        plan = self.timestamp_plan(document)
+        for key in path:
+            if not isinstance(plan, dict) or key not in plan:
+                return data
+            plan = plan[key]
+        return _decode(data, plan)
+
+
+def _decode(value: Any, plan: Union[dict, bool]) -> Any:
+    if isinstance(value, list):
+        for i, item in enumerate(value):
+            value[i] = _decode(item, plan)
+    elif plan is True:
+        if isinstance(value, str):
+            try:
+                return decode_utc_iso8601(value)
+            except ValueError:
+                pass
+    elif isinstance(value, dict):
+        for key, sub in plan.items():
+            item = value.get(key)
+            if item is not None:
+                value[key] = _decode(item, sub)
+    return value
+
+
+class SchemaCache:
+    """SchemaCache stores the schema introspected from the API in the file found
+    at `path`, together with the URL of the API, when it was introspected, and
+    its checksum (see `schema_checksum`).
+
+    A stored schema is used when it belongs to the same API, is intact, and is not
+    older than `max_age` seconds. Whether the schema of the API changed is not
+    checked; lower `max_age`, or use `refresh` of
+    `dcso.portal.APIClient.load_schema`, when the API is upgraded often. The file
+    is replaced atomically.
+
+    Use with `dcso.portal.APIClient.load_schema`.
+    """
+
+    def __init__(self, path: str, max_age: float = DEFAULT_SCHEMA_MAX_AGE):
+        self.path: str = path
+        self.max_age: float = max_age
+        self.checksum: Optional[str] = None
+
+    def load(self, api_url: str) -> Optional[dict]:
+        """Returns the stored schema of the API at `api_url`, or None when there is
+        none, or it is too old."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as fp:
+                stored = json.load(fp)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as exc:
+            raise PortalException(f"failed reading schema cache {self.path}: {exc}")
+
+        if not isinstance(stored, dict) or stored.get('apiURL') != api_url:
+            return None
+        if time.time() - (stored.get('introspectedOn') or 0) > self.max_age:
+            return None
+        schema = stored.get('schema')
+        if not isinstance(schema, dict) or schema_checksum(schema) != stored.get('checksum'):
+            return None
+
+        self.checksum = stored['checksum']
+        return schema
+
+    def save(self, api_url: str, schema: dict) -> None:
+        """Stores `schema`, introspected now from the API at `api_url`."""
+        self.checksum = schema_checksum(schema)
+        data = json.dumps({
+            'apiURL': api_url,
+            'introspectedOn': time.time(),
+            'checksum': self.checksum,
+            'schema': schema,
+        })
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.schema-', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as fp:
+                fp.write(data)
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as exc:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise PortalException(f"failed writing schema cache {self.path}: {exc}")
+
+    def clear(self) -> None:
+        """Removes the file, so the schema is introspected again."""
+        self.checksum = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            raise PortalException(f"failed removing schema cache {self.path}: {exc}")
+
+
+def introspection_schema(data: dict) -> dict:
+    """Returns the schema found in `data`, the data of the response to
+    `INTROSPECTION_QUERY`.
+
+    Raises `PortalAPIRequest` when it holds no schema.
+    """
+    schema = (data or {}).get('__schema')
+    if not isinstance(schema, dict) or not isinstance(schema.get('types'), list):
+        raise PortalAPIRequest("API response holds no schema")
+    return schema
@@ -0,0 +1,144 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+In-process stand-in for the DCSO Portal API, useful for tests and benchmarks
+which must not depend on the network.
+"""
+
+import json
+import threading
+import time
+from typing import Any, Callable, List, Optional, Union
+from urllib.parse import ParseResult
+
+from ..exceptions import PortalAPIRequest, PortalTimeout
+from .timeout import Deadline, Timeout
+from .transport import BufferedResponse, Transport, TransportStats
+
+Responder = Callable[[Any], Union[dict, list, bytes]]
+"""Callable receiving the decoded GraphQL request (a dictionary with keys 'query'
+and possibly 'variables', or a list of these for batches), returning the response
+as dictionary, list, or as encoded JSON."""
+
+
+class StandInTransport(Transport):
+    """StandInTransport answers GraphQL requests in-process, without network.
+
+    Each request is answered with `response`, which is either a dictionary or
+    already encoded JSON, or with what `responder` returns for the request. The
+    HTTP status is `status`. Each request takes at least `latency` seconds, which
+    helps simulating a remote API.
+
+    Requests are recorded in `requests` as decoded JSON. Use the
+    transport with `dcso.portal.APIClient`:
+
+        transport = StandInTransport(response={'data': {'ping': 'pong'}})
+        apic = APIClient(api_url, transport=transport)
+
+    Use `generate_connection` to create large responses.
+    """
+
+    def __init__(self, response: Union[dict, bytes, None] = None,
+                 responder: Optional[Responder] = None,
+                 status: int = 200,
+                 latency: float = 0.0):
+        if response is None and responder is None:
+            raise ValueError("response or responder is required")
+
+        self.response: Union[dict, bytes, None] = response
+        self.responder: Optional[Responder] = responder
+        self.status: int = status
+        self.latency: float = latency
+        self.requests: List[Any] = []
+        self.stats: TransportStats = TransportStats()
+
+        self._lock = threading.Lock()
+        self._closed: bool = False
+        self._encoded: Optional[bytes] = None
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def close(self) -> None:
+        self._closed = True
+
+    def request(self, method: str, url: Union[ParseResult, str],
+                body: Optional[bytes] = None, headers: Optional[dict] = None,
+                idempotent: bool = True, timeout: Optional[Timeout] = None,
+                deadline: Optional[Deadline] = None) -> BufferedResponse:
+        if self._closed:
+            raise PortalAPIRequest("transport is closed")
+        if deadline is not None:
+            deadline.check()
+
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError as exc:
+            raise PortalAPIRequest(f"stand-in transport received invalid JSON: {exc}")
+
+        with self._lock:
+            self.requests.append(payload)
+
+        self.stats.increment('requests')
+        self.stats.increment('attempts')
+        self.stats.increment('bytes_sent', len(body or b''))
+        self.stats.increment('bytes_encoded', len(body or b''))
+
+        if self.latency:
+            if deadline is not None and deadline.remaining() < self.latency:
+                time.sleep(deadline.remaining())
+                raise PortalTimeout("timed out waiting for API")
+            time.sleep(self.latency)
+
+        data = self._encode(payload)
+        self.stats.increment('bytes_received', len(data))
+        self.stats.increment('bytes_decoded', len(data))
+        return BufferedResponse(self.status, data, headers={'Content-Type': 'application/json'})
+
+    def _encode(self, payload: dict) -> bytes:
+        if self.responder is not None:
+            result = self.responder(payload)
+        elif self._encoded is not None:
+            return self._encoded
+        else:
+            result = self.response
+
+        if not isinstance(result, bytes):
+            result = json.dumps(result).encode('utf-8')
+        if self.responder is None:
+            # canned response; encode only once
+            self._encoded = result
+        return result
+
+
+def generate_connection(path: str, count: int, node: Optional[Callable[[int], dict]] = None) -> dict:
+    """Returns a GraphQL response holding a connection with `count` edges, found
+    using `path`, a string with keys separated by dots, within the data.
+
+    Each edge holds a node created by calling `node` with the index of the edge.
+    By default, nodes look like alerts having an ID, timestamps, and a few other
+    fields.
+    """
+    node = node or _default_node
+    value = {
+        'totalCount': count,
+        'pageInfo': {'hasNextPage': False, 'endCursor': str(count - 1) if count else None},
+        'edges': [{'cursor': str(i), 'node': node(i)} for i in range(count)],
+    }
+
+    for key in reversed(path.split('.')):
+        value = {key: value}
+    return {'data': value}
+
+
+def _default_node(i: int) -> dict:
+    return {
+        'id': f'{i:08d}-0000-4000-8000-000000000000',
+        'reference': f'ALERT-{i}',
+        'severity': i % 5,
+        'occurredOn': '2021-02-08T10:{:02d}:{:02d}Z'.format(i // 60 % 60, i % 60),
+        'updatedOn': '2021-02-09T11:12:13.123456Z',
+        'tags': ['tdh', 'ioc'],
+        'source': {'name': 'sensor', 'kind': 'network'},
+    }
@@ -0,0 +1,245 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+GraphQL subscriptions using the graphql-transport-ws protocol over WebSocket.
+"""
+
+import json
+import ssl
+import threading
+import time
+from collections import namedtuple
+from typing import Callable, FrozenSet, Iterator, Optional, Union
+from urllib.parse import ParseResult, urlparse
+
+from ..exceptions import PortalAPIRequest, PortalConnection, PortalTimeout
+from .graphql import GraphQLJSONDecoder, GraphQLJSONEncoder, check_graphql_errors, graphql_data_to_namedtuple
+from .retry import RetryPolicy
+from .schema import Schema
+from .websocket import WebSocket, WebSocketClosed
+
+GRAPHQL_TRANSPORT_WS = 'graphql-transport-ws'
+"""Name of the WebSocket subprotocol used for subscriptions."""
+
+DEFAULT_KEEPALIVE = 30.0
+"""Default number of seconds without messages after which we send a ping."""
+
+DEFAULT_ACK_TIMEOUT = 10.0
+"""Default number of seconds we wait for the server to acknowledge the connection."""
+
+# close codes of graphql-transport-ws after which reconnecting does not help
+_FATAL_CLOSE_CODES = {
+    4400: "invalid message",
+    4401: "unauthorized",
+    4403: "forbidden",
+    4409: "subscriber already exists",
+    4429: "too many initialisation requests",
+}
+
+_SUBSCRIPTION_ID = '1'
+
+
+def websocket_url(api_url: Union[ParseResult, str]) -> str:
+    """Returns the WebSocket URL of the API found at `api_url`."""
+    url = api_url if isinstance(api_url, ParseResult) else urlparse(api_url)
+    scheme = {'https': 'wss', 'http': 'ws'}.get(url.scheme, url.scheme)
+    return url._replace(scheme=scheme).geturl()
+
+
+class Subscription:
+    """Subscription receives the events of a GraphQL subscription, sent by the
+    server at `url` using the graphql-transport-ws protocol.
+
+    The connection is authenticated using `token`, which is sent in the
+    Authorization header of the opening handshake, and in the payload of the
+    `connection_init` message. Once the server acknowledged the connection,
+    the subscription is started with `payload`, holding the query and its
+    variables.
+
+    When no message was received for `keepalive` seconds, a ping is sent. When
+    the server does not answer within another `keepalive` seconds, or when the
+    connection is lost, we reconnect and subscribe again, following the
+    `reconnect` policy: at most `max_attempts` consecutive connections failing
+    before an event was received, waiting as given by `RetryPolicy.backoff` in
+    between. Events sent while reconnecting are lost.
+
+    Timestamps are decoded as with `dcso.portal.APIClient`, optionally only in
+    the fields named in `datetime_fields`, or following the types of the fields
+    in `schema`.
+
+    Iterate over the subscription to get the data of each event as namedtuple;
+    iteration ends when the server completes the subscription, or after `close`.
+    Alternatively, `run` calls a function for each event.
+
+    Use `dcso.portal.APIClient.subscribe` instead of creating Subscription directly.
+    """
+
+    def __init__(self, url: Union[ParseResult, str], payload: dict,
+                 token: Optional[str] = None,
+                 ssl_context: Optional[ssl.SSLContext] = None,
+                 keepalive: float = DEFAULT_KEEPALIVE,
+                 ack_timeout: float = DEFAULT_ACK_TIMEOUT,
+                 reconnect: Optional[RetryPolicy] = None,
+                 datetime_fields: Optional[FrozenSet[str]] = None,
+                 schema: Optional[Schema] = None):
+        self.url: Union[ParseResult, str] = url
+        self.payload: dict = payload
+        self.token: Optional[str] = token
+        self.ssl_context: Optional[ssl.SSLContext] = ssl_context
+        self.keepalive: float = keepalive
+        self.ack_timeout: float = ack_timeout
+        self.reconnect: RetryPolicy = reconnect or RetryPolicy(max_attempts=5)
+        self.datetime_fields: Optional[FrozenSet[str]] = datetime_fields
+        self.schema: Optional[Schema] = schema
+        self.reconnects: int = 0
+
+        self._ws: Optional[WebSocket] = None
+        self._closed = threading.Event()
+        self._completed: bool = False
+
+    @property
+    def closed(self) -> bool:
+        return self._closed.is_set()
+
+    def __iter__(self) -> Iterator[namedtuple]:
+        for data in self.events():
+            yield graphql_data_to_namedtuple(data)
+
+    def __enter__(self) -> 'Subscription':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def run(self, callback: Callable[[namedtuple], None]) -> None:
+        """Calls `callback` with the data of each event, as namedtuple, until the
+        subscription is completed or closed."""
+        for data in self:
+            callback(data)
+
+    def events(self) -> Iterator[dict]:
+        """Yields the data of each event as dictionary, decoded using `GraphQLJSONDecoder`.
+
+        Raises `PortalAPIError` when the server reported an error for the
+        subscription, which ends it.
+        """
+        failures = 0
+        try:
+            while not self.closed and not self._completed:
+                try:
+                    self._connect()
+                    for data in self._receive():
+                        failures = 0
+                        yield data
+                except PortalConnection as exc:
+                    self._abort()
+                    if self.closed:
+                        return
+                    if self._completed:
+                        raise
+                    if isinstance(exc, WebSocketClosed) and exc.code in _FATAL_CLOSE_CODES:
+                        raise PortalAPIRequest(f"subscription rejected: {_FATAL_CLOSE_CODES[exc.code]}"
+                                               f" ({exc.code} {exc.reason})".rstrip())
+
+                    failures += 1
+                    if failures >= self.reconnect.max_attempts:
+                        raise
+                    self.reconnects += 1
+                    if self._closed.wait(self.reconnect.backoff(failures)):
+                        return
+        finally:
+            self._abort()
+
+    def close(self) -> None:
+        """Stops the subscription and closes the connection. This can be called
+        from another thread, which ends iteration."""
+        self._closed.set()
+        ws = self._ws
+        if ws is not None:
+            try:
+                self._send(ws, {'id': _SUBSCRIPTION_ID, 'type': 'complete'})
+            except PortalConnection:
+                pass
+            ws.close()
+
+    def _connect(self) -> None:
+        headers = {}
+        init = {'type': 'connection_init'}
+        if self.token:
+            headers['Authorization'] = 'Bearer ' + self.token
+            init['payload'] = {'Authorization': 'Bearer ' + self.token}
+
+        ws = WebSocket(self.url, subprotocols=[GRAPHQL_TRANSPORT_WS], headers=headers,
+                       ssl_context=self.ssl_context)
+        ws.connect(timeout=self.ack_timeout)
+        self._ws = ws
+        if self.closed:
+            raise WebSocketClosed()
+
+        self._send(ws, init)
+        deadline = time.monotonic() + self.ack_timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise PortalTimeout("timed out waiting for connection_ack")
+            message = self._recv(ws, remaining)
+            if message.get('type') == 'connection_ack':
+                break
+            self._handle_ping(ws, message)
+
+        self._send(ws, {'id': _SUBSCRIPTION_ID, 'type': 'subscribe', 'payload': self.payload})
+
+    def _receive(self) -> Iterator[dict]:
+        ws = self._ws
+        pinged = False
+        while True:
+            try:
+                message = self._recv(ws, self.keepalive)
+            except PortalTimeout:
+                if pinged:
+                    raise PortalConnection("server did not answer ping")
+                self._send(ws, {'type': 'ping'})
+                pinged = True
+                continue
+            pinged = False
+
+            kind = message.get('type')
+            if kind == 'next' and message.get('id') == _SUBSCRIPTION_ID:
+                payload = message.get('payload') or {}
+                check_graphql_errors(payload)
+                if self.schema is not None and payload.get('data') is not None:
+                    self.schema.decode_timestamps(payload['data'], self.payload['query'])
+                yield payload.get('data')
+            elif kind == 'error' and message.get('id') == _SUBSCRIPTION_ID:
+                self._completed = True
+                check_graphql_errors({'errors': message.get('payload') or [{'message': 'subscription failed'}]})
+                raise PortalAPIRequest("subscription failed")
+            elif kind == 'complete' and message.get('id') == _SUBSCRIPTION_ID:
+                self._completed = True
+                return
+            else:
+                self._handle_ping(ws, message)
+
+    def _handle_ping(self, ws: WebSocket, message: dict) -> None:
+        if message.get('type') == 'ping':
+            self._send(ws, {'type': 'pong'})
+
+    def _abort(self) -> None:
+        ws, self._ws = self._ws, None
+        if ws is not None:
+            ws.abort()
+
+    @staticmethod
+    def _send(ws: WebSocket, message: dict) -> None:
+        ws.send(json.dumps(message, cls=GraphQLJSONEncoder))
+
+    def _recv(self, ws: WebSocket, timeout: float) -> dict:
+        text = ws.recv(timeout)
+        try:
+            fields = frozenset() if self.schema is not None else self.datetime_fields
+            message = json.loads(text, cls=GraphQLJSONDecoder, datetime_fields=fields)
+        except ValueError as exc:
+            raise PortalAPIRequest(f"failed decoding subscription message: {exc}")
+        if not isinstance(message, dict):
+            raise PortalAPIRequest("subscription message is not an object")
+        return message
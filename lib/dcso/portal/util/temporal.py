@@ -1,6 +1,7 @@
 # Copyright (c) 2020, 2021, DCSO GmbH
 
 from datetime import datetime, timedelta, timezone
+from typing import Dict
 
 
 def utc_now() -> datetime:
@@ -20,6 +21,16 @@ def diff_utc_now(dt: datetime) -> timedelta:
     return dt - utc_now()
 
 
+TIMESTAMP_CACHE_SIZE = 4096
+"""Maximum number of timestamps kept decoded by `decode_utc_iso8601`."""
+
+_ZERO_HOUR = '+00:00'
+_ONE_MICROSECOND = timedelta(microseconds=1)
+
+# decoded timestamps by their string, emptied when full
+_decoded: Dict[str, datetime] = {}
+
+
 def decode_utc_iso8601(s: str) -> datetime:
     """Decodes a UTC ISO 8601 formatted timestamp and returns it as a
     non-naive `datetime.datetime` instance.
@@ -27,43 +38,58 @@ def decode_utc_iso8601(s: str) -> datetime:
     Since the Python method datetime.fromisoformat does only support
     timezone designator offsets, we must translate zone designators.
 
-    The 'Z' and ' UTC' (note space) zone designators are translated
+    The 'Z', ' UTC' (note space) and '+00' zone designators are translated
     as '+00:00'.
 
     Any timestamp that does not contain a timezone designator, offset
     or name, or is not UTC, is considered invalid and ValueError is raised.
 
     Note that only microsecond precision is supported. For example,
-    nanoseconds will be truncated and rounded till microseconds.
+    nanoseconds will be rounded to microseconds.
+
+    Up to `TIMESTAMP_CACHE_SIZE` decoded timestamps are kept, so timestamps
+    repeated in responses are decoded once. Instances of `datetime.datetime`
+    are immutable, so returning the same instance again is safe.
     """
-    zero_hour = '+00:00'
     try:
-        if not s[-6:] == zero_hour:
-            if s[-1:] == 'Z':
-                s = s.replace('Z', zero_hour)
-            elif s[-4:] == ' UTC':
-                s = s.replace(' UTC', zero_hour)
-            elif s[-3:] == '+00':
-                s = s.replace('+00', zero_hour)
-            else:
-                raise ValueError("timezone UTC not recognized")
-
-        dot_index = s.find('.')
-        tz_index = s.find('+')
-        if dot_index > 0 and tz_index > dot_index + 7:
-            # we make sure that the fraction has 6 digits
-            # allowing microseconds, but not nanoseconds
-            fraction = s[dot_index + 1:tz_index]
-            s = s.replace('.' + fraction, '.' + str(round(int(fraction) / 1000)))
+        dt = _decoded.get(s)
+    except TypeError:
+        # not hashable, so certainly not a string
+        raise ValueError
+    if dt is not None:
+        return dt
 
-        try:
-            return datetime.fromisoformat(s)
-        except AttributeError:
-            # for Python 3.6
-            return fromisoformat(s)
+    try:
+        # strip the zone designator, instead of searching and replacing it
+        if s[-1:] == 'Z':
+            base = s[:-1]
+        elif s[-6:] == _ZERO_HOUR:
+            base = s[:-6]
+        elif s[-4:] == ' UTC':
+            base = s[:-4]
+        elif s[-3:] == '+00':
+            base = s[:-3]
+        else:
+            raise ValueError("timezone UTC not recognized")
+
+        if len(base) > 26 and base[19] == '.':
+            # more digits than microseconds, for example nanoseconds,
+            # which are rounded to what datetime supports
+            if not base[26:].isdigit():
+                raise ValueError("invalid fraction")
+            dt = _fromisoformat(base[:26] + _ZERO_HOUR)
+            if base[26] >= '5':
+                dt += _ONE_MICROSECOND
+        else:
+            dt = _fromisoformat(base + _ZERO_HOUR)
     except (ValueError, TypeError):
         raise ValueError
 
+    if len(_decoded) >= TIMESTAMP_CACHE_SIZE:
+        _decoded.clear()
+    _decoded[s] = dt
+    return dt
+
 
 def fromisoformat(date_string: str) -> datetime:
     """Construct a datetime from the output of datetime.isoformat().
@@ -191,3 +217,7 @@ def _parse_hh_mm_ss_ff(tstr):
                 time_comps[3] *= 1000
 
     return time_comps
+
+
+# datetime.fromisoformat is not available in Python 3.6
+_fromisoformat = getattr(datetime, 'fromisoformat', fromisoformat)
@@ -0,0 +1,176 @@
+# Copyright (c) 2021, DCSO GmbH
+
+import time
+import unittest
+from datetime import datetime
+
+from ..api import APIClient
+from ..exceptions import PortalAPIError
+from .cache import ResponseCache, normalize_query
+from .standin import StandInTransport
+
+
+class TestNormalizeQuery(unittest.TestCase):
+    def test_normalize(self):
+        exp = 'query($id:ID!$n:Int=-1){user(id:$id name:"a  b, c"){...f id name}}'
+        cases = [
+            exp,
+            'query ($id: ID!, $n: Int = -1) { user(id: $id, name: "a  b, c") { ...f id name } }',
+            '''query ($id: ID!,
+                      $n: Int = -1) {
+                # the user
+                user(id: $id, name: "a  b, c") {
+                    ...f
+                    id, name
+                }
+            }''',
+        ]
+
+        for query in cases:
+            with self.subTest(query=query):
+                self.assertEqual(exp, normalize_query(query))
+
+        self.assertNotEqual(normalize_query('{ a(s: "x y") }'), normalize_query('{ a(s: "x  y") }'))
+        self.assertNotEqual(normalize_query('{ a b }'), normalize_query('{ ab }'))
+        self.assertEqual('{a(s:"""x # "" y""")}', normalize_query('\ufeff{ a(s: """x # "" y""") } # z'))
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_key(self):
+        cache = ResponseCache()
+        self.assertEqual(cache.key('{ a }', {'x': 1, 'y': datetime(2021, 2, 8)}, 'token'),
+                         cache.key('{a}', {'y': datetime(2021, 2, 8), 'x': 1}, 'token'))
+        self.assertNotEqual(cache.key('{ a }', {'x': 1}), cache.key('{ a }', {'x': 2}))
+        self.assertNotEqual(cache.key('{ a }', None, 'alice'), cache.key('{ a }', None, 'bob'))
+        self.assertNotIn('alice', str(cache.key('{ a }', None, 'alice')))
+
+    def test_lru(self):
+        cache = ResponseCache(max_bytes=10)
+        a, b, c = (cache.key(q) for q in ('{ a }', '{ b }', '{ c }'))
+
+        cache.put(a, b'aaaa')
+        cache.put(b, b'bbbb')
+        self.assertEqual(b'aaaa', cache.get(a))  # b is now least recently used
+        cache.put(c, b'cccc')
+
+        self.assertIsNone(cache.get(b))
+        self.assertEqual(b'aaaa', cache.get(a))
+        self.assertEqual(b'cccc', cache.get(c))
+        self.assertEqual(8, cache.size)
+
+        cache.put(b, b'x' * 11)
+        self.assertIsNone(cache.get(b))
+
+        self.assertEqual({'hits': 3, 'misses': 2, 'stores': 3, 'evictions': 1, 'invalidations': 0},
+                         cache.stats.as_dict())
+
+    def test_ttl(self):
+        cache = ResponseCache(default_ttl=60)
+        cache.set_ttl('{ fast }', 0.01)
+        cache.set_ttl('{ never }', 0)
+
+        for query in ('{ slow }', '{ fast }', '{ never }'):
+            cache.put(cache.key(query), b'{}')
+        time.sleep(0.02)
+
+        self.assertIsNotNone(cache.get(cache.key('{slow}')))
+        self.assertIsNone(cache.get(cache.key('{fast}')))
+        self.assertIsNone(cache.get(cache.key('{never}')))
+        self.assertEqual(1, len(cache))
+
+    def test_invalidate(self):
+        cache = ResponseCache()
+        for query, variables in (('{ a }', None), ('{ a }', {'x': 1}), ('{ b }', None)):
+            cache.put(cache.key(query, variables), b'{}')
+
+        self.assertEqual(2, cache.invalidate('{a}'))
+        self.assertEqual(1, len(cache))
+        self.assertEqual(1, cache.invalidate())
+        self.assertEqual(0, cache.size)
+
+        for query in ('{ a }', '{ b }', '{ c }'):
+            cache.put(cache.key(query), b'{}')
+        self.assertEqual(2, cache.invalidate_queries(['{ a }', '{b}']))
+        self.assertEqual(1, cache.invalidate_queries())
+
+
+class TestAPIClientCache(unittest.TestCase):
+    def setUp(self):
+        self.transport = StandInTransport(responder=self._answer)
+        self.api = APIClient(api_url='https://localhost/graphql', transport=self.transport, cache=ResponseCache())
+
+    @staticmethod
+    def _answer(payload):
+        if 'fail' in payload['query']:
+            return {'errors': [{'message': 'failed'}]}
+        return {'data': {'echo': (payload.get('variables') or {}).get('v')}}
+
+    def test_cache(self):
+        for _ in range(3):
+            self.assertEqual('x', self.api.execute_graphql('{ echo }', variables={'v': 'x'}).echo)
+            self.assertEqual({'echo': 'x'}, self.api.execute_graphql_dict('{echo}', variables={'v': 'x'}))
+        self.assertEqual(1, len(self.transport.requests))
+        self.assertEqual(5, self.api.cache.stats.hits)
+
+        with self.subTest("other token"):
+            self.api.token = 'other'
+            self.api.execute_graphql('{ echo }', variables={'v': 'x'})
+            self.assertEqual(2, len(self.transport.requests))
+
+        with self.subTest("errors are not cached"):
+            for _ in range(2):
+                self.assertRaises(PortalAPIError, self.api.execute_graphql, '{ fail }')
+            self.assertEqual(4, len(self.transport.requests))
+
+    def test_mutation(self):
+        self.api.execute_graphql('{ echo }')
+        self.api.execute_graphql('{ other: echo }')
+
+        for _ in range(2):
+            self.api.execute_graphql('mutation { echo }', invalidate=['{ echo }'])
+        self.assertEqual(4, len(self.transport.requests))
+        self.assertEqual(1, len(self.api.cache))
+
+        self.api.execute_graphql_dict('mutation { echo }')
+        self.assertEqual(0, len(self.api.cache))
+
+    def test_mutation_paths(self):
+        counter = {'n': 0}
+
+        def answer(payload):
+            if isinstance(payload, list):
+                return [answer(p) for p in payload]
+            if 'inc' in payload['query']:
+                counter['n'] += 1
+                return {'data': {'inc': counter['n']}}
+            return {'data': {'n': counter['n']}}
+
+        api = APIClient(api_url='https://localhost/graphql', transport=StandInTransport(responder=answer),
+                        cache=ResponseCache())
+        cases = [
+            ("prepared", lambda: api.prepare('mutation { inc }').execute()),
+            ("prepared dict", lambda: api.prepare('mutation { inc }').execute_dict()),
+            ("batch", lambda: api.execute_batch(['mutation { inc }'])),
+            ("batched", lambda: api.execute_batch(['mutation { inc }', 'query { n }'])),
+        ]
+        for name, execute in cases:
+            with self.subTest(name):
+                self.assertEqual({'n': counter['n']}, api.execute_graphql_dict('query { n }'))
+                execute()
+                self.assertEqual({'n': counter['n']}, api.execute_graphql_dict('query { n }'))
+
+        with self.subTest("invalidate"):
+            api.execute_graphql_dict('query { n }')
+            api.execute_graphql_dict('{ other: n }')
+            api.prepare('mutation { inc }', invalidate=['query { n }']).execute()
+            api.execute_batch(['mutation { inc }'], invalidate=['query { n }'])
+            self.assertEqual(1, len(api.cache))
+
+        with self.subTest("queries keep the cache"):
+            api.prepare('{ n }').execute()
+            api.execute_batch(['{ n }', '{ other: n }'])
+            self.assertEqual(1, len(api.cache))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+# Copyright (c) 2021, DCSO GmbH
+
+import json
+import os
+import tempfile
+import unittest
+
+from ..api import APIClient
+from ..exceptions import PortalAPIError
+from .checkpoint import Checkpoint, fingerprint
+from .standin import StandInTransport
+from .test_pagination import _Pages, _QUERY
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'alerts.checkpoint')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_fingerprint(self):
+        self.assertEqual(fingerprint('{ a(first: $n) { b } }', 'a', {'x': 1, 'y': 2}),
+                         fingerprint('{a(first:$n){b}}', 'a', {'y': 2, 'x': 1}))
+        self.assertNotEqual(fingerprint('{ a { b } }', 'a'), fingerprint('{ a { b } }', 'a.b'))
+        self.assertNotEqual(fingerprint('{ a { b } }', 'a', {'x': 1}), fingerprint('{ a { b } }', 'a', {'x': 2}))
+
+    def test_save_load(self):
+        checkpoint = Checkpoint(self.path)
+        self.assertFalse(checkpoint.load('abc'))
+
+        checkpoint.save('cursor-1', 10)
+        self.assertEqual(['alerts.checkpoint'], os.listdir(self.tmp.name))
+
+        checkpoint = Checkpoint(self.path)
+        self.assertTrue(checkpoint.load('abc'))
+        self.assertEqual(('cursor-1', 10), (checkpoint.cursor, checkpoint.count))
+
+        self.assertFalse(checkpoint.load('other'))
+        self.assertEqual((None, 0), (checkpoint.cursor, checkpoint.count))
+
+        checkpoint.clear()
+        self.assertFalse(os.path.exists(self.path))
+        checkpoint.clear()
+
+    def test_resume(self):
+        for prefetch in (0, 2):
+            with self.subTest(prefetch=prefetch):
+                pages = _Pages(95, fail_at=50)
+                transport = StandInTransport(responder=pages)
+                apic = APIClient(api_url='https://localhost/graphql', transport=transport)
+
+                seen = []
+                with self.assertRaises(PortalAPIError):
+                    for node in apic.paginate(_QUERY, 'tdh.alerts', page_size=10, prefetch=prefetch,
+                                              checkpoint=self.path):
+                        seen.append(node.id)
+                self.assertEqual(50, len(seen))
+                with open(self.path) as fp:
+                    stored = json.load(fp)
+                self.assertEqual(('49', 50), (stored['cursor'], stored['count']))
+
+                pages.fail_at = -1
+                transport.requests.clear()
+                for node in apic.paginate(_QUERY, 'tdh.alerts', page_size=10, prefetch=prefetch,
+                                          checkpoint=Checkpoint(self.path)):
+                    seen.append(node.id)
+                self.assertEqual([str(i) for i in range(95)], seen)
+                self.assertEqual('49', transport.requests[0]['variables']['cursor'])
+                self.assertFalse(os.path.exists(self.path))
+
+    def test_stopped_within_page(self):
+        transport = StandInTransport(responder=_Pages(30))
+        apic = APIClient(api_url='https://localhost/graphql', transport=transport)
+
+        for i, node in enumerate(apic.paginate(_QUERY, 'tdh.alerts', page_size=10, checkpoint=self.path)):
+            if i == 14:
+                break
+        # second page was not done
+        checkpoint = Checkpoint(self.path)
+        self.assertTrue(checkpoint.load(fingerprint(_QUERY, 'tdh.alerts')))
+        self.assertEqual(('9', 10), (checkpoint.cursor, checkpoint.count))
+
+    def test_stopped_after_page(self):
+        transport = StandInTransport(responder=_Pages(30))
+        apic = APIClient(api_url='https://localhost/graphql', transport=transport)
+
+        for i, node in enumerate(apic.paginate(_QUERY, 'tdh.alerts', page_size=10, checkpoint=self.path)):
+            if i == 19:
+                # fails handling the last node of the second page
+                break
+        checkpoint = Checkpoint(self.path)
+        self.assertTrue(checkpoint.load(fingerprint(_QUERY, 'tdh.alerts')))
+        self.assertEqual(('9', 10), (checkpoint.cursor, checkpoint.count))
+
+        # the second page is iterated again, including its last node
+        resumed = [node.id for node in apic.paginate(_QUERY, 'tdh.alerts', page_size=10, checkpoint=self.path)]
+        self.assertEqual([str(i) for i in range(10, 30)], resumed)
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
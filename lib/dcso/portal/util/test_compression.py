@@ -0,0 +1,57 @@
+# Copyright (c) 2021, DCSO GmbH
+
+import gzip
+import unittest
+import zlib
+
+from ..exceptions import PortalAPIRequest
+from .compression import StreamDecompressor, decompressor_for, gzip_body, rejects_gzip_body
+
+
+class TestStreamDecompressor(unittest.TestCase):
+    def test_decompress(self):
+        data = b'{"data": {"ping": "pong"}}' * 100
+        deflate_raw = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        cases = {
+            'gzip': gzip.compress(data),
+            'x-gzip': gzip.compress(data),
+            'deflate': zlib.compress(data),
+            'Deflate ': deflate_raw.compress(data) + deflate_raw.flush(),
+        }
+
+        for encoding, encoded in cases.items():
+            with self.subTest(encoding=encoding):
+                d = StreamDecompressor(encoding)
+                result = b''.join(d.decompress(encoded[i:i + 10]) for i in range(0, len(encoded), 10))
+                self.assertEqual(data, result + d.flush())
+
+    def test_invalid(self):
+        self.assertRaises(PortalAPIRequest, StreamDecompressor, 'br')
+        self.assertRaises(PortalAPIRequest, StreamDecompressor('gzip').decompress, b'not gzip')
+
+    def test_decompressor_for(self):
+        self.assertIsNone(decompressor_for(None))
+        self.assertIsNone(decompressor_for('identity'))
+        self.assertEqual('gzip', decompressor_for('gzip').encoding)
+
+
+class TestGzipBody(unittest.TestCase):
+    def test_gzip_body(self):
+        self.assertEqual(b'spam' * 10, gzip.decompress(gzip_body(b'spam' * 10)))
+
+    def test_rejects_gzip_body(self):
+        cases = [
+            (415, {}, True),
+            (400, {'Accept-Encoding': 'identity'}, True),
+            (400, {'Accept-Encoding': 'deflate, gzip;q=0.5'}, False),
+            (400, {}, False),
+            (200, {'Accept-Encoding': 'identity'}, False),
+        ]
+
+        for status, headers, exp in cases:
+            with self.subTest(status=status, headers=headers):
+                self.assertEqual(exp, rejects_gzip_body(status, headers))
+
+
+if __name__ == '__main__':
+    unittest.main()
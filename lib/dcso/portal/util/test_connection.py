@@ -0,0 +1,437 @@
+# Copyright (c) 2021, DCSO GmbH
+
+import gzip
+import json
+import socket
+import ssl
+import sys
+import threading
+import time
+import unittest
+import zlib
+from unittest.mock import patch
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from ..exceptions import PortalAPIRequest, PortalTimeout
+from . import connection
+from .connection import ConnectionPool, create_ssl_context
+from .graphql import GraphQLRequest
+from .networking import free_localhost_tcp_port
+from .ratelimit import RateLimiter
+from .retry import RetryPolicy
+from .timeout import Deadline, Timeout
+
+
+class _GraphQLHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            if self.server.reject_gzip:
+                self.send_response(415)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = gzip.decompress(body)
+        self.server.requests.append((self.client_address, self.headers, body))
+        self.server.paths.append(self.path)
+        if self.server.delay:
+            time.sleep(self.server.delay)
+
+        payload = json.dumps(self.server.response).encode('utf-8')
+        self.send_response(self.server.statuses.pop(0) if self.server.statuses else self.server.status)
+        self.send_header('Content-Type', 'application/json')
+        if self.server.retry_after is not None:
+            self.send_header('Retry-After', self.server.retry_after)
+        if self.server.content_encoding and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            if self.server.content_encoding == 'gzip':
+                payload = gzip.compress(payload)
+            else:
+                payload = zlib.compress(payload)
+            self.send_header('Content-Encoding', self.server.content_encoding)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _DroppingHandler(_GraphQLHandler):
+    """Closes the connection without answering the second request received on it."""
+
+    def setup(self):
+        super().setup()
+        self.handled = 0
+
+    def do_POST(self):
+        self.handled += 1
+        if self.handled == 2:
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            self.server.dropped += 1
+            self.close_connection = True
+            return
+        super().do_POST()
+
+
+class _GraphQLServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients giving up, for example after a timeout, are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start_test_server(response: dict, status: int = 200,
+                      handler=_GraphQLHandler) -> _GraphQLServer:
+    """Starts a HTTP/1.1 server on localhost in the background, which
+    replies to each POST request with `response` as JSON."""
+    server = _GraphQLServer(('127.0.0.1', free_localhost_tcp_port()), handler)
+    server.response = response
+    server.status = status
+    server.content_encoding = None
+    server.reject_gzip = False
+    server.statuses = []
+    server.retry_after = None
+    server.delay = 0
+    server.requests = []
+    server.paths = []
+    server.url = 'http://127.0.0.1:{}/graphql'.format(server.server_address[1])
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    return server
+
+
+def stop_test_server(server: _GraphQLServer) -> None:
+    server.shutdown()
+    server.server_close()
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.server = start_test_server({'data': {'ping': 'pong'}})
+
+    def tearDown(self):
+        stop_test_server(self.server)
+
+    def test_keep_alive(self):
+        with ConnectionPool() as pool:
+            for _ in range(5):
+                request = GraphQLRequest(query="{ ping }", api_url=self.server.url, transport=pool)
+                self.assertEqual('pong', request.execute_dict()['data']['ping'])
+
+            stats = pool.stats.as_dict()
+            self.assertEqual(1, stats['connections_opened'])
+            self.assertEqual(4, stats['connections_reused'])
+
+        # all requests came from the same client socket
+        self.assertEqual(1, len(set(address for address, _, _ in self.server.requests)))
+
+    def test_query_string(self):
+        pool = ConnectionPool()
+        for url, path in ((self.server.url + '?tenant=a&x=1', '/graphql?tenant=a&x=1'),
+                          (self.server.url, '/graphql'),
+                          (self.server.url.replace('/graphql', ''), '/')):
+            with self.subTest(url=url):
+                pool.request('POST', url, body=b'{}').read()
+                self.assertEqual(path, self.server.paths[-1])
+        pool.close()
+
+    def test_stale_connection(self):
+        server = start_test_server({'data': {'ping': 'pong'}}, handler=_DroppingHandler)
+        server.dropped = 0
+        try:
+            for query in ("{ ping }", "mutation { ping }"):
+                with self.subTest(query=query), ConnectionPool(retry=RetryPolicy(max_attempts=1)) as pool:
+                    first = GraphQLRequest(query="{ ping }", api_url=server.url, transport=pool)
+                    self.assertEqual('pong', first.execute_dict()['data']['ping'])
+
+                    request = GraphQLRequest(query=query, api_url=server.url, transport=pool)
+                    if query.startswith('mutation'):
+                        # the mutation might have been done; it is not sent again
+                        self.assertRaises(PortalAPIRequest, request.execute_dict)
+                        self.assertEqual(1, pool.stats.connections_opened)
+                    else:
+                        self.assertEqual('pong', request.execute_dict()['data']['ping'])
+                        self.assertEqual(2, pool.stats.connections_opened)
+            self.assertEqual(2, server.dropped)
+        finally:
+            stop_test_server(server)
+
+    @unittest.skipUnless(hasattr(socket, 'socketpair') and sys.platform != 'win32', "needs POSIX descriptors")
+    def test_is_dropped(self):
+        import fcntl
+        import resource
+
+        local, peer = socket.socketpair()
+        try:
+            self.assertFalse(connection._is_dropped(local))
+            if resource.getrlimit(resource.RLIMIT_NOFILE)[0] <= 1100:
+                self.skipTest("cannot open descriptors above FD_SETSIZE")
+
+            # descriptors of FD_SETSIZE (1024) and above are checked as well
+            high = socket.socket(fileno=fcntl.fcntl(local.fileno(), fcntl.F_DUPFD, 1100))
+            try:
+                self.assertFalse(connection._is_dropped(high))
+                peer.close()
+                self.assertTrue(connection._is_dropped(high))
+            finally:
+                high.close()
+        finally:
+            local.close()
+            peer.close()
+
+    def test_maxsize(self):
+        pool = ConnectionPool(maxsize=1)
+        first = pool.request('POST', self.server.url, body=b'{}')
+        second = pool.request('POST', self.server.url, body=b'{}')
+        first.read()
+        second.read()
+
+        self.assertEqual(2, pool.stats.connections_opened)
+        self.assertEqual(1, len(pool._idle[('http', '127.0.0.1', self.server.server_address[1])]))
+        pool.close()
+
+    def test_idle_eviction(self):
+        pool = ConnectionPool(idle_timeout=0.01)
+        pool.request('POST', self.server.url, body=b'{}').read()
+        time.sleep(0.02)
+
+        self.assertEqual(1, pool.evict_idle())
+        pool.request('POST', self.server.url, body=b'{}').read()
+        self.assertEqual(2, pool.stats.connections_opened)
+        pool.close()
+
+    def test_unread_response_discards_connection(self):
+        pool = ConnectionPool()
+        with pool.request('POST', self.server.url, body=b'{}'):
+            pass
+
+        pool.request('POST', self.server.url, body=b'{}').read()
+        self.assertEqual(2, pool.stats.connections_opened)
+        self.assertEqual(0, pool.stats.connections_reused)
+        pool.close()
+
+    def test_closed(self):
+        pool = ConnectionPool()
+        pool.close()
+        self.assertRaises(PortalAPIRequest, pool.request, 'POST', self.server.url)
+
+    def test_http_error(self):
+        self.server.status = 503
+        request = GraphQLRequest(query="{ ping }", api_url=self.server.url, transport=ConnectionPool())
+
+        with self.assertRaises(PortalAPIRequest) as ctx:
+            request.execute_dict()
+        self.assertEqual("Service Unavailable", str(ctx.exception))
+
+    def test_connection_refused(self):
+        pool = ConnectionPool()
+        url = 'http://127.0.0.1:{}/graphql'.format(free_localhost_tcp_port())
+        self.assertRaises(PortalAPIRequest, pool.request, 'POST', url, b'{}')
+
+    def test_decompress(self):
+        self.server.response = {'data': {'ping': 'pong' * 1000}}
+        for encoding in ('gzip', 'deflate'):
+            with self.subTest(encoding=encoding):
+                self.server.content_encoding = encoding
+                pool = ConnectionPool()
+                for _ in range(2):
+                    request = GraphQLRequest(query="{ ping }", api_url=self.server.url, transport=pool)
+                    self.assertEqual('pong' * 1000, request.execute_dict()['data']['ping'])
+
+                stats = pool.stats.as_dict()
+                self.assertEqual(1, stats['connections_opened'])
+                self.assertLess(stats['bytes_received'], stats['bytes_decoded'])
+                pool.close()
+
+    def test_decompress_disabled(self):
+        self.server.content_encoding = 'gzip'
+        pool = ConnectionPool(decompress=False)
+        pool.request('POST', self.server.url, body=b'{}').read()
+
+        _, headers, _ = self.server.requests[0]
+        self.assertEqual('identity', headers.get('Accept-Encoding'))
+        self.assertEqual(pool.stats.bytes_received, pool.stats.bytes_decoded)
+
+    def test_decompress_read_amt(self):
+        self.server.response = {'data': {'ping': 'pong' * 1000}}
+        self.server.content_encoding = 'gzip'
+        pool = ConnectionPool()
+        response = pool.request('POST', self.server.url, body=b'{}')
+
+        chunks = []
+        while True:
+            chunk = response.read(16)
+            if not chunk:
+                break
+            chunks.append(chunk)
+
+        self.assertEqual(self.server.response, json.loads(b''.join(chunks)))
+        self.assertEqual(1, len(pool._idle[('http', '127.0.0.1', self.server.server_address[1])]))
+
+    def test_compress_request_body(self):
+        pool = ConnectionPool(compress_min_size=100)
+        small = b'{"query": "{ ping }"}'
+        large = json.dumps({'query': '{ ping }', 'variables': {'ids': list(range(1000))}}).encode()
+
+        for body in (small, large):
+            pool.request('POST', self.server.url, body=body).read()
+
+        (_, small_headers, small_body), (_, large_headers, large_body) = self.server.requests
+        self.assertIsNone(small_headers.get('Content-Encoding'))
+        self.assertEqual('gzip', large_headers.get('Content-Encoding'))
+        self.assertEqual(large, large_body)
+
+        stats = pool.stats.as_dict()
+        self.assertEqual(len(small) + len(large), stats['bytes_encoded'])
+        self.assertLess(stats['bytes_sent'], stats['bytes_encoded'])
+
+    def test_compressed_body_rejected(self):
+        self.server.reject_gzip = True
+        pool = ConnectionPool(compress_min_size=0)
+
+        for _ in range(2):
+            request = GraphQLRequest(query="{ ping }", api_url=self.server.url, transport=pool)
+            self.assertEqual('pong', request.execute_dict()['data']['ping'])
+
+        self.assertEqual(2, len(self.server.requests))
+        self.assertEqual(1, pool.stats.compressed_bodies_rejected)
+        self.assertEqual(1, pool.stats.connections_opened)
+
+    def test_retry(self):
+        self.server.statuses = [503, 429]
+        self.server.retry_after = '0'
+        pool = ConnectionPool(retry=RetryPolicy(max_attempts=3))
+
+        request = GraphQLRequest(query="{ ping }", api_url=self.server.url, transport=pool)
+        self.assertEqual('pong', request.execute_dict()['data']['ping'])
+
+        stats = pool.stats.as_dict()
+        self.assertEqual(1, stats['requests'])
+        self.assertEqual(3, stats['attempts'])
+        self.assertEqual(2, stats['retries'])
+        self.assertEqual(1, stats['connections_opened'])
+
+    def test_retry_exhausted(self):
+        self.server.status = 503
+        pool = ConnectionPool(retry=RetryPolicy(max_attempts=2, backoff_base=0))
+
+        request = GraphQLRequest(query="{ ping }", api_url=self.server.url, transport=pool)
+        self.assertRaises(PortalAPIRequest, request.execute_dict)
+        self.assertEqual(2, pool.stats.attempts)
+
+    def test_no_retry_mutation(self):
+        self.server.statuses = [503]
+        pool = ConnectionPool(retry=RetryPolicy(backoff_base=0))
+
+        mutation = "mutation { ping }"
+        request = GraphQLRequest(query=mutation, api_url=self.server.url, transport=pool)
+        self.assertRaises(PortalAPIRequest, request.execute_dict)
+        self.assertEqual(1, pool.stats.attempts)
+
+        self.server.statuses = [503]
+        request = GraphQLRequest(query=mutation, api_url=self.server.url, transport=pool, idempotent=True)
+        self.assertEqual('pong', request.execute_dict()['data']['ping'])
+        self.assertEqual(3, pool.stats.attempts)
+
+    def test_retry_connection_error(self):
+        pool = ConnectionPool(retry=RetryPolicy(max_attempts=3, backoff_base=0))
+        url = 'http://127.0.0.1:{}/graphql'.format(free_localhost_tcp_port())
+
+        self.assertRaises(PortalAPIRequest, pool.request, 'POST', url, b'{}')
+        self.assertEqual(3, pool.stats.attempts)
+        self.assertEqual(2, pool.stats.retries)
+
+    def test_rate_limit(self):
+        limiter = RateLimiter(rate=100, max_in_flight=1)
+        pool = ConnectionPool(retry=RetryPolicy(backoff_base=0), rate_limit=limiter)
+        self.server.statuses = [429]
+
+        for _ in range(3):
+            request = GraphQLRequest(query="{ ping }", api_url=self.server.url, transport=pool)
+            self.assertEqual('pong', request.execute_dict()['data']['ping'])
+
+        self.assertEqual(1, pool.stats.throttled)
+        self.assertEqual(4, pool.stats.attempts)
+        self.assertLess(limiter.rate, 100)
+
+        with self.subTest("slot released when response is closed"):
+            response = pool.request('POST', self.server.url, b'{}')
+            response.close()
+            pool.request('POST', self.server.url, b'{}').read()
+
+    def test_timeout(self):
+        self.server.delay = 0.5
+        pool = ConnectionPool(retry=RetryPolicy(max_attempts=1), timeout=Timeout(read=0.05))
+
+        started = time.monotonic()
+        self.assertRaises(PortalTimeout, pool.request, 'POST', self.server.url, b'{}')
+        self.assertLess(time.monotonic() - started, 0.4)
+
+        with self.subTest("override per request"):
+            self.server.delay = 0.1
+            pool.request('POST', self.server.url, b'{}', timeout=Timeout(read=1)).read()
+
+    def test_deadline(self):
+        pool = ConnectionPool(retry=RetryPolicy(max_attempts=10, backoff_base=0.2, backoff_max=0.2))
+
+        deadline = Deadline(0)
+        self.assertRaises(PortalTimeout, pool.request, 'POST', self.server.url, b'{}', deadline=deadline)
+        self.assertEqual(0, len(self.server.requests))
+
+        with self.subTest("retries stop at deadline"):
+            self.server.status = 503
+            started = time.monotonic()
+            response = pool.request('POST', self.server.url, b'{}', deadline=Deadline(0.3))
+            self.assertEqual(503, response.status)
+            self.assertLess(time.monotonic() - started, 0.5)
+            self.assertLess(pool.stats.attempts, 10)
+
+        with self.subTest("deadline passes before sending"):
+            class PassingDeadline(Deadline):
+                checks = 0
+
+                def expired(self) -> bool:
+                    # not expired yet when the attempt starts
+                    self.checks += 1
+                    return self.checks > 1
+
+            self.server.status = 200
+            self.assertRaises(PortalTimeout, pool.request, 'POST', self.server.url, b'{}',
+                              deadline=PassingDeadline(-1))
+
+
+class TestCreateSSLContext(unittest.TestCase):
+    def test_verify_by_default(self):
+        with patch.dict(connection.environ, clear=True):
+            ctx = create_ssl_context()
+        self.assertEqual(ssl.CERT_REQUIRED, ctx.verify_mode)
+        self.assertTrue(ctx.check_hostname)
+
+    def test_skip_verify(self):
+        with self.subTest("environment"):
+            with patch.dict(connection.environ, {connection._ENV_SKIP_TLS_VERIFY: '1'}):
+                ctx = create_ssl_context()
+            self.assertEqual(ssl.CERT_NONE, ctx.verify_mode)
+
+        with self.subTest("argument"):
+            with patch.dict(connection.environ, {connection._ENV_SKIP_TLS_VERIFY: '1'}):
+                ctx = create_ssl_context(skip_verify=False)
+            self.assertEqual(ssl.CERT_REQUIRED, ctx.verify_mode)
+
+    def test_pool_shares_context(self):
+        pool = ConnectionPool()
+        self.assertIs(pool.ssl_context, pool.ssl_context)
+
+        ctx = create_ssl_context()
+        pool = ConnectionPool(ssl_context=ctx)
+        conn = pool._new_connection(('https', 'example.com', 443))
+        self.assertIs(ctx, conn._context)
+
+
+if __name__ == '__main__':
+    unittest.main()
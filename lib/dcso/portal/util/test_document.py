@@ -0,0 +1,50 @@
+# Copyright (c) 2021, DCSO GmbH
+
+import unittest
+
+from ..exceptions import PortalAPIRequest
+from .document import Field, FragmentSpread, InlineFragment, Operation, parse_document, tokens
+
+
+class TestDocument(unittest.TestCase):
+    def test_tokens(self):
+        self.assertEqual(['{', 'a', '(', 'b', ':', '"x # y"', ')', '}'], tokens('{ a(b: "x # y", ) } # comment'))
+        self.assertEqual(['...', 'on', 'A', '"""block "" string"""', '-1.5e3'],
+                         tokens('\ufeff... on A """block "" string""" -1.5e3'))
+
+    def test_parse_document(self):
+        document = parse_document('''
+            query Alerts($first: Int = 10) @cached {
+              alerts(first: $first, filter: { ids: ["1", "2"] }) {
+                id
+                when: occurredOn @include(if: true)
+                ...AlertDetails
+                ... on Alert { note }
+                ... @skip(if: false) { seenOn }
+              }
+            }
+            fragment AlertDetails on Alert { source { name } }
+        ''')
+
+        self.assertEqual([Operation('query', 'Alerts', [Field('alerts', 'alerts', [
+            Field('id', 'id', []),
+            Field('when', 'occurredOn', []),
+            FragmentSpread('AlertDetails'),
+            InlineFragment('Alert', [Field('note', 'note', [])]),
+            InlineFragment(None, [Field('seenOn', 'seenOn', [])]),
+        ])])], document.operations)
+        self.assertEqual({'AlertDetails': ('Alert', [Field('source', 'source', [Field('name', 'name', [])])])},
+                         document.fragments)
+
+        self.assertEqual([Operation('query', None, [Field('a', 'a', [])]),
+                          Operation('subscription', None, [Field('b', 'b', [])])],
+                         parse_document('{ a } subscription { b }').operations)
+
+    def test_invalid(self):
+        for document in ('{ a', '{ a(b: 1 }', 'type A { a: Int }', 'fragment A { a }'):
+            with self.subTest(document):
+                self.assertRaises(PortalAPIRequest, parse_document, document)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,11 +2,15 @@
 
 import json
 import unittest
+from datetime import datetime, timezone
 from unittest.mock import patch, MagicMock
 
+from ..api import APIClient
 from ..exceptions import PortalAPIError
 from dcso.glosom import Glosom, TYPE_ERROR, GROUP_SECURITY
 from . import graphql
+from .schema import Schema
+from .standin import StandInTransport
 
 
 class TestGraphQLRequest(unittest.TestCase):
@@ -64,5 +68,135 @@ class TestGraphQLRequest(unittest.TestCase):
         self.assertEqual("not authorized (24B00DAA)", str(ctx.exception))
 
 
+class TestPreparedQuery(unittest.TestCase):
+    def setUp(self):
+        self.transport = StandInTransport(responder=lambda p: {'data': {'echo': p.get('variables')}})
+        self.api = APIClient(api_url='https://localhost/graphql', transport=self.transport)
+
+    def test_body(self):
+        query = 'query ($id: ID!, $t: DateTime) { user(id: $id) { ...u } }'
+        fragments = ['fragment u on User { id }', 'fragment u on User { id }']
+        prepared = self.api.prepare(query, fragments)
+        self.assertEqual(['fragment u on User { id }'], prepared.fragments)
+
+        for variables in (None, {}, {'id': '1', 't': datetime(2021, 2, 8), 'name': 'ä"'}):
+            with self.subTest(variables=variables):
+                request = graphql.GraphQLRequest(query=query, api_url=self.api.api_url,
+                                                 variables=variables, fragments=fragments[:1])
+                self.assertEqual(request.json(), prepared.body(variables))
+                self.assertEqual(request.json(), prepared.request(variables).json())
+
+    def test_headers(self):
+        prepared = self.api.prepare('{ echo }')
+        self.assertEqual({'Content-Type': 'application/json'}, prepared.request().headers())
+
+        self.api.token = 'secret'
+        headers = prepared.request().headers()
+        self.assertEqual('Bearer secret', headers['Authorization'])
+        self.assertIs(headers, prepared.request().headers())
+
+        prepared = self.api.prepare('{ echo { ...e } }', ['fragment e on Echo { id ... @defer { name } }'])
+        self.assertTrue(prepared.incremental)
+        self.assertEqual(graphql.MULTIPART_ACCEPT, prepared.request().headers()['Accept'])
+        request = graphql.GraphQLRequest(query=prepared.query, fragments=prepared.fragments, api_url=self.api.api_url)
+        self.assertEqual(graphql.MULTIPART_ACCEPT, request.headers()['Accept'])
+
+    def test_execute(self):
+        prepared = self.api.prepare('query ($id: ID!) { echo }')
+        self.assertTrue(prepared.idempotent)
+        self.assertEqual({'id': '1'}, prepared.execute({'id': '1'}).echo._asdict())
+        self.assertEqual({'echo': {'id': '2'}}, prepared.execute_dict({'id': '2'}))
+        self.assertEqual(2, self.transport.stats.requests)
+
+        self.assertFalse(self.api.prepare('mutation { echo }').idempotent)
+
+
+class TestNamedTuple(unittest.TestCase):
+    def test_convert(self):
+        data = graphql.graphql_data_to_namedtuple({
+            'alerts': {'edges': [{'node': {'id': '1', 'tags': ['a']}}, {'node': {'id': '2', 'tags': []}}],
+                       'matrix': [[{'x': 1}]]},
+            'count': 2,
+        })
+        self.assertEqual('data', type(data).__name__)
+        self.assertEqual(['1', '2'], [edge.node.id for edge in data.alerts.edges])
+        self.assertEqual('edges', type(data.alerts.edges[0]).__name__)
+        self.assertEqual(['a'], data.alerts.edges[0].node.tags)
+        self.assertEqual([[{'x': 1}]], data.alerts.matrix)
+        self.assertEqual(2, data.count)
+        self.assertEqual('text', graphql.graphql_data_to_namedtuple('text'))
+
+    def test_class_cache(self):
+        first = graphql.graphql_data_to_namedtuple({'users': [{'id': '1', 'name': 'a'}, {'id': '2', 'name': 'b'}]})
+        second = graphql.graphql_data_to_namedtuple({'users': [{'id': '3', 'name': 'c'}]})
+        self.assertIs(type(first.users[0]), type(first.users[1]))
+        self.assertIs(type(first.users[0]), type(second.users[0]))
+        self.assertIsNot(type(first.users[0]), type(graphql.graphql_data_to_namedtuple({'id': '1'}, 'users')))
+        self.assertEqual(graphql.NAMEDTUPLE_CACHE_SIZE, graphql.namedtuple_class.cache_info().maxsize)
+
+    def test_deep_nesting(self):
+        data = leaf = {}
+        for _ in range(10000):
+            leaf['child'] = {}
+            leaf = leaf['child']
+        leaf['id'] = 'deep'
+
+        node = graphql.graphql_data_to_namedtuple(data)
+        depth = 0
+        while hasattr(node, 'child'):
+            node, depth = node.child, depth + 1
+        self.assertEqual(('deep', 10000), (node.id, depth))
+
+
+class TestGraphQLJSONDecoder(unittest.TestCase):
+    _BODY = json.dumps({'id': 1, 'occurredOn': '2021-02-08T10:11:12Z', 'note': '2021-02-08T10:11:12.5 UTC',
+                        'tags': ['2021-02-08T10:11:12Z'], 'name': '2021-02-08 is a date', 'seen': True})
+    _TIME = datetime(2021, 2, 8, 10, 11, 12, tzinfo=timezone.utc)
+
+    def test_maybe_timestamp(self):
+        for value in ('2021-02-08T10:11Z', '2021-02-08T10:11:12.490868 UTC',
+                      '2019-10-31T12:35:49.350488666+00:00', '2021-02-08 10:11:12+00'):
+            with self.subTest(value=value):
+                self.assertTrue(graphql.maybe_timestamp(value))
+        for value in (None, 1, True, [], {}, '', 'Z', '2021-02-08', '2021-02-08Z', 'ALERT-0000000000000Z',
+                      '2021-02-08T10:11:12+02:15', '2021-02-08T10:11:12.123456789012345678+00:00'):
+            with self.subTest(value=value):
+                self.assertFalse(graphql.maybe_timestamp(value))
+
+    def test_decode(self):
+        data = json.loads(self._BODY, cls=graphql.GraphQLJSONDecoder)
+        self.assertEqual(self._TIME, data['occurredOn'])
+        self.assertEqual(self._TIME.replace(microsecond=500000), data['note'])
+        self.assertEqual(['2021-02-08T10:11:12Z'], data['tags'])
+        self.assertEqual('2021-02-08 is a date', data['name'])
+        self.assertEqual((1, True), (data['id'], data['seen']))
+
+    def test_datetime_fields(self):
+        data = json.loads(self._BODY, cls=graphql.GraphQLJSONDecoder, datetime_fields=['occurredOn', 'id'])
+        self.assertEqual(self._TIME, data['occurredOn'])
+        self.assertEqual('2021-02-08T10:11:12.5 UTC', data['note'])
+        self.assertEqual(1, data['id'])
+
+        data = json.loads(self._BODY, cls=graphql.GraphQLJSONDecoder, datetime_fields=[])
+        self.assertEqual('2021-02-08T10:11:12Z', data['occurredOn'])
+
+        # no Python hook runs for each object when no field is decoded
+        self.assertIsNone(graphql.GraphQLJSONDecoder(datetime_fields=[]).object_hook)
+        self.assertIsNotNone(graphql.GraphQLJSONDecoder(datetime_fields=['id']).object_hook)
+        request = graphql.GraphQLRequest(query='{ a }', api_url='https://localhost/graphql',
+                                         schema=Schema({'types': []}))
+        self.assertIsNone(graphql.GraphQLJSONDecoder(datetime_fields=request._fields()).object_hook)
+
+    def test_client(self):
+        transport = StandInTransport({'data': json.loads(self._BODY)})
+        api = APIClient('https://api.example.com/graphql', transport=transport, datetime_fields={'note'})
+        self.assertEqual(frozenset({'note'}), api.datetime_fields)
+
+        data = api.execute_graphql_dict('{ alert { occurredOn note } }')
+        self.assertEqual(('2021-02-08T10:11:12Z', self._TIME.replace(microsecond=500000)),
+                         (data['occurredOn'], data['note']))
+        self.assertEqual(self._TIME.replace(microsecond=500000), api.execute_graphql('{ alert { note } }').note)
+
+
 if __name__ == '__main__':
     unittest.main()
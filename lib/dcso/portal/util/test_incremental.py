@@ -0,0 +1,171 @@
+# Copyright (c) 2021, DCSO GmbH
+
+import json
+import threading
+import time
+import unittest
+from datetime import datetime, timezone
+
+from ..api import APIClient
+from ..exceptions import PortalAPIError, PortalAPIRequest
+from .incremental import MULTIPART_ACCEPT, is_incremental, iter_multipart, merge_incremental, multipart_boundary
+from .test_connection import _GraphQLHandler, start_test_server, stop_test_server
+
+_QUERY = '{ alert { id ... @defer { details { summary } } comments @stream(initialCount: 1) { text } } }'
+
+_PAYLOADS = [
+    {'data': {'alert': {'id': '1', 'comments': [{'text': 'a'}]}}, 'hasNext': True},
+    {'incremental': [{'data': {'details': {'summary': 'bad'}}, 'path': ['alert']}], 'hasNext': True},
+    {'incremental': [{'items': [{'text': 'b'}, {'text': 'c'}], 'path': ['alert', 'comments', 1]}], 'hasNext': True},
+    {'hasNext': False},
+]
+
+
+def _multipart(payloads: list, boundary: str = '-') -> bytes:
+    body = b'preamble\r\n'
+    for payload in payloads:
+        body += f'--{boundary}\r\nContent-Type: application/json; charset=utf-8\r\n\r\n'.encode()
+        body += json.dumps(payload).encode() + b'\r\n'
+    return body + f'--{boundary}--\r\n'.encode()
+
+
+class _IncrementalHandler(_GraphQLHandler):
+    """Sends the payloads of the server as parts of a multipart/mixed response,
+    waiting for `gate` after the initial one."""
+
+    def do_POST(self):
+        self.server.requests.append((self.client_address, self.headers,
+                                     self.rfile.read(int(self.headers.get('Content-Length', 0)))))
+        self.send_response(200)
+        self.send_header('Content-Type', 'multipart/mixed; boundary="-"; deferSpec=20220824')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        # like common servers, each part is directly followed by the delimiter
+        self._write_chunk(b'\r\n---')
+        for i, payload in enumerate(self.server.response):
+            part = f'\r\nContent-Type: application/json\r\n\r\n{json.dumps(payload)}\r\n---'.encode()
+            if i == len(self.server.response) - 1:
+                part += b'--\r\n'
+            self._write_chunk(part)
+            if i == 0:
+                self.server.gate.wait(5)
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+
+class TestIncremental(unittest.TestCase):
+    def test_is_incremental(self):
+        self.assertTrue(is_incremental(_QUERY))
+        self.assertTrue(is_incremental('{ a @defer { b } }'))
+        self.assertFalse(is_incremental('{ deferred streams }'))
+        self.assertTrue(is_incremental('{ a { ...b } }', ['fragment b on A { c @stream }']))
+        self.assertFalse(is_incremental('{ a { ...b } }', ['fragment b on A { c }']))
+        self.assertFalse(is_incremental('{ a # @defer later\n { b } }'))
+        self.assertFalse(is_incremental('{ a(text: "@defer") { b } c(text: """@stream""") }'))
+
+    def test_multipart_boundary(self):
+        self.assertEqual('-', multipart_boundary('multipart/mixed; boundary="-"; deferSpec=20220824'))
+        self.assertEqual('graphql', multipart_boundary('Multipart/Mixed;boundary=graphql'))
+        self.assertEqual('-', multipart_boundary('multipart/mixed'))
+        self.assertIsNone(multipart_boundary('application/json'))
+        self.assertIsNone(multipart_boundary(None))
+
+    def test_iter_multipart(self):
+        body = _multipart(_PAYLOADS, boundary='graphql')
+        for size in (1, 7, len(body)):
+            with self.subTest(size=size):
+                pos = [0]
+
+                def read(amt):
+                    data = body[pos[0]:pos[0] + min(amt, size)]
+                    pos[0] += len(data)
+                    return data
+
+                parts = [json.loads(part) for part in iter_multipart(read, 'graphql')]
+                self.assertEqual(_PAYLOADS, parts)
+
+        with self.subTest("truncated"):
+            body = _multipart(_PAYLOADS)[:-20]
+            chunks = [body, b'']
+            with self.assertRaises(PortalAPIRequest):
+                list(iter_multipart(lambda amt: chunks.pop(0), '-'))
+
+    def test_merge_incremental(self):
+        result = json.loads(json.dumps(_PAYLOADS[0]))
+        for payload in _PAYLOADS[1:]:
+            merge_incremental(result, payload)
+        self.assertEqual({'data': {'alert': {'id': '1', 'details': {'summary': 'bad'},
+                                             'comments': [{'text': 'a'}, {'text': 'b'}, {'text': 'c'}]}},
+                          'hasNext': False}, result)
+
+        with self.subTest("earlier format"):
+            result = {'data': {'alert': {'id': '1'}}, 'hasNext': True}
+            merge_incremental(result, {'data': {'title': 'x'}, 'path': ['alert'], 'hasNext': False})
+            self.assertEqual({'data': {'alert': {'id': '1', 'title': 'x'}}, 'hasNext': False}, result)
+
+        with self.subTest("errors"):
+            result = {'data': {'alert': {'id': '1'}}, 'hasNext': True}
+            merge_incremental(result, {'incremental': [{'data': None, 'path': ['alert'],
+                                                        'errors': [{'message': 'failed'}]}]})
+            self.assertEqual([{'message': 'failed'}], result['errors'])
+
+        with self.subTest("unknown path"):
+            self.assertRaises(PortalAPIRequest, merge_incremental, {'data': {}},
+                              {'incremental': [{'data': {}, 'path': ['alert']}]})
+
+
+class TestIncrementalAPIClient(unittest.TestCase):
+    def setUp(self):
+        self.server = start_test_server(_PAYLOADS, handler=_IncrementalHandler)
+        self.server.gate = threading.Event()
+        self.apic = APIClient(api_url=self.server.url)
+
+    def tearDown(self):
+        self.apic.close()
+        stop_test_server(self.server)
+
+    def test_execute_incremental(self):
+        updates = []
+        started = time.monotonic()
+        for data in self.apic.execute_incremental(_QUERY):
+            updates.append(json.dumps(data, sort_keys=True))
+            # later payloads are only sent once we got the initial one
+            self.assertLess(time.monotonic() - started, 2)
+            self.server.gate.set()
+
+        self.assertEqual(json.dumps(_PAYLOADS[0]['data'], sort_keys=True), updates[0])
+        self.assertEqual(4, len(updates))
+        self.assertEqual(MULTIPART_ACCEPT, self.server.requests[0][1]['Accept'])
+        self.assertEqual(['a', 'b', 'c'], [c.text for c in self.apic.execute_graphql(_QUERY).alert.comments])
+
+    def test_execute_dict(self):
+        self.server.gate.set()
+        data = self.apic.execute_graphql_dict(_QUERY)
+        self.assertEqual('bad', data['alert']['details']['summary'])
+
+        with self.subTest("decoding"):
+            self.server.response = [{'data': {'alert': {'id': '1'}}, 'hasNext': True},
+                                    {'incremental': [{'data': {'on': '2021-02-08T10:11:12Z'}, 'path': ['alert']}],
+                                     'hasNext': False}]
+            self.assertEqual(datetime(2021, 2, 8, 10, 11, 12, tzinfo=timezone.utc),
+                             self.apic.execute_graphql(_QUERY).alert.on)
+
+        with self.subTest("errors in later payload"):
+            self.server.response = [{'data': {'alert': {'id': '1'}}, 'hasNext': True},
+                                    {'incremental': [{'data': None, 'path': ['alert'],
+                                                      'errors': [{'message': 'no details'}]}], 'hasNext': False}]
+            self.assertRaises(PortalAPIError, self.apic.execute_graphql_dict, _QUERY)
+
+        with self.subTest("JSON response"):
+            stop_test_server(self.server)
+            self.server = start_test_server({'data': {'alert': {'id': '1'}}})
+            self.apic.api_url = self.server.url
+            self.assertEqual([{'alert': {'id': '1'}}], list(self.apic.execute_incremental(_QUERY)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# Copyright (c) 2021, DCSO GmbH
+
+import io
+import json
+import unittest
+
+from ..exceptions import PortalAPIRequest
+from .jsonstream import JSONPathStream
+
+_DOC = {
+    'data': {
+        'other': [1, {'tricky': 'b\\"]}'}],
+        'alerts': {
+            'pageInfo': {'hasNextPage': False},
+            'edges': [{'node': {'id': i, 'title': 'é"\\{[' * i}} for i in range(50)],
+        },
+        'nothing': None,
+    },
+    'errors': [{'message': 'oops'}],
+}
+
+
+class TestJSONPathStream(unittest.TestCase):
+    def test_path(self):
+        raw = json.dumps(_DOC, ensure_ascii=False).encode('utf-8')
+
+        for chunk_size in (1, 3, 64, 65536):
+            with self.subTest(chunk_size=chunk_size):
+                top_level = []
+                stream = JSONPathStream(io.BytesIO(raw).read, ['data', 'alerts', 'edges'],
+                                        on_top_level=lambda k, v: top_level.append((k, v)),
+                                        chunk_size=chunk_size)
+                self.assertEqual(_DOC['data']['alerts']['edges'], list(stream))
+                self.assertEqual([('errors', _DOC['errors'])], top_level)
+
+    def test_scalars(self):
+        raw = b'{"data": {"a": [1, 2.5e3 ,true,null, "x"] } }'
+        self.assertEqual([1, 2500.0, True, None, 'x'],
+                         list(JSONPathStream(io.BytesIO(raw).read, ['data', 'a'], chunk_size=1)))
+
+    def test_missing_or_null(self):
+        cases = [
+            b'{"data": {"alerts": null}}',
+            b'{"data": null}',
+            b'{"data": {"alerts": {"edges": []}}}',
+            b'{}',
+        ]
+
+        for raw in cases:
+            with self.subTest(raw=raw):
+                self.assertEqual([], list(JSONPathStream(io.BytesIO(raw).read, ['data', 'alerts', 'edges'])))
+
+    def test_invalid(self):
+        cases = [
+            b'{"data": {"a": [1, 2',
+            b'{"data": {"a": [1 2]}}',
+            b'["data"]',
+            b'{"data": {"a": [1]}} trailing',
+        ]
+
+        for raw in cases:
+            with self.subTest(raw=raw):
+                with self.assertRaises(PortalAPIRequest):
+                    list(JSONPathStream(io.BytesIO(raw).read, ['data', 'a'], chunk_size=2))
+
+    def test_bounded_memory(self):
+        count = 20000
+
+        def generate():
+            yield b'{"data": {"items": ['
+            for i in range(count):
+                yield (b',' if i else b'') + json.dumps({'id': i, 'pad': 'x' * 100}).encode()
+            yield b']}}'
+
+        chunks = generate()
+        stream = JSONPathStream(lambda size: next(chunks, b''), ['data', 'items'], chunk_size=1024)
+
+        max_buffer = 0
+        seen = 0
+        for item in stream:
+            self.assertEqual(seen, item['id'])
+            seen += 1
+            max_buffer = max(max_buffer, len(stream._buf))
+
+        self.assertEqual(count, seen)
+        self.assertLess(max_buffer, 4096)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# Copyright (c) 2021, DCSO GmbH
+
+import re
+import threading
+import unittest
+
+from ..api import APIClient
+from ..exceptions import PortalAPIError, PortalAPIRequest
+from .loader import QueryLoader
+from .standin import StandInTransport
+
+_USERS = {'1': 'alice', '2': 'bob', '3': 'carol'}
+
+
+def _answer(payload: dict) -> dict:
+    """Answers documents created by QueryLoader looking up users."""
+    data, errors = {}, []
+    for alias, var in re.findall(r'(a\d+): auth_user\(id: \$(k\d+)\)', payload['query']):
+        key = payload['variables'][var]
+        if key == 'error':
+            data[alias] = None
+            errors.append({'message': 'not allowed', 'path': [alias]})
+        else:
+            data[alias] = {'id': key, 'username': _USERS[key]} if key in _USERS else None
+    response = {'data': data}
+    if errors:
+        response['errors'] = errors
+    return response
+
+
+class TestQueryLoader(unittest.TestCase):
+    def setUp(self):
+        self.transport = StandInTransport(responder=_answer)
+        self.api = APIClient(api_url='https://localhost/graphql', transport=self.transport)
+        self.users = QueryLoader(self.api, 'auth_user', '{ id username }')
+
+    def test_document(self):
+        loader = QueryLoader(self.api, 'tdh_issue', '{ id }', arguments='filter: {id: $key}')
+        self.assertEqual('query ($k0: ID!, $k1: ID!) { a0: tdh_issue(filter: {id: $k0}) { id } '
+                         'a1: tdh_issue(filter: {id: $k1}) { id } }', loader.document(2))
+
+        self.assertRaises(ValueError, QueryLoader, self.api, 'auth_user', '{ id }', arguments='id: $id')
+
+    def test_batch(self):
+        with self.users.batch():
+            futures = self.users.load_many(['1', '2', '1', 'unknown'])
+            self.assertFalse(futures[0].done())
+
+        self.assertEqual(['alice', 'bob', 'alice'], [f.result().username for f in futures[:3]])
+        self.assertIs(futures[0], futures[2])
+        self.assertIsNone(futures[3].result())
+
+        self.assertEqual(1, len(self.transport.requests))
+        self.assertEqual({'k0': '1', 'k1': '2', 'k2': 'unknown'}, self.transport.requests[0]['variables'])
+
+    def test_window(self):
+        results = {}
+
+        def lookup(key):
+            results[key] = self.users.get(key).username
+
+        threads = [threading.Thread(target=lookup, args=(key,)) for key in _USERS]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(_USERS, results)
+        self.assertLessEqual(len(self.transport.requests), len(_USERS))
+
+        with self.subTest("later lookups use a new request"):
+            count = len(self.transport.requests)
+            self.assertEqual('alice', self.users.get('1').username)
+            self.assertEqual(count + 1, len(self.transport.requests))
+
+    def test_max_batch_size(self):
+        loader = QueryLoader(self.api, 'auth_user', '{ id username }', max_batch_size=2)
+        with loader.batch():
+            futures = loader.load_many(['1', '2', '3'])
+
+        self.assertEqual(['alice', 'bob', 'carol'], [f.result().username for f in futures])
+        self.assertEqual(2, len(self.transport.requests))
+
+    def test_errors(self):
+        with self.users.batch():
+            ok, failed = self.users.load('1'), self.users.load('error')
+
+        self.assertEqual('alice', ok.result().username)
+        with self.assertRaises(PortalAPIError) as ctx:
+            failed.result()
+        self.assertEqual('not allowed', str(ctx.exception))
+
+        with self.subTest("request fails"):
+            self.transport.status = 503
+            future = self.users.load('1')
+            self.users.dispatch()
+            self.assertRaises(PortalAPIRequest, future.result)
+
+
+if __name__ == '__main__':
+    unittest.main()
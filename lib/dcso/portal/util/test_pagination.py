@@ -0,0 +1,108 @@
+# Copyright (c) 2021, DCSO GmbH
+
+import threading
+import time
+import unittest
+
+from ..api import APIClient
+from ..exceptions import PortalAPIError, PortalAPIRequest
+from .pagination import Paginator
+from .standin import StandInTransport
+
+_QUERY = '''query ($first: Int, $cursor: Cursor) {
+    tdh { alerts(first: $first, after: $cursor) { edges { node { id } } pageInfo { hasNextPage endCursor } } }
+}'''
+
+
+class _Pages:
+    """Answers requests for pages of `count` alerts."""
+
+    def __init__(self, count: int, fail_at: int = -1):
+        self.count = count
+        self.fail_at = fail_at
+        self.fetched = threading.Semaphore(0)
+
+    def __call__(self, payload: dict) -> dict:
+        variables = payload['variables']
+        start = int(variables['cursor']) + 1 if variables['cursor'] is not None else 0
+        self.fetched.release()
+        if start == self.fail_at:
+            return {'errors': [{'message': 'page failed'}]}
+
+        end = min(start + variables['first'], self.count)
+        return {'data': {'tdh': {'alerts': {
+            'edges': [{'node': {'id': str(i)}} for i in range(start, end)],
+            'pageInfo': {'hasNextPage': end < self.count, 'endCursor': str(end - 1) if end > start else None},
+        }}}}
+
+
+class TestPaginator(unittest.TestCase):
+    def _client(self, pages: _Pages) -> (APIClient, StandInTransport):
+        transport = StandInTransport(responder=pages)
+        return APIClient(api_url='https://localhost/graphql', transport=transport), transport
+
+    def test_paginate(self):
+        for prefetch in (0, 1, 3):
+            for count in (0, 1, 10, 25):
+                with self.subTest(prefetch=prefetch, count=count):
+                    apic, transport = self._client(_Pages(count))
+                    nodes = list(apic.paginate(_QUERY, 'tdh.alerts', page_size=10, prefetch=prefetch))
+                    self.assertEqual([str(i) for i in range(count)], [node.id for node in nodes])
+                    self.assertEqual(max(1, -(-count // 10)), len(transport.requests))
+                    self.assertEqual(None, transport.requests[0]['variables']['cursor'])
+
+    def test_nodes(self):
+        transport = StandInTransport(response={'data': {'users': {
+            'nodes': [{'id': '1'}, {'id': '2'}],
+            'pageInfo': {'hasNextPage': False, 'endCursor': 'x'},
+        }}})
+        apic = APIClient(api_url='https://localhost/graphql', transport=transport)
+        nodes = list(apic.paginate('query ($n: Int, $c: String) { users { nodes { id } } }', 'users',
+                                   variables={'role': 'admin'}, cursor_variable='c', size_variable='n'))
+        self.assertEqual(['1', '2'], [node.id for node in nodes])
+        self.assertEqual({'role': 'admin', 'n': 100, 'c': None}, transport.requests[0]['variables'])
+
+    def test_prefetch(self):
+        pages = _Pages(1000)
+        apic, transport = self._client(pages)
+
+        it = iter(apic.paginate(_QUERY, 'tdh.alerts', page_size=10, prefetch=2))
+        next(it)
+        # page being iterated, and two pages fetched ahead
+        for _ in range(3):
+            self.assertTrue(pages.fetched.acquire(timeout=5))
+        time.sleep(0.2)
+        self.assertEqual(3, len(transport.requests))
+
+        # taking the next page frees a slot for fetching another
+        for _ in range(10):
+            next(it)
+        self.assertTrue(pages.fetched.acquire(timeout=5))
+        time.sleep(0.2)
+        self.assertEqual(4, len(transport.requests))
+
+        it.close()
+        time.sleep(0.3)
+        self.assertEqual(4, len(transport.requests))
+        self.assertFalse([t for t in threading.enumerate() if t.name == 'dcso-portal-paginator'])
+
+    def test_errors(self):
+        for prefetch in (0, 2):
+            with self.subTest(prefetch=prefetch):
+                apic, _ = self._client(_Pages(100, fail_at=20))
+                seen = []
+                with self.assertRaises(PortalAPIError):
+                    for node in apic.paginate(_QUERY, 'tdh.alerts', page_size=10, prefetch=prefetch):
+                        seen.append(node.id)
+                self.assertEqual(20, len(seen))
+
+        with self.subTest("missing connection"):
+            apic, _ = self._client(_Pages(10))
+            self.assertRaises(PortalAPIRequest, list, apic.paginate(_QUERY, 'tdh.issues'))
+
+        with self.subTest("page size"):
+            self.assertRaises(ValueError, Paginator, apic, _QUERY, 'tdh.alerts', page_size=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# Copyright (c) 2021, DCSO GmbH
+
+import hashlib
+import unittest
+
+from ..api import APIClient
+from ..exceptions import PortalAPIRequest
+from .persisted import (PERSISTED_QUERY_NOT_FOUND, PERSISTED_QUERY_NOT_SUPPORTED, PersistedQueries,
+                        persisted_query_error)
+from .standin import StandInTransport
+
+_QUERY = '{ ping }'
+_HASH = hashlib.sha256(_QUERY.encode()).hexdigest()
+
+
+class _APQServer:
+    """Responder for StandInTransport implementing Automatic Persisted Queries."""
+
+    def __init__(self, supported: bool = True):
+        self.supported = supported
+        self.store = {}
+
+    def __call__(self, payload: dict) -> dict:
+        persisted = (payload.get('extensions') or {}).get('persistedQuery')
+        if persisted is not None:
+            if not self.supported:
+                return {'errors': [{'message': PERSISTED_QUERY_NOT_SUPPORTED}]}
+
+            digest = persisted['sha256Hash']
+            if 'query' in payload:
+                if hashlib.sha256(payload['query'].encode()).hexdigest() != digest:
+                    return {'errors': [{'message': 'provided sha does not match query'}]}
+                self.store[digest] = payload['query']
+            elif digest not in self.store:
+                return {'errors': [{'message': PERSISTED_QUERY_NOT_FOUND,
+                                    'extensions': {'code': 'PERSISTED_QUERY_NOT_FOUND'}}]}
+        return {'data': {'ping': 'pong'}}
+
+
+class TestPersistedQueries(unittest.TestCase):
+    def test_registration(self):
+        server = _APQServer()
+        transport = StandInTransport(responder=server)
+        client = APIClient(api_url='https://localhost/graphql', transport=transport, persisted_queries=True)
+
+        for _ in range(3):
+            self.assertEqual('pong', client.execute_graphql(_QUERY).ping)
+
+        # registered using the first request, then only the hash is sent
+        self.assertEqual(_QUERY, transport.requests[0]['query'])
+        self.assertEqual(_HASH, transport.requests[0]['extensions']['persistedQuery']['sha256Hash'])
+        self.assertNotIn('query', transport.requests[1])
+        self.assertNotIn('query', transport.requests[2])
+        self.assertTrue(client.persisted_queries.is_registered(_HASH))
+
+        with self.subTest("server forgot query"):
+            server.store.clear()
+            self.assertEqual('pong', client.execute_graphql_dict(_QUERY)['ping'])
+            self.assertNotIn('query', transport.requests[3])
+            self.assertEqual(_QUERY, transport.requests[4]['query'])
+            self.assertEqual(5, len(transport.requests))
+
+    def test_not_supported(self):
+        transport = StandInTransport(responder=_APQServer(supported=False))
+        client = APIClient(api_url='https://localhost/graphql', transport=transport, persisted_queries=True)
+
+        for _ in range(2):
+            self.assertEqual('pong', client.execute_graphql(_QUERY).ping)
+
+        self.assertFalse(client.persisted_queries.supported)
+        self.assertEqual(3, len(transport.requests))
+        self.assertNotIn('extensions', transport.requests[-1])
+
+    def test_http_error(self):
+        transport = StandInTransport(response=b'', status=502)
+        client = APIClient(api_url='https://localhost/graphql', transport=transport, persisted_queries=True)
+        self.assertRaises(PortalAPIRequest, client.execute_graphql, _QUERY)
+        self.assertFalse(client.persisted_queries.is_registered(_HASH))
+
+    def test_sha256(self):
+        persisted = PersistedQueries()
+        self.assertEqual(_HASH, persisted.sha256(_QUERY))
+        self.assertEqual(_HASH, persisted.sha256(_QUERY))
+
+    def test_persisted_query_error(self):
+        cases = [
+            (b'{"data": {"ping": "pong"}}', None),
+            (b'{"errors": [{"message": "PersistedQueryNotFound"}]}', PERSISTED_QUERY_NOT_FOUND),
+            (b'{"errors": [{"message": "x", "extensions": {"code": "PERSISTED_QUERY_NOT_SUPPORTED"}}]}',
+             PERSISTED_QUERY_NOT_SUPPORTED),
+            (b'{"errors": [{"message": "PersistedQuery is a type"}]}', None),
+            (b'PersistedQueryNotFound', None),
+        ]
+
+        for body, exp in cases:
+            with self.subTest(body=body):
+                self.assertEqual(exp, persisted_query_error(body))
+
+
+if __name__ == '__main__':
+    unittest.main()
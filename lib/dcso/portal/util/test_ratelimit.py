@@ -0,0 +1,71 @@
+# Copyright (c) 2021, DCSO GmbH
+
+import threading
+import time
+import unittest
+
+from .ratelimit import RateLimiter
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_unlimited(self):
+        limiter = RateLimiter()
+        self.assertEqual(0, sum(limiter.reserve() for _ in range(100)))
+
+    def test_token_bucket(self):
+        limiter = RateLimiter(rate=10, burst=5)
+
+        waits = [limiter.reserve() for _ in range(7)]
+        self.assertEqual([0.0] * 5, waits[:5])
+        self.assertAlmostEqual(0.1, waits[5], delta=0.01)
+        self.assertAlmostEqual(0.2, waits[6], delta=0.01)
+
+    def test_throttled(self):
+        limiter = RateLimiter(rate=10, min_rate=2)
+
+        limiter.throttled()
+        self.assertEqual(5, limiter.rate)
+        for _ in range(5):
+            limiter.throttled()
+        self.assertEqual(2, limiter.rate)
+
+        for _ in range(100):
+            limiter.succeeded()
+        self.assertEqual(10, limiter.rate)
+
+        with self.subTest("retry after"):
+            limiter.throttled(retry_after=30)
+            self.assertGreater(limiter.reserve(), 29)
+
+    def test_max_in_flight(self):
+        limiter = RateLimiter(max_in_flight=2)
+        lock = threading.Lock()
+        in_flight = []
+        peak = [0]
+
+        def work():
+            limiter.acquire()
+            try:
+                with lock:
+                    in_flight.append(1)
+                    peak[0] = max(peak[0], len(in_flight))
+                time.sleep(0.01)
+                with lock:
+                    in_flight.pop()
+            finally:
+                limiter.release()
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(2, peak[0])
+
+    def test_invalid_rate(self):
+        self.assertRaises(ValueError, RateLimiter, rate=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
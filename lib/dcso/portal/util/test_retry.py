@@ -0,0 +1,87 @@
+# Copyright (c) 2021, DCSO GmbH
+
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from unittest.mock import patch
+
+from . import retry
+from .retry import RetryPolicy, is_mutation, parse_retry_after
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_backoff(self):
+        policy = RetryPolicy(backoff_base=1, backoff_max=5)
+        for attempt, cap in ((1, 1), (2, 2), (3, 4), (4, 5), (10, 5)):
+            with self.subTest(attempt=attempt):
+                for _ in range(50):
+                    self.assertTrue(0 <= policy.backoff(attempt) <= cap)
+
+        self.assertEqual(42, policy.backoff(1, retry_after=42))
+
+    def test_next_wait(self):
+        policy = RetryPolicy(max_attempts=3, backoff_base=0, total_timeout=10)
+        started = time.monotonic()
+
+        self.assertEqual(0, policy.next_wait(1, started, idempotent=True))
+        self.assertEqual(0, policy.next_wait(2, started, idempotent=True))
+        self.assertIsNone(policy.next_wait(3, started, idempotent=True))
+
+        with self.subTest("not idempotent"):
+            self.assertIsNone(policy.next_wait(1, started, idempotent=False))
+            policy.retry_mutations = True
+            self.assertEqual(0, policy.next_wait(1, started, idempotent=False))
+
+        with self.subTest("total timeout"):
+            self.assertIsNone(policy.next_wait(1, started, idempotent=True, retry_after=11))
+            self.assertIsNone(policy.next_wait(1, started - 11, idempotent=True))
+
+
+class TestParseRetryAfter(unittest.TestCase):
+    @patch.object(retry, 'utc_now')
+    def test_parse(self, mock_utc_now):
+        now = datetime(2021, 2, 8, 12, 0, 0, tzinfo=timezone.utc)
+        mock_utc_now.return_value = now
+
+        cases = [
+            (None, None),
+            ('', None),
+            ('120', 120.0),
+            ('soon', None),
+            (format_datetime(now + timedelta(seconds=30), usegmt=True), 30.0),
+            (format_datetime(now - timedelta(seconds=30), usegmt=True), 0.0),
+        ]
+
+        for value, exp in cases:
+            with self.subTest(value=value):
+                self.assertEqual(exp, parse_retry_after(value))
+
+
+class TestIsMutation(unittest.TestCase):
+    def test_is_mutation(self):
+        cases = [
+            ('mutation { ping }', True),
+            ('  \n mutation ($id: ID!) { ping(id: $id) }', True),
+            ('# comment\nmutation { ping }', True),
+            ('{ ping }', False),
+            ('query { mutation }', False),
+            ('query mutation { ping }', False),
+            ('mutations', False),
+            ('{ ping(note: "mutation") }', False),
+            ('fragment f on Query { ping }\nmutation { ...f }', True),
+            ('query A { ping } mutation B { ping }', True),
+            ('mutation { ping', True),
+        ]
+
+        for query, exp in cases:
+            with self.subTest(query=query):
+                self.assertEqual(exp, is_mutation(query))
+
+        document = 'query A { ping } mutation B { ping }'
+        self.assertFalse(is_mutation(document, operation_name='A'))
+        self.assertTrue(is_mutation(document, operation_name='B'))
+
+
+if __name__ == '__main__':
+    unittest.main()
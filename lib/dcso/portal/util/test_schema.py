@@ -0,0 +1,211 @@
+# Copyright (c) 2021, DCSO GmbH
+
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+
+from ..api import APIClient
+from ..exceptions import PortalAPIRequest
+from .schema import Schema, SchemaCache, schema_checksum
+from .standin import StandInTransport
+
+
+def _field(name: str, kind: str, type_name: str, wrappers=()) -> dict:
+    type_ref = {'kind': kind, 'name': type_name, 'ofType': None}
+    for wrapper in reversed(wrappers):
+        type_ref = {'kind': wrapper, 'name': None, 'ofType': type_ref}
+    return {'name': name, 'args': [], 'type': type_ref, 'isDeprecated': False}
+
+
+_SCHEMA = {
+    'queryType': {'name': 'Query'},
+    'mutationType': None,
+    'subscriptionType': None,
+    'types': [
+        {'kind': 'OBJECT', 'name': 'Query', 'fields': [
+            _field('alert', 'OBJECT', 'Alert'),
+            _field('alerts', 'OBJECT', 'Alert', ['NON_NULL', 'LIST']),
+            _field('node', 'INTERFACE', 'Node'),
+        ]},
+        {'kind': 'OBJECT', 'name': 'Alert', 'fields': [
+            _field('id', 'SCALAR', 'ID', ['NON_NULL']),
+            _field('occurredOn', 'SCALAR', 'DateTime', ['NON_NULL']),
+            _field('seenOn', 'SCALAR', 'DateTime', ['LIST', 'NON_NULL']),
+            _field('note', 'SCALAR', 'String'),
+            _field('updatedOn', 'SCALAR', 'Timestamp'),
+            _field('source', 'OBJECT', 'Source'),
+        ]},
+        {'kind': 'OBJECT', 'name': 'Source', 'fields': [
+            _field('name', 'SCALAR', 'String'),
+            _field('occurredOn', 'SCALAR', 'String'),
+        ]},
+        {'kind': 'INTERFACE', 'name': 'Node', 'fields': [_field('updatedOn', 'SCALAR', 'Timestamp')]},
+        {'kind': 'INPUT_OBJECT', 'name': 'AlertFilter', 'fields': None, 'inputFields': [
+            {'name': 'since', 'type': {'kind': 'SCALAR', 'name': 'DateTime', 'ofType': None},
+             'defaultValue': '"2021-02-08T10:11:12Z"'}]},
+        {'kind': 'OBJECT', 'name': '__Type', 'fields': [_field('createdOn', 'SCALAR', 'DateTime')]},
+    ],
+    'directives': [],
+}
+
+_STAMP = '2021-02-08T10:11:12Z'
+_TIME = datetime(2021, 2, 8, 10, 11, 12, tzinfo=timezone.utc)
+_QUERY = '{ alert { id occurredOn when: occurredOn note source { occurredOn } } }'
+
+
+def _alert() -> dict:
+    return {'id': '1', 'occurredOn': _STAMP, 'when': _STAMP, 'note': _STAMP, 'source': {'occurredOn': _STAMP}}
+
+
+def _respond(payload):
+    if isinstance(payload, list):
+        return [_respond(p) for p in payload]
+    if 'IntrospectionQuery' in payload['query']:
+        return {'data': {'__schema': _SCHEMA}}
+    if 'alerts' in payload['query']:
+        return {'data': {'alerts': [_alert(), _alert()]}}
+    return {'data': {'alert': _alert()}}
+
+
+class TestSchema(unittest.TestCase):
+    def test_timestamp_plan(self):
+        schema = Schema(_SCHEMA)
+        cases = [
+            ('aliases and types', _QUERY, {'alert': {'occurredOn': True, 'when': True}}),
+            ('lists', 'query Alerts { alerts { id seenOn } }', {'alerts': {'seenOn': True}}),
+            ('arguments and directives', '{ alert(id: "{ occurredOn }") @cached { occurredOn @include(if: true) } }',
+             {'alert': {'occurredOn': True}}),
+            ('fragment', '{ alert { ...A } } fragment A on Alert { occurredOn source { occurredOn } }',
+             {'alert': {'occurredOn': True}}),
+            ('inline fragment', '{ node { updatedOn ... on Alert { seenOn } ... @skip(if: false) { id } } }',
+             {'node': {'updatedOn': True, 'seenOn': True}}),
+            ('comments', '{ alert { # occurredOn\n id } }', {}),
+            ('unknown fields', '{ __schema { types { name } } other { occurredOn } }', {}),
+            ('recursive fragment', '{ alert { ...A } } fragment A on Alert { ...A occurredOn }',
+             {'alert': {'occurredOn': True}}),
+        ]
+        for name, document, expected in cases:
+            with self.subTest(name):
+                self.assertEqual(expected, schema.timestamp_plan(document))
+
+        self.assertEqual({'alert': {'occurredOn': True}}, Schema(_SCHEMA, scalars=['DateTime']).timestamp_plan(
+            '{ alert { occurredOn updatedOn } }'))
+        self.assertRaises(PortalAPIRequest, schema.timestamp_plan, '{ alert { id }')
+
+    def test_decode_timestamps(self):
+        schema = Schema(_SCHEMA)
+        data = {'alert': _alert()}
+        self.assertIs(data, schema.decode_timestamps(data, _QUERY))
+        self.assertEqual({'id': '1', 'occurredOn': _TIME, 'when': _TIME, 'note': _STAMP,
+                          'source': {'occurredOn': _STAMP}}, data['alert'])
+
+        data = {'alerts': [{'seenOn': [_STAMP, 'not a timestamp', None]}, {'seenOn': None}]}
+        schema.decode_timestamps(data, '{ alerts { seenOn } }')
+        self.assertEqual({'alerts': [{'seenOn': [_TIME, 'not a timestamp', None]}, {'seenOn': None}]}, data)
+
+        self.assertEqual(_TIME, schema.decode_timestamps(_STAMP, '{ alert { occurredOn } }', ['alert', 'occurredOn']))
+        self.assertEqual(_STAMP, schema.decode_timestamps(_STAMP, '{ alert { note } }', ['alert', 'note']))
+
+    def test_checksum(self):
+        reordered = dict(_SCHEMA, types=list(reversed(_SCHEMA['types'])))
+        self.assertEqual(schema_checksum(_SCHEMA), schema_checksum(reordered))
+        changed = dict(_SCHEMA, types=_SCHEMA['types'][:-1])
+        self.assertNotEqual(schema_checksum(_SCHEMA), schema_checksum(changed))
+
+
+class TestSchemaCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'schema.json')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_save_load(self):
+        cache = SchemaCache(self.path)
+        self.assertIsNone(cache.load('https://api.example.com/graphql'))
+
+        cache.save('https://api.example.com/graphql', _SCHEMA)
+        self.assertEqual(['schema.json'], os.listdir(self.tmp.name))
+        self.assertEqual(schema_checksum(_SCHEMA), cache.checksum)
+
+        cache = SchemaCache(self.path)
+        self.assertEqual(_SCHEMA, cache.load('https://api.example.com/graphql'))
+        self.assertEqual(schema_checksum(_SCHEMA), cache.checksum)
+        self.assertIsNone(cache.load('https://other.example.com/graphql'))
+        self.assertIsNone(SchemaCache(self.path, max_age=-1).load('https://api.example.com/graphql'))
+
+        cache.clear()
+        self.assertFalse(os.path.exists(self.path))
+        cache.clear()
+
+    def test_changed_file(self):
+        SchemaCache(self.path).save('https://api.example.com/graphql', _SCHEMA)
+        with open(self.path, 'r', encoding='utf-8') as fp:
+            stored = json.load(fp)
+        stored['schema']['types'].pop()
+        with open(self.path, 'w', encoding='utf-8') as fp:
+            json.dump(stored, fp)
+        self.assertIsNone(SchemaCache(self.path).load('https://api.example.com/graphql'))
+
+
+class TestLoadSchema(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'schema.json')
+        self.transport = StandInTransport(responder=_respond)
+        self.api = APIClient('https://api.example.com/graphql', transport=self.transport)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_typed_decoding(self):
+        self.assertEqual(_TIME, self.api.execute_graphql_dict(_QUERY)['alert']['note'])
+        self.assertIsNone(self.api.schema)
+
+        self.assertEqual(_SCHEMA, self.api.load_schema())
+        self.assertIsInstance(self.api.schema, Schema)
+
+        def check(alert):
+            self.assertEqual((_TIME, _TIME, _STAMP, _STAMP),
+                             (alert['occurredOn'], alert['when'], alert['note'], alert['source']['occurredOn']))
+
+        with self.subTest("execute"):
+            alert = self.api.execute_graphql(_QUERY).alert
+            check(dict(alert._asdict(), source=alert.source._asdict()))
+        with self.subTest("batch"):
+            for data in self.api.execute_batch([_QUERY, _QUERY]):
+                check(data['alert'])
+        with self.subTest("iter_path"):
+            alerts = list(self.api.iter_path('{ alerts { occurredOn when: occurredOn note source { occurredOn } } }',
+                                             'alerts'))
+            self.assertEqual(2, len(alerts))
+            for alert in alerts:
+                check(alert)
+        with self.subTest("prepared"):
+            check(self.api.prepare(_QUERY).execute_dict()['alert'])
+
+    def test_cache(self):
+        self.api.load_schema(cache=self.path)
+        self.api.load_schema(cache=self.path)
+        self.assertEqual(1, self.transport.stats.requests)
+        self.assertTrue(os.path.exists(self.path))
+
+        api = APIClient('https://api.example.com/graphql', transport=self.transport)
+        api.load_schema(cache=SchemaCache(self.path))
+        self.assertEqual(1, self.transport.stats.requests)
+        self.assertEqual(self.api.schema.timestamp_plan(_QUERY), api.schema.timestamp_plan(_QUERY))
+
+        api.load_schema(cache=self.path, refresh=True)
+        self.assertEqual(2, self.transport.stats.requests)
+
+    def test_no_schema(self):
+        api = APIClient('https://api.example.com/graphql', transport=StandInTransport({'data': {}}))
+        self.assertRaises(PortalAPIRequest, api.load_schema)
+        self.assertIsNone(api.schema)
+
+
+if __name__ == '__main__':
+    unittest.main()
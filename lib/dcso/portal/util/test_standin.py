@@ -0,0 +1,73 @@
+# Copyright (c) 2021, DCSO GmbH
+
+import json
+import time
+import unittest
+
+from ..exceptions import PortalAPIRequest, PortalTimeout
+from .graphql import GraphQLRequest
+from .standin import StandInTransport, generate_connection
+from .timeout import Deadline
+
+
+class TestStandInTransport(unittest.TestCase):
+    def test_canned_response(self):
+        transport = StandInTransport(response={'data': {'ping': 'pong'}})
+
+        for _ in range(2):
+            request = GraphQLRequest(query="{ ping }", api_url='https://localhost/graphql',
+                                     variables={'a': 1}, transport=transport)
+            self.assertEqual({'ping': 'pong'}, request.execute_dict()['data'])
+
+        self.assertEqual([{'query': '{ ping }', 'variables': {'a': 1}}] * 2, transport.requests)
+        self.assertEqual(2, transport.stats.requests)
+        self.assertEqual(2 * len(b'{"data": {"ping": "pong"}}'), transport.stats.bytes_received)
+
+    def test_responder(self):
+        transport = StandInTransport(responder=lambda r: {'data': {'echo': r['variables']['v']}})
+        request = GraphQLRequest(query="{ echo }", api_url='https://localhost/graphql',
+                                 variables={'v': 'hello'}, transport=transport)
+        self.assertEqual('hello', request.execute().echo)
+
+    def test_status(self):
+        transport = StandInTransport(response=b'', status=503)
+        request = GraphQLRequest(query="{ ping }", api_url='https://localhost/graphql', transport=transport)
+        with self.assertRaises(PortalAPIRequest) as ctx:
+            request.execute_dict()
+        self.assertEqual("Service Unavailable", str(ctx.exception))
+
+    def test_latency(self):
+        transport = StandInTransport(response={'data': {}}, latency=0.05)
+
+        started = time.monotonic()
+        transport.request('POST', 'https://localhost/graphql', b'{}').read()
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+
+        self.assertRaises(PortalTimeout, transport.request, 'POST', 'https://localhost/graphql', b'{}',
+                          deadline=Deadline(0.01))
+
+    def test_closed(self):
+        with StandInTransport(response={'data': {}}) as transport:
+            pass
+        self.assertTrue(transport.closed)
+        self.assertRaises(PortalAPIRequest, transport.request, 'POST', 'https://localhost/graphql', b'{}')
+
+
+class TestGenerateConnection(unittest.TestCase):
+    def test_generate(self):
+        response = generate_connection('alerts', 3)
+        edges = response['data']['alerts']['edges']
+        self.assertEqual(3, len(edges))
+        self.assertEqual(3, response['data']['alerts']['totalCount'])
+        self.assertEqual('2', response['data']['alerts']['pageInfo']['endCursor'])
+
+        response = generate_connection('tdh.issues', 2, node=lambda i: {'id': i})
+        self.assertEqual([{'cursor': '0', 'node': {'id': 0}}, {'cursor': '1', 'node': {'id': 1}}],
+                         response['data']['tdh']['issues']['edges'])
+
+        # must be serializable
+        json.dumps(generate_connection('alerts', 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
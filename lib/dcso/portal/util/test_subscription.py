@@ -0,0 +1,212 @@
+# Copyright (c) 2021, DCSO GmbH
+
+import json
+import struct
+import sys
+import threading
+import time
+import unittest
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from ..api import APIClient
+from ..exceptions import PortalAPIError, PortalAPIRequest, PortalConnection
+from .networking import free_localhost_tcp_port
+from .retry import RetryPolicy
+from .subscription import GRAPHQL_TRANSPORT_WS, websocket_url
+from .websocket import OP_CLOSE, OP_TEXT, accept_key, decode_frame, encode_frame
+
+
+class _WebSocketHandler(BaseHTTPRequestHandler):
+    """Speaks graphql-transport-ws, sending the events of the server once
+    subscribed, after which the subscription is completed, the connection is
+    dropped, or kept open, as set using the server's `after` list."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.close_connection = True
+        self.server.handshakes.append(dict(self.headers))
+        self.send_response(101)
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', accept_key(self.headers['Sec-WebSocket-Key']))
+        self.send_header('Sec-WebSocket-Protocol', GRAPHQL_TRANSPORT_WS)
+        self.end_headers()
+        self.wfile.flush()
+
+        after = self.server.after.pop(0) if len(self.server.after) > 1 else self.server.after[0]
+        while True:
+            message = self._recv()
+            if message is None:
+                return
+            self.server.messages.append(message)
+
+            kind = message['type']
+            if kind == 'connection_init':
+                if self.server.reject:
+                    self._send_frame(OP_CLOSE, struct.pack('!H', self.server.reject) + b'Unauthorized')
+                    return
+                self._send({'type': 'connection_ack'})
+            elif kind == 'ping' and self.server.answer_pings:
+                self._send({'type': 'pong'})
+            elif kind == 'subscribe':
+                for event in self.server.events:
+                    self._send({'id': message['id'], 'type': 'next', 'payload': event})
+                if after == 'complete':
+                    self._send({'id': message['id'], 'type': 'complete'})
+                elif after == 'error':
+                    self._send({'id': message['id'], 'type': 'error', 'payload': [{'message': 'not allowed'}]})
+                elif after == 'drop':
+                    return
+            elif kind == 'complete':
+                return
+
+    def _send(self, message: dict) -> None:
+        self._send_frame(OP_TEXT, json.dumps(message).encode('utf-8'))
+
+    def _send_frame(self, opcode: int, payload: bytes) -> None:
+        self.wfile.write(encode_frame(opcode, payload, mask=False))
+        self.wfile.flush()
+
+    def _recv(self):
+        buffer = bytearray()
+        while True:
+            frame = decode_frame(buffer)
+            if frame is not None:
+                _, opcode, payload, _ = frame
+                return json.loads(payload) if opcode == OP_TEXT else None
+            data = self.rfile.read1(4096)
+            if not data:
+                return None
+            buffer += data
+
+
+class _WebSocketServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class TestSubscription(unittest.TestCase):
+    def setUp(self):
+        self.server = _WebSocketServer(('127.0.0.1', free_localhost_tcp_port()), _WebSocketHandler)
+        self.server.events = [{'data': {'alertCreated': {'id': '1', 'occurredOn': '2021-02-08T10:11:12Z'}}},
+                              {'data': {'alertCreated': {'id': '2', 'occurredOn': '2021-02-08T10:11:13Z'}}}]
+        self.server.after = ['complete']
+        self.server.reject = None
+        self.server.answer_pings = True
+        self.server.handshakes = []
+        self.server.messages = []
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+        self.apic = APIClient(api_url='http://127.0.0.1:{}/graphql'.format(self.server.server_address[1]))
+        self.apic.token = 'secret'
+        self.reconnect = RetryPolicy(max_attempts=3, backoff_base=0.01)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.apic.close()
+
+    def _types(self) -> list:
+        return [message['type'] for message in self.server.messages]
+
+    def test_websocket_url(self):
+        self.assertEqual('wss://portal.example.com/graphql', websocket_url('https://portal.example.com/graphql'))
+        self.assertEqual('ws://127.0.0.1:8080/graphql', websocket_url('http://127.0.0.1:8080/graphql'))
+
+    def test_frames(self):
+        for size in (0, 5, 125, 126, 65535, 65536):
+            for mask in (True, False):
+                with self.subTest(size=size, mask=mask):
+                    payload = bytes(i % 251 for i in range(size))
+                    frame = encode_frame(OP_TEXT, payload, mask=mask)
+                    self.assertEqual((True, OP_TEXT, payload, len(frame)), decode_frame(frame))
+                    self.assertIsNone(decode_frame(frame[:-1] if size else frame[:1]))
+
+    def test_subscribe(self):
+        query = 'subscription ($since: DateTime) { alertCreated(since: $since) { id occurredOn } }'
+        since = datetime(2021, 2, 8, tzinfo=timezone.utc)
+        events = list(self.apic.subscribe(query, variables={'since': since}))
+
+        self.assertEqual(['1', '2'], [event.alertCreated.id for event in events])
+        self.assertEqual(datetime(2021, 2, 8, 10, 11, 12, tzinfo=timezone.utc), events[0].alertCreated.occurredOn)
+
+        self.assertEqual('Bearer secret', self.server.handshakes[0]['Authorization'])
+        self.assertEqual(['connection_init', 'subscribe'], self._types())
+        self.assertEqual({'Authorization': 'Bearer secret'}, self.server.messages[0]['payload'])
+        self.assertEqual({'query': query, 'variables': {'since': '2021-02-08T00:00:00+00:00'}},
+                         self.server.messages[1]['payload'])
+
+    def test_run(self):
+        received = []
+        self.apic.subscribe('subscription { alertCreated { id } }').run(received.append)
+        self.assertEqual(2, len(received))
+
+    def test_reconnect(self):
+        self.server.after = ['drop', 'drop', 'complete']
+        subscription = self.apic.subscribe('subscription { alertCreated { id } }', reconnect=self.reconnect)
+
+        self.assertEqual(6, len(list(subscription)))
+        self.assertEqual(2, subscription.reconnects)
+        self.assertEqual(3, self._types().count('subscribe'))
+
+        with self.subTest("gives up"):
+            self.server.after = ['drop']
+            self.server.events = []
+            subscription = self.apic.subscribe('subscription { alertCreated { id } }', reconnect=self.reconnect)
+            with self.assertRaises(PortalConnection):
+                for _ in subscription:
+                    pass
+
+    def test_keepalive(self):
+        self.server.after = ['wait']
+        subscription = self.apic.subscribe('subscription { alertCreated { id } }', keepalive=0.05)
+        threading.Timer(0.4, subscription.close).start()
+
+        started = time.monotonic()
+        self.assertEqual(2, len(list(subscription)))
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertGreaterEqual(self._types().count('ping'), 3)
+        # the server handles the last message in the background
+        for _ in range(100):
+            if self._types()[-1] == 'complete':
+                break
+            time.sleep(0.01)
+        self.assertEqual('complete', self._types()[-1])
+        self.assertEqual(0, subscription.reconnects)
+
+        with self.subTest("unanswered ping"):
+            self.server.answer_pings = False
+            self.server.events = []
+            self.server.messages.clear()
+            subscription = self.apic.subscribe('subscription { alertCreated { id } }', keepalive=0.05,
+                                               reconnect=self.reconnect)
+            self.assertRaises(PortalConnection, list, subscription)
+            self.assertEqual(2, subscription.reconnects)
+            self.assertEqual(3, self._types().count('subscribe'))
+
+    def test_errors(self):
+        self.server.after = ['error']
+        self.assertRaises(PortalAPIError, list, self.apic.subscribe('subscription { alertCreated { id } }'))
+
+        self.server.events = [{'errors': [{'message': 'invalid filter'}]}]
+        self.assertRaises(PortalAPIError, list, self.apic.subscribe('subscription { alertCreated { id } }'))
+
+        with self.subTest("unauthorized"):
+            self.server.reject = 4401
+            subscription = self.apic.subscribe('subscription { alertCreated { id } }', reconnect=self.reconnect)
+            with self.assertRaisesRegex(PortalAPIRequest, 'unauthorized'):
+                list(subscription)
+            self.assertEqual(0, subscription.reconnects)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,7 @@
 
 from collections import namedtuple
 from datetime import datetime, timezone
+import time
 import unittest
 from unittest.mock import patch
 
@@ -46,6 +47,12 @@ class TestDecodeUTCISO8601(unittest.TestCase):
                  exp=datetime(2019, 7, 30, 16, 12, 44, 490868, tzinfo=timezone.utc)),
             Case(value='2019-10-31T12:35:49.350488666+00:00',
                  exp=datetime(2019, 10, 31, 12, 35, 49, 350489, tzinfo=timezone.utc)),
+            Case(value='2019-10-31 12:35:49.350488444 UTC',
+                 exp=datetime(2019, 10, 31, 12, 35, 49, 350488, tzinfo=timezone.utc)),
+            Case(value='2019-10-31T23:59:59.999999999Z',
+                 exp=datetime(2019, 11, 1, 0, 0, 0, 0, tzinfo=timezone.utc)),
+            Case(value='2019-10-31 12:35:49+00',
+                 exp=datetime(2019, 10, 31, 12, 35, 49, 0, tzinfo=timezone.utc)),
         ]
 
         for case in cases:
@@ -56,12 +63,56 @@ class TestDecodeUTCISO8601(unittest.TestCase):
         cases = [
             '2020-07-30T16:12:44.490868CEST',
             '2019-07-30T16:12:44.490868+02:00',
+            '2019-07-30T16:12:44.4908681x+00:00',
+            '2019-07-30T16:12:44+02:00Z',
+            '',
+            None,
+            1,
+            ['2020-07-30T16:12:44Z'],
         ]
 
         for case in cases:
             with self.subTest(case=case):
                 self.assertRaises(ValueError, temporal.decode_utc_iso8601, case)
 
+    def test_cache(self):
+        value = '2020-07-30T16:12:44.490868Z'
+        self.assertIs(temporal.decode_utc_iso8601(value), temporal.decode_utc_iso8601(value))
+
+        with patch.object(temporal, 'TIMESTAMP_CACHE_SIZE', 10):
+            for i in range(25):
+                value = f'2020-07-30T16:12:{i:02d}Z'
+                self.assertEqual(datetime(2020, 7, 30, 16, 12, i, tzinfo=timezone.utc),
+                                 temporal.decode_utc_iso8601(value))
+                self.assertIn(value, temporal._decoded)
+                self.assertLessEqual(len(temporal._decoded), 10)
+
+        # invalid values are not memoized
+        self.assertRaises(ValueError, temporal.decode_utc_iso8601, '2020-07-30T16:12:44+02:00')
+        self.assertNotIn('2020-07-30T16:12:44+02:00', temporal._decoded)
+
+    def test_throughput(self):
+        # relative to the same decoder without memoization, so the speed of the
+        # machine does not matter; the margin is generous as memoized decoding
+        # of repeated timestamps is several times faster
+        def fastest(values) -> float:
+            best = None
+            for _ in range(7):
+                temporal._decoded.clear()
+                start = time.perf_counter()
+                for value in values:
+                    temporal.decode_utc_iso8601(value)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            return best
+
+        repeated = ['2021-02-08T10:{:02d}:{:02d}.{:06d}Z'.format(i // 60, i % 60, i) for i in range(50)] * 100
+
+        memoized = fastest(repeated)
+        with patch.object(temporal, 'TIMESTAMP_CACHE_SIZE', 0):
+            unmemoized = fastest(repeated)
+        self.assertLess(memoized * 2, unmemoized)
+
 
 if __name__ == '__main__':
     unittest.main()
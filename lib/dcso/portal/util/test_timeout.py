@@ -0,0 +1,45 @@
+# Copyright (c) 2021, DCSO GmbH
+
+import time
+import unittest
+
+from ..exceptions import PortalTimeout
+from .timeout import Deadline, Timeout
+
+
+class TestTimeout(unittest.TestCase):
+    def test_from_value(self):
+        timeout = Timeout(total=5)
+        self.assertIs(timeout, Timeout.from_value(timeout))
+        self.assertIsNone(Timeout.from_value(None))
+
+        timeout = Timeout.from_value(3)
+        self.assertEqual((3, 3, None), (timeout.connect, timeout.read, timeout.total))
+
+
+class TestDeadline(unittest.TestCase):
+    def test_deadline(self):
+        deadline = Deadline(60)
+        self.assertFalse(deadline.expired())
+        self.assertTrue(59 < deadline.remaining() <= 60)
+        self.assertEqual(5, deadline.limit(5))
+        self.assertLessEqual(deadline.limit(None), 60)
+        self.assertLessEqual(deadline.limit(100), 60)
+        deadline.check()
+
+    def test_expired(self):
+        deadline = Deadline(0.01)
+        time.sleep(0.02)
+        self.assertTrue(deadline.expired())
+        self.assertEqual(0, deadline.remaining())
+        self.assertEqual(0, deadline.limit(5))
+        self.assertRaises(PortalTimeout, deadline.check)
+
+    def test_earliest(self):
+        first, second = Deadline(1), Deadline(2)
+        self.assertIs(first, Deadline.earliest(second, None, first))
+        self.assertIsNone(Deadline.earliest(None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+# Copyright (c) 2021, DCSO GmbH
+
+import copy
+import json
+import pickle
+import unittest
+
+from ..api import APIClient
+from .graphql import graphql_data_to_namedtuple
+from .standin import StandInTransport, generate_connection
+from .views import ListView, ResultView, view
+
+_DATA = {
+    'alerts': {
+        'edges': [{'node': {'id': '1', 'tags': ['a', 'b']}},
+                  {'node': {'id': '2', 'tags': []}}],
+        'pageInfo': {'hasNextPage': False, 'endCursor': None},
+    },
+    'matrix': [[{'x': 1}]],
+    'count': 2,
+}
+
+
+class TestResultView(unittest.TestCase):
+    def setUp(self):
+        self.data = copy.deepcopy(_DATA)
+        self.view = ResultView(self.data)
+
+    def test_access(self):
+        result = self.view
+        self.assertEqual('1', result.alerts.edges[0].node.id)
+        self.assertEqual(['2'], [edge.node.id for edge in result.alerts.edges[1:]])
+        self.assertEqual(['a', 'b'], result.alerts.edges[0].node.tags)
+        self.assertEqual(1, result.matrix[0][0].x)
+        self.assertFalse(result.alerts.pageInfo.hasNextPage)
+        self.assertEqual(2, result.count)
+        self.assertEqual('1', result.alerts.edges[0].node['id'])
+        self.assertEqual('Alert', ResultView({'__typename': 'Alert'})['__typename'])
+        self.assertEqual(2, len(result.alerts.edges))
+
+        # same access as namedtuples
+        eager = graphql_data_to_namedtuple(copy.deepcopy(_DATA))
+        self.assertEqual(eager.alerts.edges[1].node.id, result.alerts.edges[1].node.id)
+        self.assertEqual(eager._fields, result._fields)
+        self.assertEqual(eager.alerts.pageInfo._asdict(), result.alerts.pageInfo._asdict())
+
+        self.assertEqual(_DATA, self.data)
+
+    def test_read_only(self):
+        with self.assertRaises(AttributeError):
+            self.view.count = 3
+        with self.assertRaises(AttributeError):
+            del self.view.count
+        with self.assertRaises(AttributeError):
+            self.view.alerts.edges[0].node.title
+        with self.assertRaises(AttributeError):
+            self.view.__dict__
+        self.assertFalse(hasattr(ListView([], 'x'), '__dict__'))
+
+    def test_protocols(self):
+        self.assertEqual(self.view, ResultView(copy.deepcopy(_DATA)))
+        self.assertNotEqual(self.view.alerts, self.view)
+        self.assertEqual([1], [item.x for item in self.view.matrix[0]])
+        self.assertEqual(3, len(self.view))
+        self.assertIn('count', self.view)
+        self.assertIn('count', dir(self.view))
+        self.assertEqual("pageInfo(hasNextPage=False, endCursor=None)", repr(self.view.alerts.pageInfo))
+        self.assertEqual(self.view, pickle.loads(pickle.dumps(self.view)))
+        self.assertEqual(self.view, copy.deepcopy(self.view))
+        self.assertEqual('text', view('text'))
+
+
+class TestLazyExecute(unittest.TestCase):
+    def test_execute_graphql(self):
+        transport = StandInTransport(response=generate_connection('tdh.alerts', 1000))
+        apic = APIClient(api_url='https://localhost/graphql', transport=transport)
+
+        result = apic.execute_graphql('{ tdh { alerts { edges { node { id } } } } }', lazy=True)
+        self.assertIsInstance(result, ResultView)
+        self.assertEqual('00000999-0000-4000-8000-000000000000', result.tdh.alerts.edges[-1].node.id)
+        self.assertEqual(1000, result.tdh.alerts.totalCount)
+        expected = json.loads(json.dumps(generate_connection('tdh.alerts', 1000)))['data']['tdh']['alerts']
+        self.assertEqual(expected['pageInfo'], result.tdh.alerts.pageInfo._asdict())
+
+
+if __name__ == '__main__':
+    unittest.main()
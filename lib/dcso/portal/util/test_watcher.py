@@ -0,0 +1,163 @@
+# Copyright (c) 2021, DCSO GmbH
+
+import threading
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from ..api import APIClient
+from ..exceptions import PortalAPIError
+from .cache import ResponseCache
+from .graphql import GraphQLJSONEncoder
+from .standin import StandInTransport
+from .temporal import decode_utc_iso8601
+from .watcher import Watcher
+
+_QUERY = '''query ($first: Int, $cursor: Cursor, $since: DateTime) {
+    alerts(first: $first, after: $cursor, filter: {occurredSince: $since}) {
+        edges { node { id occurredOn } } pageInfo { hasNextPage endCursor }
+    }
+}'''
+
+_EPOCH = datetime(2021, 2, 8, 10, 0, 0, tzinfo=timezone.utc)
+
+
+class _Alerts:
+    """Answers requests for alerts occurring since the given time, or after the
+    given cursor, which is the index of an alert."""
+
+    def __init__(self):
+        self.alerts = []
+        # requests continuing after this cursor fail
+        self.fail_after = None
+
+    def add(self, count: int, second: int) -> None:
+        for _ in range(count):
+            occurred = (_EPOCH + timedelta(seconds=second)).isoformat().replace('+00:00', 'Z')
+            self.alerts.append({'id': str(len(self.alerts)), 'occurredOn': occurred})
+
+    def __call__(self, payload: dict) -> dict:
+        variables = payload['variables']
+        if self.fail_after is not None and variables['cursor'] == self.fail_after:
+            return {'errors': [{'message': 'unavailable'}]}
+        indexes = range(len(self.alerts))
+        if variables.get('since'):
+            since = decode_utc_iso8601(variables['since'])
+            indexes = [i for i in indexes if decode_utc_iso8601(self.alerts[i]['occurredOn']) >= since]
+        if variables['cursor'] is not None:
+            indexes = [i for i in indexes if i > int(variables['cursor'])]
+
+        page = list(indexes)[:variables['first']]
+        return {'data': {'alerts': {
+            'edges': [{'node': self.alerts[i]} for i in page],
+            'pageInfo': {'hasNextPage': len(indexes) > len(page),
+                         'endCursor': str(page[-1]) if page else variables['cursor']},
+        }}}
+
+
+class TestWatcher(unittest.TestCase):
+    def setUp(self):
+        self.alerts = _Alerts()
+        self.transport = StandInTransport(responder=self.alerts)
+        self.apic = APIClient(api_url='https://localhost/graphql', transport=self.transport)
+
+    @staticmethod
+    def _ids(nodes) -> list:
+        return [node['id'] for node in nodes]
+
+    def test_since(self):
+        self.alerts.add(3, second=0)
+        self.alerts.add(2, second=10)
+        watcher = self.apic.watch(_QUERY, 'alerts', since=_EPOCH + timedelta(seconds=5), page_size=2)
+
+        self.assertEqual(['3', '4'], self._ids(watcher.poll()))
+        self.assertEqual(_EPOCH + timedelta(seconds=10), watcher.mark)
+
+        # alerts sharing the time of the mark are not reported again
+        self.alerts.add(1, second=10)
+        self.alerts.add(2, second=11)
+        self.assertEqual(['5', '6', '7'], self._ids(watcher.poll()))
+
+        self.assertEqual([], watcher.poll())
+        self.assertEqual(GraphQLJSONEncoder().encode(_EPOCH + timedelta(seconds=11)).strip('"'),
+                         self.transport.requests[-1]['variables']['since'])
+
+    def test_cursor(self):
+        self.alerts.add(5, second=0)
+        watcher = self.apic.watch(_QUERY, 'alerts', since_field=None, page_size=2)
+
+        self.assertEqual(['0', '1', '2', '3', '4'], self._ids(watcher.poll()))
+        self.assertEqual('4', watcher.mark)
+
+        self.alerts.add(1, second=0)
+        self.assertEqual(['5'], self._ids(watcher.poll()))
+        self.assertEqual([], watcher.poll())
+        self.assertEqual('5', self.transport.requests[-1]['variables']['cursor'])
+
+    def test_cache(self):
+        for since_field in ('occurredOn', None):
+            with self.subTest(since_field=since_field):
+                self.setUp()
+                apic = APIClient(api_url='https://localhost/graphql', transport=self.transport, cache=ResponseCache())
+                watcher = apic.watch(_QUERY, 'alerts', since_field=since_field, page_size=2)
+                self.assertEqual([], watcher.poll())
+                requests = len(self.transport.requests)
+
+                self.alerts.add(1, second=0)
+                self.assertEqual(['0'], self._ids(watcher.poll()))
+                self.assertEqual(requests + 1, len(self.transport.requests))
+                self.assertEqual(0, len(apic.cache))
+
+    def test_failed_poll(self):
+        for since_field in ('occurredOn', None):
+            with self.subTest(since_field=since_field):
+                self.setUp()
+                self.alerts.add(3, second=0)
+                watcher = self.apic.watch(_QUERY, 'alerts', since_field=since_field, page_size=2)
+                self.assertEqual(['0', '1', '2'], self._ids(watcher.poll()))
+                mark = watcher.mark
+
+                self.alerts.add(2, second=10)
+                self.alerts.fail_after = '4' if since_field is None else '3'
+                self.alerts.add(1, second=10)
+                self.assertRaises(PortalAPIError, watcher.poll)
+                self.assertEqual(mark, watcher.mark)
+
+                self.alerts.fail_after = None
+                self.assertEqual(['3', '4', '5'], self._ids(watcher.poll()))
+
+    def test_interval(self):
+        watcher = Watcher(self.apic, _QUERY, 'alerts', page_size=10, min_interval=1, max_interval=8)
+
+        for expected in (2, 4, 8, 8):
+            watcher.poll()
+            self.assertEqual(expected, watcher.interval)
+        self.assertEqual(4, watcher.empty_polls)
+
+        self.alerts.add(10, second=1)
+        watcher.poll()
+        self.assertEqual(1, watcher.interval)
+
+        watcher._last_poll -= 4
+        self.alerts.add(2, second=2)
+        watcher.poll()
+        self.assertAlmostEqual(2, watcher.interval, delta=0.1)
+
+        self.assertRaises(ValueError, Watcher, self.apic, _QUERY, 'alerts', min_interval=2, max_interval=1)
+
+    def test_iterate(self):
+        self.alerts.add(3, second=0)
+        watcher = self.apic.watch(_QUERY, 'alerts', min_interval=0.01, max_interval=0.02)
+
+        seen = []
+        for alert in watcher:
+            seen.append(alert.id)
+            if len(seen) == 3:
+                threading.Timer(0.05, self.alerts.add, (1, 5)).start()
+            if len(seen) == 4:
+                watcher.stop()
+        self.assertEqual(['0', '1', '2', '3'], seen)
+        self.assertIsInstance(watcher.mark, datetime)
+
+
+if __name__ == '__main__':
+    unittest.main()
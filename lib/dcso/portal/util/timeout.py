@@ -0,0 +1,105 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+Timeouts and deadlines limiting how long requests with the DCSO Portal API
+may take.
+"""
+
+import time
+from typing import Optional, Union
+
+from ..exceptions import PortalTimeout
+
+DEFAULT_CONNECT_TIMEOUT = 10.0
+"""Default number of seconds to wait for a connection to be established."""
+
+DEFAULT_READ_TIMEOUT = 60.0
+"""Default number of seconds to wait for data from the API."""
+
+
+class Timeout:
+    """Timeout holds the number of seconds a request may take.
+
+    The `connect` timeout limits establishing a connection, including the TLS
+    handshake. The `read` timeout limits how long we wait for each piece of data
+    from the API, which includes waiting for the response to be ready. The `total`
+    timeout limits the complete request, including retries and waiting between
+    them. None means no limit.
+
+    Note that the read timeout applies to each read from the connection. A request
+    is not started when its total timeout or `Deadline` passed, and waits at most
+    the remaining time for each read, but the body of a response which keeps
+    trickling in can take longer than the time which remained.
+    """
+
+    def __init__(self, connect: Optional[float] = DEFAULT_CONNECT_TIMEOUT,
+                 read: Optional[float] = DEFAULT_READ_TIMEOUT,
+                 total: Optional[float] = None):
+        self.connect: Optional[float] = connect
+        self.read: Optional[float] = read
+        self.total: Optional[float] = total
+
+    def __repr__(self) -> str:
+        return f"Timeout(connect={self.connect}, read={self.read}, total={self.total})"
+
+    @classmethod
+    def from_value(cls, value: Union['Timeout', float, None]) -> Optional['Timeout']:
+        """Returns `value` as Timeout. A number is used as both connect
+        and read timeout."""
+        if value is None or isinstance(value, Timeout):
+            return value
+        return cls(connect=value, read=value)
+
+
+class Deadline:
+    """Deadline is a point in time, `seconds` from now, by which an operation
+    must be done.
+
+    A deadline can span multiple requests, for example when going through all
+    pages of a result. Each request, including its retries, only gets the time
+    which remains:
+
+        deadline = Deadline(300)
+        for page in pages:
+            apic.execute_graphql(query, variables=page, deadline=deadline)
+
+    Raises `PortalTimeout` from requests started after the deadline passed.
+    """
+
+    def __init__(self, seconds: float):
+        self.expires: float = time.monotonic() + seconds
+
+    def __repr__(self) -> str:
+        return f"Deadline(remaining={self.remaining():.3f})"
+
+    def remaining(self) -> float:
+        """Returns the number of seconds left, which is 0 when expired."""
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires
+
+    def check(self) -> None:
+        """Raises `PortalTimeout` when the deadline passed."""
+        if self.expired():
+            raise PortalTimeout("deadline exceeded")
+
+    def limit(self, seconds: Optional[float]) -> float:
+        """Returns `seconds`, or the remaining time when this is less. When
+        `seconds` is None, the remaining time is returned.
+
+        This is 0 when the deadline passed; call `check` afterwards instead of
+        using 0 as socket timeout, which would make the socket non-blocking."""
+        remaining = self.remaining()
+        if seconds is None:
+            return remaining
+        return min(seconds, remaining)
+
+    @staticmethod
+    def earliest(*deadlines: Optional['Deadline']) -> Optional['Deadline']:
+        """Returns the deadline expiring first, ignoring None values."""
+        result = None
+        for deadline in deadlines:
+            if deadline is not None and (result is None or deadline.expires < result.expires):
+                result = deadline
+        return result
@@ -0,0 +1,145 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+Interface of transports used by `dcso.portal.APIClient` to send requests to
+the DCSO Portal API.
+"""
+
+import http.client
+import threading
+from abc import ABCMeta, abstractmethod
+from typing import Optional, Union
+from urllib.parse import ParseResult
+
+from .timeout import Deadline, Timeout
+
+
+class TransportStats:
+    """Counters describing the work done by a transport.
+
+    Next to counting requests, connections, and TLS handshakes, the following
+    is kept:
+
+    * `attempts`: times a request was sent, including retries
+    * `retries`: times a request was attempted again after it failed
+    * `throttled`: responses with status 429 (Too Many Requests)
+
+    * `bytes_sent`: request bodies as sent on the wire (possibly compressed)
+    * `bytes_encoded`: request bodies before compression
+    * `bytes_received`: response bodies as received from the wire
+    * `bytes_decoded`: response bodies after decompression
+
+    All counters are updated thread-safe. Use `as_dict` to get a consistent
+    snapshot of the values.
+    """
+
+    _counters = (
+        'requests',
+        'attempts',
+        'retries',
+        'throttled',
+        'connections_opened',
+        'connections_reused',
+        'connections_evicted',
+        'tls_handshakes',
+        'tls_sessions_resumed',
+        'bytes_sent',
+        'bytes_encoded',
+        'bytes_received',
+        'bytes_decoded',
+        'compressed_bodies_rejected',
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        for name in self._counters:
+            setattr(self, name, 0)
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {name: getattr(self, name) for name in self._counters}
+
+    def reset(self) -> None:
+        with self._lock:
+            for name in self._counters:
+                setattr(self, name, 0)
+
+
+class Transport(metaclass=ABCMeta):
+    """Transport sends HTTP requests to the API on behalf of `dcso.portal.APIClient`.
+
+    The default transport is `dcso.portal.util.connection.ConnectionPool`. Other
+    implementations, for example `dcso.portal.util.standin.StandInTransport`, can
+    be passed to the client using its `transport` argument.
+    """
+
+    stats: TransportStats
+
+    @property
+    @abstractmethod
+    def closed(self) -> bool:
+        raise NotImplemented
+
+    @abstractmethod
+    def close(self) -> None:
+        """Releases all resources, such as connections, held by the transport."""
+        raise NotImplemented
+
+    @abstractmethod
+    def request(self, method: str, url: Union[ParseResult, str],
+                body: Optional[bytes] = None, headers: Optional[dict] = None,
+                idempotent: bool = True, timeout: Optional[Timeout] = None,
+                deadline: Optional[Deadline] = None):
+        """Sends the request and returns the response, of which the body is not
+        yet read. The response has the attributes `status`, `reason`, and `headers`,
+        and methods `read` and `close`, like `http.client.HTTPResponse`.
+
+        Raises `PortalAPIRequest` when the request could not be sent or no
+        response was received.
+        """
+        raise NotImplemented
+
+    def __enter__(self) -> 'Transport':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+class BufferedResponse:
+    """Response of which the complete body is held in memory."""
+
+    def __init__(self, status: int, body: bytes, headers: Optional[dict] = None,
+                 reason: Optional[str] = None):
+        self.status: int = status
+        self.reason: str = reason if reason is not None else http.client.responses.get(status, '')
+        self.headers = http.client.HTTPMessage()
+        for name, value in (headers or {}).items():
+            self.headers[name] = value
+
+        self._body: bytes = body
+        self._pos: int = 0
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        if amt is None:
+            end = len(self._body)
+        else:
+            end = min(len(self._body), self._pos + amt)
+        data, self._pos = self._body[self._pos:end], end
+        return data
+
+    def read1(self, amt: int = 64 * 1024) -> bytes:
+        return self.read(amt)
+
+    def close(self) -> None:
+        self._pos = len(self._body)
+
+    def __enter__(self) -> 'BufferedResponse':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
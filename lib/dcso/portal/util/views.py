@@ -0,0 +1,132 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+Read-only views giving attribute access to decoded GraphQL response data,
+without converting it first.
+"""
+
+from collections.abc import Sequence
+from typing import Any, Iterator, List, Tuple, Union
+
+
+class ResultView:
+    """ResultView gives read-only attribute access to a decoded GraphQL object,
+    like the namedtuples returned by `dcso.portal.APIClient.execute_graphql`:
+
+        result = apic.execute_graphql(query, lazy=True)
+        print(result.alerts.edges[0].node.id)
+
+    Unlike namedtuples, nothing is converted up front: views of nested objects
+    and lists are created when they are accessed, and the decoded data is not
+    changed. This keeps large responses cheap when only a few fields are read.
+
+    Fields can also be accessed by key, which is useful for names which are not
+    valid attribute names, such as `result['__typename']`. Use `_asdict` to get
+    the underlying data.
+    """
+
+    __slots__ = ('_name', '_data')
+
+    def __init__(self, data: dict, name: str = 'data'):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_data', data)
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith('__') or name in ResultView.__slots__:
+            raise AttributeError(name)
+        try:
+            return view(self._data[name], name)
+        except KeyError:
+            raise AttributeError(f"'{self._name}' object has no attribute '{name}'")
+
+    def __getitem__(self, key: Union[str, int]) -> Any:
+        if isinstance(key, int):
+            key = list(self._data)[key]
+        return view(self._data[key], key)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"'{self._name}' object is read-only")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"'{self._name}' object is read-only")
+
+    def __iter__(self) -> Iterator[Any]:
+        for key, value in self._data.items():
+            yield view(value, key)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._data
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, ResultView):
+            return self._data == other._data
+        return NotImplemented
+
+    __hash__ = None
+
+    def __reduce__(self) -> tuple:
+        return ResultView, (self._data, self._name)
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f'{key}={value!r}' for key, value in zip(self._data, self))
+        return f'{self._name}({fields})'
+
+    def __dir__(self) -> List[str]:
+        return sorted(set(dir(type(self))) | {key for key in self._data if key.isidentifier()})
+
+    @property
+    def _fields(self) -> Tuple[str, ...]:
+        return tuple(self._data)
+
+    def _asdict(self) -> dict:
+        """Returns the underlying decoded data. It must not be changed."""
+        return self._data
+
+
+class ListView(Sequence):
+    """ListView gives read-only access to a decoded GraphQL list, creating views
+    of its objects when they are accessed. See `ResultView`."""
+
+    __slots__ = ('_name', '_items')
+
+    def __init__(self, items: list, name: str):
+        self._name: str = name
+        self._items: list = items
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return ListView(self._items[index], self._name)
+        return view(self._items[index], self._name)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[Any]:
+        name = self._name
+        for item in self._items:
+            yield view(item, name)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, ListView):
+            return self._items == other._items
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+def view(value: Any, name: str = 'data') -> Any:
+    """Returns a `ResultView` of `value` when it is an object, a `ListView` when
+    it is a list, otherwise `value` itself. The `name` is the key of the value."""
+    if isinstance(value, dict):
+        return ResultView(value, name)
+    if isinstance(value, list):
+        return ListView(value, name)
+    return value
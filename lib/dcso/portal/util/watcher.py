@@ -0,0 +1,223 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+Following new items of a GraphQL connection, such as alerts, by polling the
+API only for what was added since the previous poll.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Hashable, Iterator, List, Optional, Tuple, Union
+
+from ..abstracts import APIAbstract
+from ..exceptions import PortalAPIRequest
+from .graphql import GraphQLRequest, graphql_data_to_namedtuple
+from .pagination import DEFAULT_PAGE_SIZE, connection_page
+from .temporal import decode_utc_iso8601
+from .timeout import Timeout
+
+DEFAULT_MIN_INTERVAL = 1.0
+"""Default minimum number of seconds between polls."""
+
+DEFAULT_MAX_INTERVAL = 60.0
+"""Default maximum number of seconds between polls."""
+
+DEFAULT_SEEN_SIZE = 10000
+"""Default number of identifiers of recent items remembered for deduplication."""
+
+_EMPTY_BACKOFF = 2.0  # factor of the interval after a poll without new items
+_RATE_SMOOTHING = 0.5  # weight of the latest observed arrival rate
+
+
+class Watcher:
+    """Watcher polls the connection found using `connection_path` within the
+    response of `query`, and returns only the nodes which were added since the
+    previous poll.
+
+    What is new is tracked using a high-water mark. By default, this is the
+    latest timestamp found in the `since_field` of the nodes, passed to the
+    query as the variable named `since_variable`. The query must return the
+    nodes of which the timestamp is equal or later:
+
+        query ($first: Int, $cursor: Cursor, $since: DateTime) {
+            alerts(first: $first, after: $cursor, filter: {occurredSince: $since}) {
+                edges { node { id occurredOn } }
+                pageInfo { hasNextPage endCursor }
+            }
+        }
+
+    When `since_field` is None, the mark is the end cursor of the last page
+    instead, and the query is continued from it. The initial mark is `since`,
+    a timestamp or cursor; when None, the first poll returns all nodes.
+
+    Each poll requests all pages, `page_size` nodes at a time, using the cursor
+    and page size variables like `dcso.portal.APIClient.paginate`. Nodes found
+    again, for example because they share the timestamp of the mark, are
+    skipped using their `id_field`.
+
+    Polls are spaced according to the rate at which new nodes arrive, between
+    `min_interval` and `max_interval` seconds. After polls without new nodes,
+    the interval grows; when a poll returned at least a full page, the next one
+    is done after `min_interval`.
+
+    Use `dcso.portal.APIClient.watch` instead of creating Watcher directly.
+    """
+
+    def __init__(self, api: APIAbstract, query: str, connection_path: str,
+                 since: Union[datetime, str, None] = None,
+                 since_field: Optional[str] = 'occurredOn',
+                 since_variable: str = 'since',
+                 id_field: str = 'id',
+                 page_size: int = DEFAULT_PAGE_SIZE,
+                 variables: Optional[dict] = None,
+                 fragments: Optional[List[str]] = None,
+                 cursor_variable: str = 'cursor',
+                 size_variable: str = 'first',
+                 min_interval: float = DEFAULT_MIN_INTERVAL,
+                 max_interval: float = DEFAULT_MAX_INTERVAL,
+                 timeout: Union[Timeout, float, None] = None):
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError("intervals must be positive, and min_interval at most max_interval")
+
+        self._api: APIAbstract = api
+        self.query: str = query
+        self.path: List[str] = connection_path.split('.')
+        self.mark: Union[datetime, str, None] = since
+        self.since_field: Optional[str] = since_field
+        self.since_variable: str = since_variable
+        self.id_field: str = id_field
+        self.page_size: int = page_size
+        self.variables: dict = dict(variables or {})
+        self.fragments: Optional[List[str]] = fragments
+        self.cursor_variable: str = cursor_variable
+        self.size_variable: str = size_variable
+        self.min_interval: float = min_interval
+        self.max_interval: float = max_interval
+        self.timeout: Union[Timeout, float, None] = timeout
+
+        self.interval: float = min_interval
+        self.rate: Optional[float] = None
+        self.polls: int = 0
+        self.empty_polls: int = 0
+
+        self._seen: 'OrderedDict[Hashable, None]' = OrderedDict()
+        self._seen_size: int = DEFAULT_SEEN_SIZE
+        self._last_poll: Optional[float] = None
+        self._stop = threading.Event()
+
+    def __iter__(self) -> Iterator[Any]:
+        """Yields new nodes, as namedtuples called 'node', as they arrive, until
+        `stop` is called."""
+        while not self._stop.is_set():
+            for node in self.poll():
+                yield graphql_data_to_namedtuple(node, 'node')
+            self._stop.wait(self.interval)
+
+    def stop(self) -> None:
+        """Stops iteration once the current poll is done."""
+        self._stop.set()
+
+    def poll(self) -> List[dict]:
+        """Requests the nodes added since the previous poll, and returns them as
+        dictionaries. The high-water mark and poll interval are updated.
+
+        The mark, and the nodes remembered for deduplication, are only updated once
+        all pages were received. When a request fails, the exception is raised and
+        the next poll starts again from the previous mark, so no nodes are lost.
+        """
+        started = time.monotonic()
+        nodes, end_cursor = self._fetch()
+
+        new = []
+        keys = {}
+        mark = end_cursor if self.since_field is None and end_cursor is not None else self.mark
+        for node in nodes:
+            key = node.get(self.id_field) if isinstance(node, dict) else None
+            if key is not None:
+                if key in self._seen or key in keys:
+                    continue
+                keys[key] = None
+            new.append(node)
+
+            if self.since_field is not None:
+                value = _timestamp(node.get(self.since_field))
+                if value is not None and (mark is None or value > _timestamp(mark)):
+                    mark = value
+
+        self.mark = mark
+        for key in keys:
+            self._remember(key)
+        self.polls += 1
+        self._adapt(len(new), started)
+        return new
+
+    def _fetch(self) -> Tuple[List[dict], Optional[str]]:
+        """Requests all pages, and returns their nodes and the last end cursor."""
+        variables = dict(self.variables)
+        variables[self.size_variable] = self.page_size
+        if self.since_field is not None:
+            variables[self.since_variable] = _timestamp(self.mark)
+            cursor = None
+        else:
+            cursor = self.mark
+
+        nodes = []
+        last_cursor = None
+        while True:
+            variables[self.cursor_variable] = cursor
+            # not using execute_graphql_dict: polls must not be answered from the cache
+            request = GraphQLRequest(query=self.query, api_url=self._api.api_url, variables=variables,
+                                     fragments=self.fragments, token=self._api.token,
+                                     transport=self._api.transport, timeout=Timeout.from_value(self.timeout),
+                                     persisted=getattr(self._api, 'persisted_queries', None),
+                                     datetime_fields=getattr(self._api, 'datetime_fields', None),
+                                     schema=getattr(self._api, 'schema', None))
+            page, page_info = connection_page(request.execute_dict().get('data'), self.path)
+            nodes.extend(page)
+
+            end_cursor = page_info.get('endCursor')
+            if end_cursor is not None:
+                last_cursor = end_cursor
+            if not page_info.get('hasNextPage') or end_cursor is None or end_cursor == cursor:
+                return nodes, last_cursor
+            cursor = end_cursor
+
+    def _remember(self, key: Hashable) -> None:
+        self._seen[key] = None
+        if len(self._seen) > self._seen_size:
+            self._seen.popitem(last=False)
+
+    def _adapt(self, count: int, started: float) -> None:
+        """Sets the interval until the next poll using the number of new nodes
+        `count`, returned by the poll started at `started`."""
+        elapsed = started - self._last_poll if self._last_poll is not None else None
+        self._last_poll = started
+
+        if count == 0:
+            self.empty_polls += 1
+            interval = self.interval * _EMPTY_BACKOFF
+        elif count >= self.page_size:
+            # more are likely waiting; catch up
+            interval = self.min_interval
+        else:
+            if elapsed:
+                observed = count / elapsed
+                if self.rate is None:
+                    self.rate = observed
+                else:
+                    self.rate = _RATE_SMOOTHING * observed + (1 - _RATE_SMOOTHING) * self.rate
+            # poll about as often as new nodes arrive
+            interval = 1 / self.rate if self.rate else self.interval
+
+        self.interval = min(self.max_interval, max(self.min_interval, interval))
+
+
+def _timestamp(value: Any) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return decode_utc_iso8601(value)
+    except ValueError:
+        raise PortalAPIRequest(f"unusable timestamp {value!r}")
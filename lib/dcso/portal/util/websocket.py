@@ -0,0 +1,319 @@
+# Copyright (c) 2021, DCSO GmbH
+
+"""
+Minimal WebSocket client (RFC 6455), sufficient for exchanging text messages
+with the DCSO Portal API.
+"""
+
+import base64
+import hashlib
+import os
+import socket
+import ssl
+import struct
+from typing import List, Optional, Tuple, Union
+from urllib.parse import ParseResult, urlparse
+
+from ..exceptions import PortalAPIRequest, PortalConnection, PortalTimeout
+from .connection import create_ssl_context
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+CLOSE_NORMAL = 1000
+
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+"""Maximum size, in bytes, of a received message."""
+
+_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+_RECV_SIZE = 64 * 1024
+_MAX_HEADER_SIZE = 64 * 1024
+
+
+class WebSocketClosed(PortalConnection):
+    """Exception raised when the WebSocket connection was closed, holding the
+    close `code` and `reason` sent by the peer, if any."""
+
+    def __init__(self, code: Optional[int] = None, reason: str = ''):
+        super().__init__(f"WebSocket closed ({code}): {reason}" if code else "WebSocket closed")
+        self.code: Optional[int] = code
+        self.reason: str = reason
+
+
+def accept_key(key: str) -> str:
+    """Returns the value of the Sec-WebSocket-Accept header answering `key`."""
+    return base64.b64encode(hashlib.sha1((key + _GUID).encode('ascii')).digest()).decode('ascii')
+
+
+def encode_frame(opcode: int, payload: bytes, mask: bool = True, fin: bool = True) -> bytes:
+    """Returns the frame holding `payload`. Frames sent by clients are masked."""
+    length = len(payload)
+    header = bytearray([(0x80 if fin else 0) | opcode])
+    mask_bit = 0x80 if mask else 0
+    if length < 126:
+        header.append(mask_bit | length)
+    elif length < 1 << 16:
+        header.append(mask_bit | 126)
+        header += struct.pack('!H', length)
+    else:
+        header.append(mask_bit | 127)
+        header += struct.pack('!Q', length)
+
+    if not mask:
+        return bytes(header) + payload
+
+    key = os.urandom(4)
+    return bytes(header) + key + _apply_mask(key, payload)
+
+
+def decode_frame(buffer: Union[bytes, bytearray]) -> Optional[Tuple[bool, int, bytes, int]]:
+    """Decodes the frame at the start of `buffer`, and returns whether it is final,
+    its opcode, its (unmasked) payload, and the number of bytes it took. Returns
+    None when the buffer does not hold a complete frame yet."""
+    if len(buffer) < 2:
+        return None
+
+    fin, opcode = bool(buffer[0] & 0x80), buffer[0] & 0x0F
+    masked, length = bool(buffer[1] & 0x80), buffer[1] & 0x7F
+    pos = 2
+    if length == 126:
+        if len(buffer) < 4:
+            return None
+        length, = struct.unpack_from('!H', buffer, 2)
+        pos = 4
+    elif length == 127:
+        if len(buffer) < 10:
+            return None
+        length, = struct.unpack_from('!Q', buffer, 2)
+        pos = 10
+
+    if length > MAX_MESSAGE_SIZE:
+        raise PortalAPIRequest(f"WebSocket frame too large ({length} bytes)")
+
+    key = b''
+    if masked:
+        if len(buffer) < pos + 4:
+            return None
+        key = bytes(buffer[pos:pos + 4])
+        pos += 4
+
+    if len(buffer) < pos + length:
+        return None
+
+    payload = bytes(buffer[pos:pos + length])
+    if masked:
+        payload = _apply_mask(key, payload)
+    return fin, opcode, payload, pos + length
+
+
+def _apply_mask(key: bytes, payload: bytes) -> bytes:
+    if not payload:
+        return payload
+    repeated = (key * (len(payload) // 4 + 1))[:len(payload)]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(len(payload), 'big')
+
+
+class WebSocket:
+    """WebSocket is a client connection exchanging text messages with a
+    WebSocket server.
+
+    Use `connect` to open the connection with the server at `url`, which uses
+    the scheme ws, wss, http, or https, negotiating one of `subprotocols`.
+    Secure connections use `ssl_context`, which defaults to the context
+    returned by `dcso.portal.util.connection.create_ssl_context`. Pings of the server are answered
+    automatically.
+    """
+
+    def __init__(self, url: Union[ParseResult, str],
+                 subprotocols: Optional[List[str]] = None,
+                 headers: Optional[dict] = None,
+                 ssl_context: Optional[ssl.SSLContext] = None):
+        self.url: ParseResult = url if isinstance(url, ParseResult) else urlparse(url)
+        if self.url.scheme not in ('ws', 'wss', 'http', 'https'):
+            raise PortalAPIRequest(f"unsupported WebSocket URL scheme '{self.url.scheme}'")
+
+        self.subprotocols: List[str] = subprotocols or []
+        self.headers: dict = headers or {}
+        self.ssl_context: Optional[ssl.SSLContext] = ssl_context
+        self.subprotocol: Optional[str] = None
+
+        self._sock: Optional[socket.socket] = None
+        self._buffer: bytearray = bytearray()
+        self._fragments: List[bytes] = []
+        self._closed: bool = False
+
+    @property
+    def secure(self) -> bool:
+        return self.url.scheme in ('wss', 'https')
+
+    def connect(self, timeout: Optional[float] = None) -> None:
+        """Connects with the server and does the opening handshake, within
+        `timeout` seconds."""
+        host = self.url.hostname
+        port = self.url.port or (443 if self.secure else 80)
+        try:
+            sock = socket.create_connection((host, port), timeout=timeout)
+            if self.secure:
+                sock = (self.ssl_context or create_ssl_context()).wrap_socket(sock, server_hostname=host)
+            self._sock = sock
+            self._handshake(timeout)
+        except socket.timeout:
+            self.abort()
+            raise PortalTimeout("timed out connecting WebSocket")
+        except (OSError, ssl.SSLError) as exc:
+            self.abort()
+            raise PortalConnection(f"failed connecting WebSocket: {exc}")
+        except PortalConnection:
+            self.abort()
+            raise
+
+    def _handshake(self, timeout: Optional[float]) -> None:
+        key = base64.b64encode(os.urandom(16)).decode('ascii')
+        path = self.url.path or '/'
+        if self.url.query:
+            path += '?' + self.url.query
+
+        lines = [
+            f'GET {path} HTTP/1.1',
+            f'Host: {self.url.netloc}',
+            'Upgrade: websocket',
+            'Connection: Upgrade',
+            f'Sec-WebSocket-Key: {key}',
+            'Sec-WebSocket-Version: 13',
+        ]
+        if self.subprotocols:
+            lines.append('Sec-WebSocket-Protocol: ' + ', '.join(self.subprotocols))
+        lines += [f'{name}: {value}' for name, value in self.headers.items()]
+        self._sock.sendall(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+        while b'\r\n\r\n' not in self._buffer:
+            if len(self._buffer) > _MAX_HEADER_SIZE:
+                raise PortalAPIRequest("WebSocket handshake response too large")
+            self._fill(timeout)
+
+        end = self._buffer.index(b'\r\n\r\n')
+        head = self._buffer[:end].decode('latin-1').split('\r\n')
+        del self._buffer[:end + 4]
+
+        status = head[0].split(' ', 2)
+        if len(status) < 2 or status[1] != '101':
+            raise PortalAPIRequest(f"WebSocket handshake failed: {head[0]}")
+
+        response_headers = {}
+        for line in head[1:]:
+            name, _, value = line.partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('sec-websocket-accept') != accept_key(key):
+            raise PortalAPIRequest("WebSocket handshake failed: invalid Sec-WebSocket-Accept")
+
+        self.subprotocol = response_headers.get('sec-websocket-protocol')
+        if self.subprotocols and self.subprotocol not in self.subprotocols:
+            raise PortalAPIRequest(f"WebSocket server does not support {', '.join(self.subprotocols)}")
+
+    def send(self, message: str) -> None:
+        """Sends `message` as text message."""
+        self._send_frame(OP_TEXT, message.encode('utf-8'))
+
+    def ping(self, payload: bytes = b'') -> None:
+        self._send_frame(OP_PING, payload)
+
+    def recv(self, timeout: Optional[float] = None) -> str:
+        """Returns the next text message, waiting at most `timeout` seconds.
+
+        Raises `PortalTimeout` when no message arrived in time, and `WebSocketClosed`
+        when the connection was closed.
+        """
+        while True:
+            frame = decode_frame(self._buffer)
+            if frame is None:
+                self._fill(timeout)
+                continue
+
+            fin, opcode, payload, size = frame
+            del self._buffer[:size]
+
+            if opcode == OP_PING:
+                self._send_frame(OP_PONG, payload)
+            elif opcode == OP_PONG:
+                continue
+            elif opcode == OP_CLOSE:
+                code = struct.unpack('!H', payload[:2])[0] if len(payload) >= 2 else None
+                reason = payload[2:].decode('utf-8', 'replace')
+                self._close_handshake(code)
+                raise WebSocketClosed(code, reason)
+            elif opcode in (OP_TEXT, OP_BINARY, OP_CONTINUATION):
+                self._fragments.append(payload)
+                if sum(len(f) for f in self._fragments) > MAX_MESSAGE_SIZE:
+                    raise PortalAPIRequest("WebSocket message too large")
+                if fin:
+                    message, self._fragments = b''.join(self._fragments), []
+                    try:
+                        return message.decode('utf-8')
+                    except UnicodeDecodeError:
+                        raise PortalAPIRequest("WebSocket message is not valid UTF-8")
+            else:
+                raise PortalAPIRequest(f"unsupported WebSocket opcode {opcode}")
+
+    def close(self, code: int = CLOSE_NORMAL, reason: str = '') -> None:
+        """Sends the close frame, and closes the connection."""
+        if self._sock is not None and not self._closed:
+            try:
+                self._send_frame(OP_CLOSE, struct.pack('!H', code) + reason.encode('utf-8'))
+            except PortalConnection:
+                pass
+        self.abort()
+
+    def abort(self) -> None:
+        """Closes the connection without closing handshake. This can be called
+        from another thread, which interrupts `recv`."""
+        self._closed = True
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+    def _close_handshake(self, code: Optional[int]) -> None:
+        if not self._closed:
+            try:
+                self._send_frame(OP_CLOSE, struct.pack('!H', code or CLOSE_NORMAL))
+            except PortalConnection:
+                pass
+        self.abort()
+
+    def _send_frame(self, opcode: int, payload: bytes) -> None:
+        sock = self._sock
+        if sock is None or self._closed:
+            raise WebSocketClosed()
+        try:
+            sock.sendall(encode_frame(opcode, payload))
+        except OSError as exc:
+            self.abort()
+            raise PortalConnection(f"failed sending WebSocket message: {exc}")
+
+    def _fill(self, timeout: Optional[float] = None) -> None:
+        sock = self._sock
+        if sock is None:
+            raise WebSocketClosed()
+        try:
+            sock.settimeout(timeout)
+            data = sock.recv(_RECV_SIZE)
+        except socket.timeout:
+            raise PortalTimeout("timed out waiting for WebSocket message")
+        except OSError as exc:
+            aborted = self._closed
+            self.abort()
+            if aborted:
+                raise WebSocketClosed()
+            raise PortalConnection(f"failed receiving WebSocket message: {exc}")
+        if not data:
+            self.abort()
+            raise WebSocketClosed()
+        self._buffer += data